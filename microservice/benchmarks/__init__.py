@@ -0,0 +1,6 @@
+"""Offline benchmarks for the Issue Classifier Microservice.
+
+The benchmarks in this package run entirely in-process, i.e. neither RabbitMQ
+nor any Celery worker is required. They are to be run from the folder
+containing the pyproject.toml file, e.g. python -m benchmarks.vectorise_benchmark
+"""
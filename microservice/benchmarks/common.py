@@ -0,0 +1,126 @@
+"""Shared helpers for the offline benchmarks.
+
+This module provides the issue corpus used by the benchmarks as well as the
+vectoriser to benchmark against. The corpus consists of the issues bundled
+under issues/todo-add. If the trained vectoriser cannot be loaded (e.g. since
+vectorizer.vz is not part of the checkout), a TF-IDF vectoriser with the same
+(1,2)-gram set up is fitted on the bundled corpus instead.
+"""
+import logging
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+import numpy
+import ujson
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from microservice.models.models import IndexedIssue
+
+CORPUS_FOLDER: Path = Path(__file__).resolve().parent.parent / "issues" / "todo-add"
+
+
+def load_issue_corpus() -> List[str]:
+    """Load the bodies of all bundled issues.
+
+    Files which cannot be parsed are skipped, since some of the bundled files
+    are not valid JSON.
+
+    Returns:
+        List[str]: The bodies of all bundled issues.
+    """
+    issue_bodies: List[str] = []
+    for issue_file in sorted(CORPUS_FOLDER.glob("*.json")):
+        try:
+            entries = ujson.loads(issue_file.read_text(encoding="utf-8"))
+        except ValueError:
+            logging.warning("Skipping unparsable corpus file " + str(issue_file))
+            continue
+        issue_bodies.extend(
+            entry["text"] for entry in entries if isinstance(entry.get("text"), str)
+        )
+
+    return issue_bodies
+
+
+def make_indexed_issues(issue_bodies: List[str], count: int) -> List[IndexedIssue]:
+    """Create a request of the given size from the corpus.
+
+    The corpus is cycled through if more issues are requested than it contains.
+
+    Args:
+        issue_bodies (List[str]): The corpus to draw the issue bodies from.
+        count (int): The number of issues of the request.
+
+    Returns:
+        List[IndexedIssue]: The indexed issues of the request.
+    """
+    return [
+        IndexedIssue(index=index, body=issue_bodies[index % len(issue_bodies)])
+        for index in range(count)
+    ]
+
+
+def get_benchmark_vectoriser(issue_bodies: List[str]) -> Any:
+    """Return the trained vectoriser or a stand-in fitted on the corpus.
+
+    Args:
+        issue_bodies (List[str]): The corpus used to fit the stand-in vectoriser.
+
+    Returns:
+        Any: The vectoriser to be benchmarked.
+    """
+    try:
+        from microservice.config.load_classifier import get_vectoriser
+
+        return get_vectoriser()
+    except Exception as exception:
+        logging.warning(
+            "Trained vectoriser unavailable ("
+            + str(exception)
+            + "). Fitting a TF-IDF (1,2)-gram vectoriser on the bundled corpus."
+        )
+        return TfidfVectorizer(ngram_range=(1, 2)).fit(issue_bodies)
+
+
+def measure(function: Callable[[], Any], repeats: int) -> List[float]:
+    """Call the given function repeatedly and measure each call.
+
+    Args:
+        function (Callable[[], Any]): The function to be measured.
+        repeats (int): How often the function is called.
+
+    Returns:
+        List[float]: The duration of each call in seconds.
+    """
+    durations: List[float] = []
+    for _ in range(repeats):
+        start = perf_counter()
+        function()
+        durations.append(perf_counter() - start)
+
+    return durations
+
+
+def summarise_durations(durations: List[float], issue_count: int) -> Dict[str, float]:
+    """Summarise the durations of repeated calls on the same number of issues.
+
+    Args:
+        durations (List[float]): The duration of each call in seconds.
+        issue_count (int): The number of issues processed by each call.
+
+    Returns:
+        Dict[str, float]: The throughput in issues per second over all calls,
+        along with the mean and the 50th, 95th and 99th percentile of the
+        latency of a call in milliseconds.
+    """
+    latencies_ms = numpy.asarray(durations) * 1000
+
+    return {
+        "calls": len(durations),
+        "issues_per_second": issue_count * len(durations) / (latencies_ms.sum() / 1000),
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(numpy.percentile(latencies_ms, 50)),
+        "p95_ms": float(numpy.percentile(latencies_ms, 95)),
+        "p99_ms": float(numpy.percentile(latencies_ms, 99)),
+    }
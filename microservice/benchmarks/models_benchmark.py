@@ -0,0 +1,136 @@
+"""Benchmark of the issue models against their former pydantic versions.
+
+Compares the hot-path operations on issues, i.e. parsing a classification
+request, creating VectorisedIssue instances, converting them into results and
+pickling them, between the __slots__ models in microservice/models/models.py and
+the pydantic models they replaced, which are defined below for reference.
+
+Both models are checked to accept and convert the same issues in
+tests/unit/test_models.py.
+
+Usage:
+    python -m benchmarks.models_benchmark [--issue-count 10000]
+"""
+import argparse
+import pickle
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+import ujson
+from pydantic import BaseModel
+from pydantic.tools import parse_raw_as
+
+from microservice.models.models import VectorisedIssue, parse_indexed_issues
+
+from benchmarks.common import load_issue_corpus, measure
+
+
+class PydanticIndexedIssue(BaseModel):
+    """The former pydantic version of IndexedIssue."""
+
+    index: Union[int, str]
+    body: str
+    labels: List[str] = []
+    request_id: Optional[str] = None
+    body_hash: Optional[str] = None
+
+    class Config:
+        """Configuration of the PydanticIndexedIssue class."""
+
+        json_loads = ujson.loads
+
+
+class PydanticVectorisedIssue(BaseModel):
+    """The former pydantic version of VectorisedIssue."""
+
+    index: Union[int, str]
+    body: Any
+    labels: List[str] = []
+    request_id: Optional[str] = None
+    body_hash: Optional[str] = None
+
+    class Config:
+        """Configuration of the PydanticVectorisedIssue class."""
+
+        json_loads = ujson.loads
+        arbitrary_types_allowed = True
+
+
+def main() -> None:
+    """Run the benchmark and print the throughput of each operation."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--issue-count", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=5)
+    arguments = parser.parse_args()
+
+    issue_bodies = load_issue_corpus()
+    message_body: bytes = ujson.dumps(
+        [
+            {"index": index, "body": issue_bodies[index % len(issue_bodies)]}
+            for index in range(arguments.issue_count)
+        ]
+    ).encode("utf-8")
+    pydantic_issues = parse_raw_as(List[PydanticIndexedIssue], message_body)
+    issues = parse_indexed_issues(message_body)
+    if [issue.dict() for issue in pydantic_issues] != [
+        issue.dict() for issue in issues
+    ]:
+        raise AssertionError("Parsed requests differ")
+
+    pydantic_vectorised_issues = [
+        PydanticVectorisedIssue(index=issue.index, body=None, labels=["bug"])
+        for issue in pydantic_issues
+    ]
+    vectorised_issues = [
+        VectorisedIssue(index=issue.index, body=None, labels=["bug"])
+        for issue in issues
+    ]
+    operations: List[Tuple[str, Callable[[], Any], Callable[[], Any]]] = [
+        (
+            "parse request",
+            lambda: parse_raw_as(List[PydanticIndexedIssue], message_body),
+            lambda: parse_indexed_issues(message_body),
+        ),
+        (
+            "create vectorised",
+            lambda: [
+                PydanticVectorisedIssue(
+                    index=issue.index, body=None, labels=list(issue.labels)
+                )
+                for issue in pydantic_issues
+            ],
+            lambda: [
+                VectorisedIssue(index=issue.index, body=None, labels=list(issue.labels))
+                for issue in issues
+            ],
+        ),
+        (
+            "convert to results",
+            lambda: [
+                issue.dict(exclude={"body", "request_id", "body_hash"})
+                for issue in pydantic_vectorised_issues
+            ],
+            lambda: [issue.to_result() for issue in vectorised_issues],
+        ),
+        (
+            "pickle round trip",
+            lambda: pickle.loads(pickle.dumps(pydantic_vectorised_issues)),
+            lambda: pickle.loads(pickle.dumps(vectorised_issues)),
+        ),
+    ]
+
+    print("operation          | pydantic issues/s | slots issues/s | speed-up")
+    for name, pydantic_operation, slots_operation in operations:
+        pydantic_seconds = min(measure(pydantic_operation, arguments.repeats))
+        slots_seconds = min(measure(slots_operation, arguments.repeats))
+        print(
+            "{:<18} | {:>17.0f} | {:>14.0f} | {:>7.2f}x".format(
+                name,
+                arguments.issue_count / pydantic_seconds,
+                arguments.issue_count / slots_seconds,
+                pydantic_seconds / slots_seconds,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""Benchmark of every stage of the classification pipeline.
+
+Runs the stages a request passes through entirely in-process, i.e. without
+RabbitMQ or any Celery worker, and reports the throughput along with the 50th,
+95th and 99th percentile of the latency of each stage at several batch sizes:
+
+- deserialise: Parsing a classification request (see parse_indexed_issues).
+- vectorise: Transforming the issue bodies as done by vectorise_issues (see
+  vectorise_issue_bodies), without the vectorisation cache.
+- classify_node_<index>: ClassifyTreeNode.classify of each node of the
+  classifier tree, with all issues of the batch passed to every node.
+- serialise_results: Sending the results back as done by the leaf nodes (see
+  send_results_to_output), with a result publisher which serialises the
+  results but does not send them anywhere.
+- pipeline: All of the above for a single request, i.e. what the fused pipeline
+  does for a request, minus the broker.
+
+If the trained vectoriser and classifiers cannot be loaded, the vectoriser is
+fitted on the bundled corpus (see get_benchmark_vectoriser), and every node of
+the tree uses a stand-in ensemble with the members of the trained ones, fitted
+on whether the bundled issues carry the label of the node.
+
+The results can be written to a JSON file with --output, and compared with
+those of an earlier run with --baseline.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark [--batch-sizes 1 10 100 1000]
+    [--output results.json] [--baseline previous_results.json]
+"""
+import argparse
+import logging
+import platform
+from datetime import datetime, timezone
+from os import getpid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import sklearn
+import ujson
+from microservice.classifier_celery import helper_functions
+from microservice.classifier_celery.helper_functions import (
+    send_results_to_output,
+    vectorise_issue_bodies,
+)
+from microservice.classifier_celery.result_publisher import ResultPublisher
+from microservice.config.classifier_config import Configuration
+from microservice.models.models import IndexedIssue, parse_indexed_issues
+from microservice.tree_logic import classifier_tree
+from microservice.tree_logic.classifier_tree import ClassifyTree
+from pika.spec import BasicProperties
+from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.svm import SVC
+
+from benchmarks.common import (
+    CORPUS_FOLDER,
+    get_benchmark_vectoriser,
+    load_issue_corpus,
+    make_indexed_issues,
+    measure,
+    summarise_durations,
+)
+
+# Names of the labels of the classifier tree as used in the bundled corpus.
+_CORPUS_LABEL_NAMES: Dict[str, str] = {"docu": "documentation"}
+
+
+class OfflineResultPublisher(ResultPublisher):
+    """Result publisher which serialises results without sending them."""
+
+    def __init__(self) -> None:
+        """Initialise the publisher without coalescing."""
+        super().__init__(
+            host="localhost",
+            exchange_name="benchmark",
+            exchange_type="direct",
+            routing_key="benchmark",
+        )
+
+    def _publish_message(
+        self, message_body: bytes, properties: Optional[BasicProperties] = None
+    ) -> None:
+        self.statistics.record_publish(len(message_body), 0.0)
+
+
+def load_labelled_corpus() -> List[Tuple[str, List[str]]]:
+    """Load the bodies of the bundled issues along with their labels.
+
+    Returns:
+        List[Tuple[str, List[str]]]: The issue bodies and their labels.
+    """
+    labelled_issues: List[Tuple[str, List[str]]] = []
+    for issue_file in sorted(CORPUS_FOLDER.glob("*.json")):
+        try:
+            entries = ujson.loads(issue_file.read_text(encoding="utf-8"))
+        except ValueError:
+            continue
+        labelled_issues.extend(
+            (entry["text"], [label for label in entry.get("labels") or [] if label])
+            for entry in entries
+            if isinstance(entry.get("text"), str)
+        )
+
+    return labelled_issues
+
+
+def fit_stand_in_classifier(
+    labels: List[str],
+    vectoriser: Any,
+    labelled_issues: List[Tuple[str, List[str]]],
+    training_size: int,
+) -> Any:
+    """Fit a stand-in for the trained classifier of a tree node.
+
+    Issues carrying the first label of the node (e.g. api for api_bug) are
+    class 0, which the tree forwards to the left child, all others class 1.
+
+    Args:
+        labels (List[str]): The labels of the node, as passed to get_classifier.
+        vectoriser (Any): The vectoriser used to transform the training issues.
+        labelled_issues (List[Tuple[str, List[str]]]): The labelled corpus.
+        training_size (int): The number of issues to fit the stand-in on.
+
+    Returns:
+        Any: The fitted hard-voting ensemble.
+    """
+    label: str = labels[0].split("_")[0]
+    corpus_label: str = _CORPUS_LABEL_NAMES.get(label, label)
+    training_issues = labelled_issues[:: max(1, len(labelled_issues) // training_size)]
+    training_issues = training_issues[:training_size]
+
+    return VotingClassifier(
+        [
+            ("naive_bayes", MultinomialNB()),
+            ("sgd", SGDClassifier(random_state=2020)),
+            ("svc", SVC(kernel="sigmoid")),
+            (
+                "random_forest",
+                RandomForestClassifier(n_estimators=200, random_state=2020),
+            ),
+            ("logistic_regression", LogisticRegression()),
+        ],
+        voting="hard",
+    ).fit(
+        vectoriser.transform([issue_body for issue_body, _ in training_issues]),
+        [int(corpus_label not in issue_labels) for _, issue_labels in training_issues],
+    )
+
+
+def load_benchmark_models(
+    issue_bodies: List[str], training_size: int
+) -> Tuple[Any, ClassifyTree, bool]:
+    """Load the trained vectoriser and classifier tree or their stand-ins.
+
+    Args:
+        issue_bodies (List[str]): The corpus used to fit the stand-in vectoriser.
+        training_size (int): The number of issues to fit each stand-in
+        classifier on.
+
+    Returns:
+        Tuple[Any, ClassifyTree, bool]: The vectoriser, the classifier tree and
+        whether they are stand-ins.
+    """
+    label_classes: List[str] = Configuration().get_value_from_config("labelClasses")
+    try:
+        from microservice.config.load_classifier import get_vectoriser
+
+        return get_vectoriser(), ClassifyTree(label_classes), False
+    except Exception as exception:
+        logging.warning(
+            "Trained models unavailable ("
+            + str(exception)
+            + "). Fitting stand-in models on the bundled corpus."
+        )
+
+    vectoriser = get_benchmark_vectoriser(issue_bodies)
+    labelled_issues = load_labelled_corpus()
+    trained_get_classifier: Callable[..., Any] = classifier_tree.get_classifier
+    classifier_tree.get_classifier = lambda labels: fit_stand_in_classifier(
+        labels, vectoriser, labelled_issues, training_size
+    )
+    try:
+        return vectoriser, ClassifyTree(label_classes), True
+    finally:
+        classifier_tree.get_classifier = trained_get_classifier
+
+
+def use_offline_result_publisher() -> OfflineResultPublisher:
+    """Make send_results_to_output use an OfflineResultPublisher.
+
+    Returns:
+        OfflineResultPublisher: The publisher used from now on.
+    """
+    result_publisher = OfflineResultPublisher()
+    helper_functions._result_publisher = result_publisher
+    helper_functions._result_publisher_pid = getpid()
+
+    return result_publisher
+
+
+def get_stages(
+    vectoriser: Any, classify_tree: ClassifyTree, issues: List[IndexedIssue]
+) -> List[Tuple[str, Dict[str, Any], Callable[[], Any]]]:
+    """Return the stages to be measured for a batch of issues.
+
+    Args:
+        vectoriser (Any): The vectoriser.
+        classify_tree (ClassifyTree): The classifier tree.
+        issues (List[IndexedIssue]): The batch of issues.
+
+    Returns:
+        List[Tuple[str, Dict[str, Any], Callable[[], Any]]]: The name of each
+        stage, details to be reported along with it, and the function running
+        the stage once.
+    """
+    message_body: bytes = ujson.dumps(
+        [{"index": issue.index, "body": issue.body} for issue in issues]
+    ).encode("utf-8")
+    vectorised_issues = vectorise_issue_bodies(vectoriser, issues)
+    results = classify_tree.classify(vectorise_issue_bodies(vectoriser, issues))
+
+    def run_pipeline() -> None:
+        send_results_to_output(
+            classify_tree.classify(
+                vectorise_issue_bodies(vectoriser, parse_indexed_issues(message_body))
+            )
+        )
+
+    stages: List[Tuple[str, Dict[str, Any], Callable[[], Any]]] = [
+        ("deserialise", {}, lambda: parse_indexed_issues(message_body)),
+        ("vectorise", {}, lambda: vectorise_issue_bodies(vectoriser, issues)),
+    ]
+    for node_index in range(1, classify_tree.get_node_count() + 1):
+        node_entry = classify_tree.get_node_entry(node_index)
+        stages.append(
+            (
+                "classify_node_" + str(node_index),
+                {"is_leaf_node": node_entry.is_leaf_node},
+                lambda node=node_entry.node: node.classify(vectorised_issues),
+            )
+        )
+    stages.extend(
+        [
+            ("serialise_results", {}, lambda: send_results_to_output(results)),
+            ("pipeline", {}, run_pipeline),
+        ]
+    )
+
+    return stages
+
+
+def get_metadata(
+    arguments: argparse.Namespace, corpus_size: int, uses_stand_ins: bool
+) -> Dict[str, Any]:
+    """Return the details of the run to be stored along with its results.
+
+    Args:
+        arguments (argparse.Namespace): The parsed arguments.
+        corpus_size (int): The number of issues in the corpus.
+        uses_stand_ins (bool): Whether stand-in models are benchmarked.
+
+    Returns:
+        Dict[str, Any]: The details by name.
+    """
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scikit_learn": sklearn.__version__,
+        "batch_sizes": arguments.batch_sizes,
+        "repeats": arguments.repeats,
+        "corpus_size": corpus_size,
+        "stand_in_models": uses_stand_ins,
+    }
+
+
+def load_baseline(baseline_path: Optional[Path]) -> Dict[Tuple[str, int], float]:
+    """Load the throughput of each stage and batch size of an earlier run.
+
+    Args:
+        baseline_path (Optional[Path]): The JSON file written by the earlier run.
+
+    Returns:
+        Dict[Tuple[str, int], float]: The throughput by stage and batch size.
+        Empty if no file is given.
+    """
+    if baseline_path is None:
+        return {}
+
+    baseline = ujson.loads(baseline_path.read_text(encoding="utf-8"))
+
+    return {
+        (result["stage"], result["batch_size"]): result["issues_per_second"]
+        for result in baseline["results"]
+    }
+
+
+def main() -> None:
+    """Run the benchmark, print its results and write them to a JSON file."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000]
+    )
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--training-size", type=int, default=1500)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    arguments = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    issue_bodies = load_issue_corpus()
+    vectoriser, classify_tree, uses_stand_ins = load_benchmark_models(
+        issue_bodies, arguments.training_size
+    )
+    use_offline_result_publisher()
+    baseline = load_baseline(arguments.baseline)
+
+    results: List[Dict[str, Any]] = []
+    print(
+        "stage               | batch size |  issues/s |  p50 ms |  p95 ms |  p99 ms"
+        + (" | vs baseline" if baseline else "")
+    )
+    for batch_size in arguments.batch_sizes:
+        issues = make_indexed_issues(issue_bodies, batch_size)
+        for stage, details, function in get_stages(vectoriser, classify_tree, issues):
+            # The first call is not measured, so that lazily initialised
+            # state does not distort the latencies.
+            function()
+            result: Dict[str, Any] = {
+                "stage": stage,
+                "batch_size": batch_size,
+                **details,
+                **summarise_durations(measure(function, arguments.repeats), batch_size),
+            }
+            results.append(result)
+
+            line: str = (
+                "{:<19} | {:>10} | {:>9.1f} | {:>7.2f} | {:>7.2f} | {:>7.2f}".format(
+                    stage,
+                    batch_size,
+                    result["issues_per_second"],
+                    result["p50_ms"],
+                    result["p95_ms"],
+                    result["p99_ms"],
+                )
+            )
+            baseline_throughput: Optional[float] = baseline.get((stage, batch_size))
+            if baseline_throughput:
+                line += " | {:>10.2f}x".format(
+                    result["issues_per_second"] / baseline_throughput
+                )
+            print(line)
+
+    if arguments.output is not None:
+        arguments.output.write_text(
+            ujson.dumps(
+                {
+                    "metadata": get_metadata(
+                        arguments, len(issue_bodies), uses_stand_ins
+                    ),
+                    "results": results,
+                },
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        print("Results written to " + str(arguments.output))
+
+
+if __name__ == "__main__":
+    main()
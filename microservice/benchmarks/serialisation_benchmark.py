@@ -0,0 +1,76 @@
+"""Benchmark of the pickle and issue_batch serialisers for classify_issues messages.
+
+Serialises the body of a classify_issues message, i.e. the (args, kwargs, embed)
+tuple, with both serialisers registered with kombu, and reports the message
+size as well as the serialisation and deserialisation throughput.
+
+Usage:
+    python -m benchmarks.serialisation_benchmark [--chunk-sizes 1 10 100 1000]
+"""
+import argparse
+
+from kombu.serialization import dumps, loads
+
+from microservice.classifier_celery.helper_functions import vectorise_issue_bodies
+from microservice.classifier_celery.serialisation import (
+    ISSUE_BATCH_SERIALISER_NAME,
+    register_issue_batch_serialiser,
+)
+
+from benchmarks.common import (
+    get_benchmark_vectoriser,
+    load_issue_corpus,
+    make_indexed_issues,
+    measure,
+)
+
+
+def main() -> None:
+    """Run the benchmark and print size and throughput for each chunk size."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--chunk-sizes", type=int, nargs="+", default=[1, 10, 100, 1000]
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    arguments = parser.parse_args()
+
+    register_issue_batch_serialiser()
+    issue_bodies = load_issue_corpus()
+    vectoriser = get_benchmark_vectoriser(issue_bodies)
+
+    print("chunk size | serialiser  | bytes/issue | dumps issues/s | loads issues/s")
+    for chunk_size in arguments.chunk_sizes:
+        vectorised_issues = vectorise_issue_bodies(
+            vectoriser, make_indexed_issues(issue_bodies, chunk_size)
+        )
+        message = ((vectorised_issues, 2), {}, {"callbacks": None, "errbacks": None})
+
+        for serialiser in ["pickle", ISSUE_BATCH_SERIALISER_NAME]:
+            content_type, content_encoding, payload = dumps(message, serialiser)
+            dumps_seconds = min(
+                measure(lambda: dumps(message, serialiser), arguments.repeats)
+            )
+            loads_seconds = min(
+                measure(
+                    lambda: loads(
+                        payload,
+                        content_type,
+                        content_encoding,
+                        accept=[content_type],
+                    ),
+                    arguments.repeats,
+                )
+            )
+            print(
+                "{:>10} | {:<11} | {:>11.1f} | {:>14.1f} | {:>14.1f}".format(
+                    chunk_size,
+                    serialiser,
+                    len(payload) / chunk_size,
+                    chunk_size / dumps_seconds,
+                    chunk_size / loads_seconds,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark of per-issue versus batched vectorisation.
+
+Compares the throughput of transforming every issue with its own
+vectoriser.transform call, as vectorise_issues used to do, with transforming
+the whole request at once using vectorise_issue_bodies. In addition, the
+throughput of vectorise_issue_bodies is measured with a warm in-process
+vectorisation cache, i.e. for a request which has been sent before.
+
+Usage:
+    python -m benchmarks.vectorise_benchmark [--batch-sizes 1 10 100 2000]
+"""
+import argparse
+from typing import Any, List
+
+from microservice.caching.vectorisation_cache import VectorisationCache
+from microservice.classifier_celery.helper_functions import vectorise_issue_bodies
+from microservice.models.models import IndexedIssue, VectorisedIssue
+
+from benchmarks.common import (
+    get_benchmark_vectoriser,
+    load_issue_corpus,
+    make_indexed_issues,
+    measure,
+)
+
+
+def vectorise_per_issue(
+    vectoriser: Any, issues: List[IndexedIssue]
+) -> List[VectorisedIssue]:
+    """Transform the issues one at a time (the previous behaviour).
+
+    Args:
+        vectoriser (Any): The fitted vectoriser.
+        issues (List[IndexedIssue]): The issues to be transformed.
+
+    Returns:
+        List[VectorisedIssue]: The transformed issues.
+    """
+    return [
+        VectorisedIssue(
+            body=vectoriser.transform([issue.body]),
+            index=issue.index,
+            labels=issue.labels,
+        )
+        for issue in issues
+    ]
+
+
+def main() -> None:
+    """Run the benchmark and print issues/sec for each batch size."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 2000]
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    arguments = parser.parse_args()
+
+    issue_bodies = load_issue_corpus()
+    vectoriser = get_benchmark_vectoriser(issue_bodies)
+
+    print(
+        "batch size | per-issue issues/s | batched issues/s | speed-up"
+        " | cached issues/s"
+    )
+    for batch_size in arguments.batch_sizes:
+        issues = make_indexed_issues(issue_bodies, batch_size)
+        per_issue = min(
+            measure(lambda: vectorise_per_issue(vectoriser, issues), arguments.repeats)
+        )
+        batched = min(
+            measure(
+                lambda: vectorise_issue_bodies(vectoriser, issues), arguments.repeats
+            )
+        )
+        vectorisation_cache = VectorisationCache(
+            "benchmark", max_bytes=1024 * 1024 * 1024, redis_url=""
+        )
+        vectorise_issue_bodies(vectoriser, issues, vectorisation_cache)
+        cached = min(
+            measure(
+                lambda: vectorise_issue_bodies(vectoriser, issues, vectorisation_cache),
+                arguments.repeats,
+            )
+        )
+        print(
+            "{:>10} | {:>18.1f} | {:>16.1f} | {:>7.2f}x | {:>15.1f}".format(
+                batch_size,
+                batch_size / per_issue,
+                batch_size / batched,
+                per_issue / batched,
+                batch_size / cached,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
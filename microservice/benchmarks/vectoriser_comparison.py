@@ -0,0 +1,258 @@
+"""Comparison of the TF-IDF vectoriser with the hashing vectoriser.
+
+Fits a TfidfVectorizer with (1,2)-grams, as used by the trained models, and a
+HashingTfidfVectoriser (see microservice/models/hashing_vectoriser.py) on the
+same training share of the bundled corpus, trains the ensemble of every node of
+the classifier tree against each of them (see tools/train_hashing_models.py)
+and reports for each vectoriser:
+
+- accuracy: The accuracy of every node on the held-out test share.
+- issues_per_second: The throughput of transforming batches of test issues.
+- artifact_mb: The size of the pickled vectoriser without compression.
+- load_seconds and rss_mb: The time it takes to load the pickled vectoriser
+  and the memory it occupies afterwards, both measured in a fresh process.
+
+If the trained vectoriser artifact exists (vectorizer.vz, see load_config.json),
+its load time and memory are reported as well, since its vocabulary stems from
+a much larger corpus than the bundled one.
+
+Usage:
+    python -m benchmarks.vectoriser_comparison [--training-size 1500]
+    [--n-features 262144] [--batch-size 100] [--output report.json]
+"""
+import argparse
+import logging
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import joblib
+import ujson
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from microservice.models.hashing_vectoriser import (
+    DEFAULT_FEATURE_COUNT,
+    HashingTfidfVectoriser,
+)
+
+from benchmarks.common import measure, summarise_durations
+from tools.train_hashing_models import (
+    CORPUS_FOLDER,
+    get_node_accuracies,
+    load_labelled_issues,
+    split_labelled_issues,
+    train_node_classifiers,
+)
+
+# Loads the pickled vectoriser given as argument in a fresh process and prints
+# the time it took and the growth of the resident memory in kB as JSON.
+_LOAD_SCRIPT: str = """
+import json, sys, time
+import joblib
+
+def rss_kb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+
+rss_before = rss_kb()
+start = time.perf_counter()
+joblib.load(sys.argv[1])
+print(json.dumps({"seconds": time.perf_counter() - start, "rss_kb": rss_kb() - rss_before}))
+"""
+
+
+def measure_loading(artifact: Path) -> Dict[str, float]:
+    """Load a pickled vectoriser in a fresh process and measure its cost.
+
+    The modules required for unpickling are imported before measuring, so only
+    the vectoriser itself is accounted for.
+
+    Args:
+        artifact (Path): The joblib file of the vectoriser.
+
+    Returns:
+        Dict[str, float]: The load time in seconds and the growth of the
+        resident memory in MB.
+    """
+    preload: str = (
+        "import sklearn.feature_extraction.text, "
+        + "microservice.models.hashing_vectoriser\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", preload + _LOAD_SCRIPT, str(artifact)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    measurement = ujson.loads(output.strip().splitlines()[-1])
+
+    return {
+        "load_seconds": measurement["seconds"],
+        "rss_mb": measurement["rss_kb"] / 1024,
+    }
+
+
+def compare_vectoriser(
+    name: str,
+    vectoriser: Any,
+    training_issues: List[Any],
+    test_issues: List[Any],
+    batch_size: int,
+    repeats: int,
+    artifact_folder: Path,
+) -> Dict[str, Any]:
+    """Train the tree against a fitted vectoriser and measure both.
+
+    Args:
+        name (str): The name of the vectoriser in the report.
+        vectoriser (Any): The fitted vectoriser.
+        training_issues (List[Any]): The labelled training issues.
+        test_issues (List[Any]): The labelled test issues.
+        batch_size (int): The number of issues transformed per call.
+        repeats (int): The number of measured calls.
+        artifact_folder (Path): The folder to pickle the vectoriser into.
+
+    Returns:
+        Dict[str, Any]: The results of the vectoriser.
+    """
+    accuracies: Dict[str, float] = get_node_accuracies(
+        vectoriser,
+        train_node_classifiers(vectoriser, training_issues, trained_folder=None),
+        test_issues,
+    )
+    batch: List[str] = [body for body, _ in test_issues[:batch_size]]
+    vectoriser.transform(batch)
+    throughput: Dict[str, float] = summarise_durations(
+        measure(lambda: vectoriser.transform(batch), repeats), len(batch)
+    )
+    artifact: Path = artifact_folder / (name + ".vz")
+    joblib.dump(vectoriser, artifact, compress=0)
+
+    return {
+        "vectoriser": name,
+        "accuracy": accuracies,
+        "mean_accuracy": sum(accuracies.values()) / len(accuracies),
+        "issues_per_second": throughput["issues_per_second"],
+        "p50_ms": throughput["p50_ms"],
+        "artifact_mb": artifact.stat().st_size / 1e6,
+        **measure_loading(artifact),
+    }
+
+
+def get_trained_artifact() -> Optional[Path]:
+    """Return the trained TF-IDF vectoriser artifact, if it exists."""
+    try:
+        from microservice.config.classifier_config import Configuration
+
+        artifact = Path(
+            Configuration().get_value_from_config("vectorizer path loadPath")
+        )
+    except Exception:
+        return None
+
+    return artifact if artifact.is_file() else None
+
+
+def main() -> None:
+    """Run the comparison and print its results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus-folder", type=Path, default=CORPUS_FOLDER)
+    parser.add_argument("--training-size", type=int, default=1500)
+    parser.add_argument("--n-features", type=int, default=DEFAULT_FEATURE_COUNT)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--output", type=Path)
+    arguments = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    training_issues, test_issues = split_labelled_issues(
+        load_labelled_issues(arguments.corpus_folder)
+    )
+    training_issues = training_issues[: arguments.training_size]
+    training_bodies: List[str] = [body for body, _ in training_issues]
+    vectorisers: Dict[str, Any] = {
+        "tfidf": TfidfVectorizer(ngram_range=(1, 2)).fit(training_bodies),
+        "hashing": HashingTfidfVectoriser(n_features=arguments.n_features).fit(
+            training_bodies
+        ),
+    }
+
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as artifact_folder:
+        for name, vectoriser in vectorisers.items():
+            results.append(
+                compare_vectoriser(
+                    name,
+                    vectoriser,
+                    training_issues,
+                    test_issues,
+                    arguments.batch_size,
+                    arguments.repeats,
+                    Path(artifact_folder),
+                )
+            )
+    trained_artifact: Optional[Path] = get_trained_artifact()
+    if trained_artifact is not None:
+        results.append(
+            {
+                "vectoriser": "tfidf (trained artifact)",
+                "artifact_mb": trained_artifact.stat().st_size / 1e6,
+                **measure_loading(trained_artifact),
+            }
+        )
+
+    print(
+        "Trained on {} issues, tested on {} issues".format(
+            len(training_issues), len(test_issues)
+        )
+    )
+    print(
+        "vectoriser               | accuracy |  issues/s | artifact MB | load s"
+        + " | RSS MB"
+    )
+    for result in results:
+        print(
+            "{:<24} | {:>8} | {:>9} | {:>11.1f} | {:>6.3f} | {:>6.1f}".format(
+                result["vectoriser"],
+                "{:.3f}".format(result["mean_accuracy"])
+                if "mean_accuracy" in result
+                else "-",
+                "{:.0f}".format(result["issues_per_second"])
+                if "issues_per_second" in result
+                else "-",
+                result["artifact_mb"],
+                result["load_seconds"],
+                result["rss_mb"],
+            )
+        )
+    for result in results:
+        for file_name, accuracy in result.get("accuracy", {}).items():
+            print(
+                "{:<8} {:<60} accuracy {:.3f}".format(
+                    result["vectoriser"], file_name, accuracy
+                )
+            )
+
+    if arguments.output is not None:
+        arguments.output.write_text(
+            ujson.dumps(
+                {
+                    "training_size": len(training_issues),
+                    "test_size": len(test_issues),
+                    "n_features": arguments.n_features,
+                    "batch_size": arguments.batch_size,
+                    "results": results,
+                },
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        print("Report written to " + str(arguments.output))
+
+
+if __name__ == "__main__":
+    main()
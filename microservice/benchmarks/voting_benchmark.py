@@ -0,0 +1,159 @@
+"""Benchmark of full versus early-exit hard voting.
+
+Compares VotingClassifier.predict, which evaluates every ensemble member on
+every issue, with EarlyExitVotingClassifier, which evaluates the members
+cheapest first and skips the issues whose outcome has already been decided.
+The predictions of both are checked to be identical, and the number of skipped
+evaluations per member is reported.
+
+If the trained bug/enhancement classifier cannot be loaded, a stand-in ensemble
+with the same members (naive Bayes, SGD, sigmoid SVC, 200-tree random forest
+and logistic regression) is fitted on the bundled corpus, using whether an
+issue is labelled as a bug as its class.
+
+Usage:
+    python -m benchmarks.voting_benchmark [--issue-count 2000]
+"""
+import argparse
+import logging
+from typing import Any, List, Tuple
+
+import numpy
+import ujson
+from microservice.tree_logic.early_exit_voting import EarlyExitVotingClassifier
+from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.svm import SVC
+
+from benchmarks.common import (
+    CORPUS_FOLDER,
+    get_benchmark_vectoriser,
+    load_issue_corpus,
+    measure,
+)
+
+
+def load_labelled_issues() -> List[Tuple[str, int]]:
+    """Load the bodies of the bundled issues along with whether they are bugs.
+
+    Returns:
+        List[Tuple[str, int]]: The issue bodies and 1 for bugs, 0 otherwise.
+    """
+    labelled_issues: List[Tuple[str, int]] = []
+    for issue_file in sorted(CORPUS_FOLDER.glob("*.json")):
+        try:
+            entries = ujson.loads(issue_file.read_text(encoding="utf-8"))
+        except ValueError:
+            continue
+        labelled_issues.extend(
+            (entry["text"], int("bug" in (entry.get("labels") or [])))
+            for entry in entries
+            if isinstance(entry.get("text"), str)
+        )
+
+    return labelled_issues
+
+
+def get_benchmark_voting_classifier(vectoriser: Any, training_size: int) -> Any:
+    """Return the trained bug/enhancement classifier or a stand-in.
+
+    Args:
+        vectoriser (Any): The vectoriser used to fit the stand-in.
+        training_size (int): The number of issues used to fit the stand-in.
+
+    Returns:
+        Any: The hard-voting classifier to be benchmarked.
+    """
+    try:
+        from microservice.config.load_classifier import get_classifier
+
+        return get_classifier(["bug", "enhancement"])
+    except Exception as exception:
+        logging.warning(
+            "Trained classifier unavailable ("
+            + str(exception)
+            + "). Fitting a stand-in ensemble on the bundled corpus."
+        )
+
+    labelled_issues = load_labelled_issues()
+    random_generator = numpy.random.default_rng(2020)
+    training_indices = random_generator.choice(
+        len(labelled_issues), size=min(training_size, len(labelled_issues))
+    )
+    issue_bodies = [labelled_issues[index][0] for index in training_indices]
+    labels = [labelled_issues[index][1] for index in training_indices]
+
+    return VotingClassifier(
+        [
+            ("naive_bayes", MultinomialNB()),
+            ("sgd", SGDClassifier(random_state=2020)),
+            ("svc", SVC(kernel="sigmoid")),
+            (
+                "random_forest",
+                RandomForestClassifier(n_estimators=200, random_state=2020),
+            ),
+            ("logistic_regression", LogisticRegression()),
+        ],
+        voting="hard",
+    ).fit(vectoriser.transform(issue_bodies), labels)
+
+
+def main() -> None:
+    """Run the benchmark and print the timings and skipped evaluations."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--issue-count", type=int, default=2000)
+    parser.add_argument("--training-size", type=int, default=1500)
+    parser.add_argument("--repeats", type=int, default=3)
+    arguments = parser.parse_args()
+
+    issue_bodies = load_issue_corpus()
+    vectoriser = get_benchmark_vectoriser(issue_bodies)
+    voting_classifier = get_benchmark_voting_classifier(
+        vectoriser, arguments.training_size
+    )
+    early_exit_classifier = EarlyExitVotingClassifier(voting_classifier)
+
+    feature_vectors = vectoriser.transform(
+        [
+            issue_bodies[index % len(issue_bodies)]
+            for index in range(arguments.issue_count)
+        ]
+    ).tocsr()
+    full_predictions = voting_classifier.predict(feature_vectors)
+    early_exit_predictions = early_exit_classifier.predict(feature_vectors)
+    if not numpy.array_equal(full_predictions, early_exit_predictions):
+        raise AssertionError("Early-exit predictions differ from full voting")
+
+    full = min(
+        measure(lambda: voting_classifier.predict(feature_vectors), arguments.repeats)
+    )
+    early_exit = min(
+        measure(
+            lambda: early_exit_classifier.predict(feature_vectors), arguments.repeats
+        )
+    )
+    print("Predictions identical: True")
+    print(
+        "full voting: {:.1f} issues/s | early exit: {:.1f} issues/s | "
+        "speed-up: {:.2f}x".format(
+            arguments.issue_count / full,
+            arguments.issue_count / early_exit,
+            full / early_exit,
+        )
+    )
+    print("member              | evaluated | skipped | skipped ratio | seconds")
+    for name, statistics in early_exit_classifier.get_report().items():
+        print(
+            "{:<19} | {:>9} | {:>7} | {:>13.2%} | {:>7.3f}".format(
+                name,
+                statistics["evaluated_rows"],
+                statistics["skipped_rows"],
+                statistics["skipped_ratio"],
+                statistics["total_seconds"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+#!/bin/bash
+
+sleep 15
+celery -A microservice.classifier_celery.celery worker -l INFO -P prefork -Q pipeline_queue -n pipeline@%n
\ No newline at end of file
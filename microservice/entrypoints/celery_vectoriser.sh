@@ -1,4 +1,7 @@
 #!/bin/bash
 
 sleep 15
-celery -A microservice.classifier_celery.celery worker -l INFO -P solo -Q vectorise_queue -n vectoriser@%n
\ No newline at end of file
+# The solo pool runs in a single process, so large requests are transformed by a
+# pool of one process per CPU unless VECTORISATION_PROCESSES is set.
+export VECTORISATION_PROCESSES=${VECTORISATION_PROCESSES:-$(nproc)}
+celery -A microservice.classifier_celery.celery worker -l INFO -P solo -Q vectorise_queue -n vectoriser@%n
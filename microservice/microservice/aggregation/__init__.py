@@ -0,0 +1,5 @@
+"""The result aggregation module.
+
+Consists of the aggregator which joins the partial classification results of a
+request into a single response message, along with its stores.
+"""
@@ -0,0 +1,375 @@
+"""Aggregation of partial classification results per request.
+
+The leaf nodes of the classifier tree send their results back independently of
+each other, so a single request is usually answered by several messages. If
+result aggregation is enabled, the gateway registers the number of issues of
+each request under its correlation ID, and the leaf nodes hand their results
+to the aggregator instead of publishing them right away. Once all results of a
+request have arrived, they are published as a single message. Should a request
+not complete within the flush timeout, the results received so far are
+published instead, and any results arriving afterwards are published as they
+come in.
+
+The consolidated message has the same format as any other result message (a
+JSON array of results). Its correlation ID property is set to the correlation
+ID of the request, and the header "complete" (without quotes) states whether
+the message contains all results of the request.
+
+Two stores are available to keep track of pending requests: an in-memory store,
+which only works if the gateway and the workers share a single process (e.g.
+with Celery in eager mode, as used by tests and benchmarks), and a Redis store
+shared by all processes.
+"""
+import logging
+import threading
+from abc import ABC, abstractmethod
+from os import getenv
+from time import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import redis
+import ujson
+
+RESULT_AGGREGATION: str = getenv("RESULT_AGGREGATION", "none")
+RESULT_AGGREGATION_REDIS_URL: str = getenv(
+    "RESULT_AGGREGATION_REDIS_URL", getenv("RESULT_BACKEND_URL", "redis://redis")
+)
+RESULT_AGGREGATION_FLUSH_TIMEOUT_S: float = float(
+    getenv("RESULT_AGGREGATION_FLUSH_TIMEOUT_S", "30")
+)
+
+
+class AggregatedResults(NamedTuple):
+    """Results of a request which are ready to be published.
+
+    Attributes:
+        request_id (str): The correlation ID of the request.
+        results (List[Dict[str, Any]]): The results to be published.
+        complete (bool): Whether these are all results of the request.
+    """
+
+    request_id: str
+    results: List[Dict[str, Any]]
+    complete: bool
+
+
+class AggregationStore(ABC):
+    """Base class of the stores keeping track of pending requests."""
+
+    @abstractmethod
+    def expect(self, request_id: str, issue_count: int, deadline: float) -> bool:
+        """Register a request whose results are to be aggregated.
+
+        Args:
+            request_id (str): The correlation ID of the request.
+            issue_count (int): The number of issues of the request.
+            deadline (float): The UNIX timestamp after which the results
+            received so far are flushed.
+
+        Returns:
+            bool: Whether the request was registered, i.e. False if a request
+            with the same ID is still pending.
+        """
+
+    @abstractmethod
+    def add(
+        self, request_id: str, results: List[Dict[str, Any]]
+    ) -> Optional[AggregatedResults]:
+        """Add results of a request.
+
+        Args:
+            request_id (str): The correlation ID of the request.
+            results (List[Dict[str, Any]]): The results to be added.
+
+        Returns:
+            Optional[AggregatedResults]: All results of the request if it is
+            complete now, the given results if the request is unknown (e.g.
+            since it has already been flushed), and None otherwise.
+        """
+
+    @abstractmethod
+    def pop_expired(self, now: float) -> List[AggregatedResults]:
+        """Remove all requests whose deadline has passed.
+
+        Args:
+            now (float): The current UNIX timestamp.
+
+        Returns:
+            List[AggregatedResults]: The results received so far for each
+            expired request.
+        """
+
+
+class _PendingRequest:
+    """A request pending in the InMemoryAggregationStore."""
+
+    def __init__(self, issue_count: int, deadline: float) -> None:
+        self.issue_count: int = issue_count
+        self.deadline: float = deadline
+        self.results: List[Dict[str, Any]] = []
+
+
+class InMemoryAggregationStore(AggregationStore):
+    """Aggregation store keeping pending requests in the current process."""
+
+    def __init__(self) -> None:
+        """Initialise the store without any pending requests."""
+        self._pending_requests: Dict[str, _PendingRequest] = {}
+        self._lock = threading.Lock()
+
+    def expect(self, request_id: str, issue_count: int, deadline: float) -> bool:
+        with self._lock:
+            if request_id in self._pending_requests:
+                return False
+            self._pending_requests[request_id] = _PendingRequest(issue_count, deadline)
+
+        return True
+
+    def add(
+        self, request_id: str, results: List[Dict[str, Any]]
+    ) -> Optional[AggregatedResults]:
+        with self._lock:
+            pending_request = self._pending_requests.get(request_id)
+            if pending_request is None:
+                return AggregatedResults(request_id, results, complete=False)
+
+            pending_request.results.extend(results)
+            if len(pending_request.results) < pending_request.issue_count:
+                return None
+
+            del self._pending_requests[request_id]
+            return AggregatedResults(request_id, pending_request.results, complete=True)
+
+    def pop_expired(self, now: float) -> List[AggregatedResults]:
+        with self._lock:
+            expired_request_ids: List[str] = [
+                request_id
+                for request_id, pending_request in self._pending_requests.items()
+                if pending_request.deadline <= now
+            ]
+
+            return [
+                AggregatedResults(
+                    request_id,
+                    self._pending_requests.pop(request_id).results,
+                    complete=False,
+                )
+                for request_id in expired_request_ids
+            ]
+
+
+class RedisAggregationStore(AggregationStore):
+    """Aggregation store keeping pending requests in Redis.
+
+    For each request, a hash holds the number of expected and received results,
+    and a list holds the serialised results received so far. A sorted set holds
+    the IDs of all pending requests scored by their deadline. Whoever removes a
+    request from the sorted set, i.e. either the worker adding the last results
+    or the process flushing expired requests, is responsible for publishing its
+    results, so they are published exactly once.
+    """
+
+    _DEADLINES_KEY: str = "result_aggregation:deadlines"
+
+    def __init__(self, redis_url: str, key_ttl_s: int = 3600) -> None:
+        """Initialise the store.
+
+        Args:
+            redis_url (str): The URL of the Redis instance.
+            key_ttl_s (int, optional): The time after which the keys of a
+            request expire in any case, so abandoned requests do not pile up.
+            Defaults to 3600.
+        """
+        self._redis = redis.Redis.from_url(redis_url)
+        self._key_ttl_s: int = key_ttl_s
+
+    @staticmethod
+    def _counts_key(request_id: str) -> str:
+        return "result_aggregation:" + request_id + ":counts"
+
+    @staticmethod
+    def _results_key(request_id: str) -> str:
+        return "result_aggregation:" + request_id + ":results"
+
+    def _pop_results(self, request_id: str) -> List[Dict[str, Any]]:
+        pipeline = self._redis.pipeline()
+        pipeline.lrange(self._results_key(request_id), 0, -1)
+        pipeline.delete(self._results_key(request_id), self._counts_key(request_id))
+        serialised_results, _ = pipeline.execute()
+
+        return [ujson.loads(result) for result in serialised_results]
+
+    def expect(self, request_id: str, issue_count: int, deadline: float) -> bool:
+        # Adding the request to the sorted set only succeeds if it is not
+        # pending yet, so concurrent gateways cannot register it twice either.
+        if not self._redis.zadd(self._DEADLINES_KEY, {request_id: deadline}, nx=True):
+            return False
+
+        pipeline = self._redis.pipeline()
+        pipeline.hset(self._counts_key(request_id), "expected", issue_count)
+        pipeline.expire(self._counts_key(request_id), self._key_ttl_s)
+        pipeline.execute()
+
+        return True
+
+    def add(
+        self, request_id: str, results: List[Dict[str, Any]]
+    ) -> Optional[AggregatedResults]:
+        if not results:
+            return None
+
+        pipeline = self._redis.pipeline()
+        pipeline.rpush(
+            self._results_key(request_id), *[ujson.dumps(result) for result in results]
+        )
+        pipeline.expire(self._results_key(request_id), self._key_ttl_s)
+        pipeline.hincrby(self._counts_key(request_id), "received", len(results))
+        pipeline.hget(self._counts_key(request_id), "expected")
+        _, _, received_count, expected_count = pipeline.execute()
+
+        if expected_count is None:
+            self._pop_results(request_id)
+            return AggregatedResults(request_id, results, complete=False)
+        if received_count < int(expected_count):
+            return None
+        if not self._redis.zrem(self._DEADLINES_KEY, request_id):
+            return None
+
+        return AggregatedResults(
+            request_id, self._pop_results(request_id), complete=True
+        )
+
+    def pop_expired(self, now: float) -> List[AggregatedResults]:
+        expired_results: List[AggregatedResults] = []
+        for raw_request_id in self._redis.zrangebyscore(self._DEADLINES_KEY, 0, now):
+            request_id: str = raw_request_id.decode("utf-8")
+            if self._redis.zrem(self._DEADLINES_KEY, request_id):
+                expired_results.append(
+                    AggregatedResults(
+                        request_id, self._pop_results(request_id), complete=False
+                    )
+                )
+
+        return expired_results
+
+
+class ResultAggregator:
+    """Aggregator joining the results of each request into a single message."""
+
+    def __init__(
+        self,
+        store: AggregationStore,
+        publish: Callable[[AggregatedResults], None],
+        flush_timeout_s: float = RESULT_AGGREGATION_FLUSH_TIMEOUT_S,
+    ) -> None:
+        """Initialise the aggregator.
+
+        Args:
+            store (AggregationStore): The store keeping track of pending requests.
+            publish (Callable[[AggregatedResults], None]): The function used to
+            publish results which are ready.
+            flush_timeout_s (float, optional): The time after which the results
+            of an incomplete request are flushed. Defaults to
+            RESULT_AGGREGATION_FLUSH_TIMEOUT_S.
+        """
+        self._store: AggregationStore = store
+        self._publish: Callable[[AggregatedResults], None] = publish
+        self._flush_timeout_s: float = flush_timeout_s
+
+    def register_request(self, request_id: str, issue_count: int) -> None:
+        """Register a request before its issues are sent for classification.
+
+        The results of two pending requests with the same correlation ID could
+        not be told apart, so a request reusing the correlation ID of a pending
+        request is rejected. A request without any issues never receives any
+        results, so its empty result is published right away instead of
+        waiting for the flush timeout.
+
+        Args:
+            request_id (str): The correlation ID of the request.
+            issue_count (int): The number of issues of the request.
+
+        Raises:
+            ValueError: If a request with the same correlation ID is pending.
+        """
+        if issue_count == 0:
+            self._publish(AggregatedResults(request_id, [], complete=True))
+            return
+
+        if not self._store.expect(
+            request_id, issue_count, time() + self._flush_timeout_s
+        ):
+            raise ValueError(
+                "A request with correlation ID " + request_id + " is still pending"
+            )
+
+    def add_results(self, request_id: str, results: List[Dict[str, Any]]) -> None:
+        """Add results of a request, publishing all of them once it is complete.
+
+        Args:
+            request_id (str): The correlation ID of the request.
+            results (List[Dict[str, Any]]): The results to be added.
+        """
+        aggregated_results = self._store.add(request_id, results)
+        if aggregated_results is not None:
+            self._publish(aggregated_results)
+
+    def flush_expired(self) -> int:
+        """Publish the results of all requests whose flush timeout has passed.
+
+        Returns:
+            int: The number of flushed requests.
+        """
+        expired_results = self._store.pop_expired(time())
+        for aggregated_results in expired_results:
+            logging.warning(
+                "Request "
+                + aggregated_results.request_id
+                + " did not complete in time. Flushing "
+                + str(len(aggregated_results.results))
+                + " results."
+            )
+            self._publish(aggregated_results)
+
+        return len(expired_results)
+
+
+def create_aggregation_store(tasks_run_eagerly: bool) -> Optional[AggregationStore]:
+    """Create the aggregation store configured by the environment.
+
+    Uses the following environment variables:
+        - RESULT_AGGREGATION: Either "none", "memory" or "redis" (without
+        quotes).
+        - RESULT_AGGREGATION_REDIS_URL: The URL of the Redis instance. Defaults
+        to RESULT_BACKEND_URL.
+
+    Args:
+        tasks_run_eagerly (bool): Whether Celery runs the tasks in the current
+        process (task_always_eager), which the in-memory store requires.
+
+    Raises:
+        ValueError: If RESULT_AGGREGATION has an unknown value, or if it is
+        "memory" (without quotes) while tasks do not run eagerly. Every request
+        would then time out, since the workers could not see it.
+
+    Returns:
+        Optional[AggregationStore]: The store, or None if result aggregation
+        is disabled.
+    """
+    if RESULT_AGGREGATION == "none":
+        return None
+    elif RESULT_AGGREGATION == "memory":
+        if not tasks_run_eagerly:
+            raise ValueError(
+                "In-memory result aggregation requires tasks to run eagerly"
+            )
+        return _in_memory_store
+    elif RESULT_AGGREGATION == "redis":
+        return RedisAggregationStore(RESULT_AGGREGATION_REDIS_URL)
+    else:
+        raise ValueError("Unknown result aggregation: " + RESULT_AGGREGATION)
+
+
+# Shared by all aggregators of a process, so that the gateway and eagerly
+# executed tasks see the same pending requests.
+_in_memory_store = InMemoryAggregationStore()
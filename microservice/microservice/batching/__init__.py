@@ -0,0 +1,7 @@
+"""The batching module.
+
+Consists of the batcher which coalesces small classification requests in the
+gateway into larger batches before they are handed to Celery, and of the fair
+scheduler which hands the chunks of the requests of different clients to Celery
+in turns.
+"""
@@ -0,0 +1,168 @@
+"""Fair scheduling of the chunks of classification requests in the gateway.
+
+The queues of the Celery workers are first in, first out. Once the gateway has
+handed the 50 chunks of a backfill request to Celery, a request of another
+client, however small, is only picked up by the workers after all of them. AMQP
+priorities let requests of a higher priority overtake those of a lower one, but
+do not help among requests of the same priority.
+
+If fair scheduling is enabled, the gateway does not hand the chunks of a
+request to Celery as fast as it parses them. Instead, each request is submitted
+to the scheduler as a stream of dispatch steps, each of which hands one chunk to
+Celery. The scheduler only takes steps while fewer than a maximum number of
+tasks are waiting in the queue of the workers. Steps are taken from the lane
+of the highest priority first, and within a lane, from the clients in turns, so
+the chunks of different clients are interleaved. The requests of a single
+client are served in the order they arrived.
+
+Since the queue of the workers is kept short, a request of another client waits
+for at most a few chunks of a backfill request rather than for all of them.
+"""
+import logging
+import threading
+from collections import OrderedDict, deque
+from os import getenv
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+FAIR_SCHEDULING: bool = getenv("FAIR_SCHEDULING", "False").lower() == "true"
+FAIR_SCHEDULING_MAX_QUEUED_TASKS: int = int(
+    getenv("FAIR_SCHEDULING_MAX_QUEUED_TASKS", "4")
+)
+FAIR_SCHEDULING_INTERVAL_MS: int = int(getenv("FAIR_SCHEDULING_INTERVAL_MS", "100"))
+
+
+class FairScheduler:
+    """Scheduler interleaving the dispatch steps of the requests of all clients.
+
+    The scheduler may be used from several threads at once. Steps are only ever
+    taken by a single thread at a time, either by the thread submitting a
+    request or by the thread calling pump.
+    """
+
+    def __init__(
+        self,
+        get_queued_tasks: Callable[[], int],
+        max_queued_tasks: int = FAIR_SCHEDULING_MAX_QUEUED_TASKS,
+        interval_ms: int = FAIR_SCHEDULING_INTERVAL_MS,
+    ) -> None:
+        """Initialise the scheduler without any requests.
+
+        Args:
+            get_queued_tasks (Callable[[], int]): The function returning the
+            number of tasks waiting in the queue of the workers.
+            max_queued_tasks (int, optional): The number of waiting tasks up to
+            which steps are taken. Defaults to FAIR_SCHEDULING_MAX_QUEUED_TASKS.
+            interval_ms (int, optional): The interval at which pump is to be
+            called. Defaults to FAIR_SCHEDULING_INTERVAL_MS.
+        """
+        self._get_queued_tasks: Callable[[], int] = get_queued_tasks
+        self._max_queued_tasks: int = max_queued_tasks
+        self.interval_s: float = interval_ms / 1000
+
+        self._lock = threading.Lock()
+        self._pump_lock = threading.Lock()
+        # The requests of each client by client ID, by priority. The clients of
+        # a lane are rotated after each step.
+        self._lanes: Dict[int, "OrderedDict[str, Deque[Iterator[None]]]"] = {}
+
+    def submit(self, client_id: str, priority: int, steps: Iterator[None]) -> None:
+        """Submit a request and take as many steps as the queue allows.
+
+        Args:
+            client_id (str): The ID of the client the request came from.
+            priority (int): The priority of the request.
+            steps (Iterator[None]): The dispatch steps of the request. Each
+            step, including the one ending the iteration, hands (at most) one
+            chunk of the request to Celery. Exceptions have to be handled by
+            the steps themselves.
+        """
+        with self._lock:
+            clients = self._lanes.setdefault(priority, OrderedDict())
+            clients.setdefault(client_id, deque()).append(steps)
+        self.pump()
+
+    def _take_next_request(self) -> Optional[Iterator[None]]:
+        """Return the next request to take a step of. Requires the lock.
+
+        The client of the request is moved to the end of its lane, so the next
+        call returns a request of the next client of the lane.
+        """
+        if not self._lanes:
+            return None
+
+        clients = self._lanes[max(self._lanes)]
+        client_id, requests = next(iter(clients.items()))
+        clients.move_to_end(client_id)
+
+        return requests[0]
+
+    def _remove_request(self, steps: Iterator[None]) -> None:
+        """Remove a request whose steps have all been taken. Requires the lock."""
+        for priority, clients in list(self._lanes.items()):
+            for client_id, requests in list(clients.items()):
+                if requests and requests[0] is steps:
+                    requests.popleft()
+                    if not requests:
+                        del clients[client_id]
+                    if not clients:
+                        del self._lanes[priority]
+                    return
+
+    def _has_requests(self) -> bool:
+        with self._lock:
+            return bool(self._lanes)
+
+    def pump(self) -> int:
+        """Take steps until the queue of the workers is full or no steps are left.
+
+        Returns:
+            int: The number of steps taken.
+        """
+        if not self._has_requests() or not self._pump_lock.acquire(blocking=False):
+            return 0
+
+        taken_steps: int = 0
+        try:
+            free_slots: int = self._max_queued_tasks - self._get_queued_tasks()
+            while free_slots > 0:
+                with self._lock:
+                    steps = self._take_next_request()
+                if steps is None:
+                    break
+                if next(steps, StopIteration) is StopIteration:
+                    with self._lock:
+                        self._remove_request(steps)
+                taken_steps += 1
+                free_slots -= 1
+        except Exception:
+            logging.exception("Fair scheduling failed.")
+        finally:
+            self._pump_lock.release()
+
+        return taken_steps
+
+
+def create_fair_scheduler(
+    get_queued_tasks: Callable[[], int]
+) -> Optional[FairScheduler]:
+    """Create the fair scheduler configured by the environment.
+
+    Uses the following environment variables:
+        - FAIR_SCHEDULING: Whether fair scheduling is enabled.
+        - FAIR_SCHEDULING_MAX_QUEUED_TASKS: The number of tasks waiting in the
+        queue of the workers up to which further chunks are handed to Celery.
+        - FAIR_SCHEDULING_INTERVAL_MS: The interval at which the queue of the
+        workers is checked while chunks are waiting.
+
+    Args:
+        get_queued_tasks (Callable[[], int]): The function returning the number
+        of tasks waiting in the queue of the workers.
+
+    Returns:
+        Optional[FairScheduler]: The scheduler, or None if fair scheduling is
+        disabled.
+    """
+    if not FAIR_SCHEDULING:
+        return None
+
+    return FairScheduler(get_queued_tasks)
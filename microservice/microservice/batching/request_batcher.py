@@ -0,0 +1,293 @@
+"""Micro-batching of classification requests in the gateway.
+
+Some producers send a single issue per message. Handed to Celery one by one,
+each of them becomes its own vectorise_issues task and its own chain of
+classify_issues tasks, so the overhead of each task (broker round trips,
+(de)serialisation, loading the feature vectors into a matrix) outweighs the
+actual classification by far. If request batching is enabled, the gateway
+collects the issues of several requests and dispatches them as a single batch
+once the batch reaches a maximum number of issues or bytes, or once its oldest
+request has waited for the maximum time.
+
+Every issue is tagged with the ID of its request before being batched (see
+ICMPikaClient._register_request), so that its results can still be told apart
+from those of the other requests of the same batch. The results of each
+request are published with the correlation ID of that request. A batch is
+dispatched with the highest priority of its requests, so that batching never
+delays a request of high priority behind its batch.
+"""
+import logging
+import threading
+from os import getenv
+from time import monotonic
+from typing import Callable, List, Optional
+
+from microservice.models.models import IndexedIssue
+
+REQUEST_BATCH_MAX_ISSUES: int = int(getenv("REQUEST_BATCH_MAX_ISSUES", "0"))
+REQUEST_BATCH_MAX_BYTES: int = int(getenv("REQUEST_BATCH_MAX_BYTES", "1048576"))
+REQUEST_BATCH_MAX_WAIT_MS: int = int(getenv("REQUEST_BATCH_MAX_WAIT_MS", "50"))
+
+# Called once the issues of a request have been dispatched, with the exception
+# raised by the dispatch or None.
+DispatchCallback = Callable[[Optional[BaseException]], None]
+# Hands issues to Celery with the given AMQP priority, or with none.
+DispatchFunction = Callable[[List[IndexedIssue], Optional[int]], None]
+
+
+class DispatchGroup:
+    """Tracker of a request whose issues are dispatched in several parts.
+
+    Large requests are dispatched in chunks, each of which may end up in a
+    different batch. The request is only settled once all of its parts have
+    been dispatched, or as soon as one of them has failed.
+    """
+
+    def __init__(self, on_dispatched: DispatchCallback) -> None:
+        """Initialise the group without any parts.
+
+        Args:
+            on_dispatched (DispatchCallback): Called once, after all parts have
+            been dispatched, with the first exception raised or None.
+        """
+        self._on_dispatched: DispatchCallback = on_dispatched
+        self._lock = threading.Lock()
+        self._pending_parts: int = 0
+        self._is_closed: bool = False
+        self._is_settled: bool = False
+        self._exception: Optional[BaseException] = None
+
+    def add_part(self) -> DispatchCallback:
+        """Add a part to the group.
+
+        Returns:
+            DispatchCallback: The callback to be called once the part has been
+            dispatched.
+        """
+        with self._lock:
+            self._pending_parts += 1
+
+        return self._on_part_dispatched
+
+    def _on_part_dispatched(self, exception: Optional[BaseException]) -> None:
+        with self._lock:
+            self._pending_parts -= 1
+        self._settle_if_done(exception)
+
+    def close(self, exception: Optional[BaseException] = None) -> None:
+        """Mark that no further parts are added.
+
+        Args:
+            exception (Optional[BaseException], optional): The exception which
+            prevented further parts from being added. Defaults to None.
+        """
+        with self._lock:
+            self._is_closed = True
+        self._settle_if_done(exception)
+
+    def _settle_if_done(self, exception: Optional[BaseException]) -> None:
+        with self._lock:
+            if self._exception is None:
+                self._exception = exception
+            if self._is_settled or not (
+                self._exception is not None
+                or (self._is_closed and self._pending_parts == 0)
+            ):
+                return
+            self._is_settled = True
+
+        self._on_dispatched(self._exception)
+
+
+class RequestBatcher:
+    """Batcher coalescing the issues of several requests into a single dispatch.
+
+    The batcher may be used from several threads at once. Batches are
+    dispatched by the thread which completes them, or by the thread calling
+    flush_expired.
+    """
+
+    def __init__(
+        self,
+        dispatch: DispatchFunction,
+        max_issues: int = REQUEST_BATCH_MAX_ISSUES,
+        max_bytes: int = REQUEST_BATCH_MAX_BYTES,
+        max_wait_ms: int = REQUEST_BATCH_MAX_WAIT_MS,
+    ) -> None:
+        """Initialise an empty batcher.
+
+        Args:
+            dispatch (DispatchFunction): The function handing a batch of issues
+            to Celery.
+            max_issues (int, optional): The number of issues at which a batch
+            is dispatched. Defaults to REQUEST_BATCH_MAX_ISSUES.
+            max_bytes (int, optional): The total size of the issue bodies at
+            which a batch is dispatched. Defaults to REQUEST_BATCH_MAX_BYTES.
+            max_wait_ms (int, optional): The longest time a request waits for
+            its batch to be dispatched. Defaults to REQUEST_BATCH_MAX_WAIT_MS.
+        """
+        self._dispatch: DispatchFunction = dispatch
+        self._max_issues: int = max_issues
+        self._max_bytes: int = max_bytes
+        self.max_wait_s: float = max_wait_ms / 1000
+
+        self._lock = threading.Lock()
+        self._issues: List[IndexedIssue] = []
+        self._callbacks: List[DispatchCallback] = []
+        self._size_bytes: int = 0
+        self._deadline: Optional[float] = None
+        self._priority: Optional[int] = None
+
+    def _take_batch(self) -> Optional[List[IndexedIssue]]:
+        """Take the pending batch out of the batcher. Requires the lock."""
+        if not self._issues:
+            return None
+
+        batch: List[IndexedIssue] = self._issues
+        self._issues = []
+        self._size_bytes = 0
+        self._deadline = None
+
+        return batch
+
+    def _take_callbacks(self) -> List[DispatchCallback]:
+        """Take the callbacks of the pending batch. Requires the lock."""
+        callbacks: List[DispatchCallback] = self._callbacks
+        self._callbacks = []
+
+        return callbacks
+
+    def _take_priority(self) -> Optional[int]:
+        """Take the priority of the pending batch. Requires the lock."""
+        priority: Optional[int] = self._priority
+        self._priority = None
+
+        return priority
+
+    def _dispatch_batch(
+        self,
+        batch: List[IndexedIssue],
+        callbacks: List[DispatchCallback],
+        priority: Optional[int],
+    ) -> None:
+        """Dispatch a batch and notify all of its requests of the outcome."""
+        exception: Optional[BaseException] = None
+        try:
+            self._dispatch(batch, priority)
+            logging.info(
+                "Dispatched a batch of "
+                + str(len(batch))
+                + " issues from "
+                + str(len(callbacks))
+                + " requests."
+            )
+        except Exception as dispatch_exception:
+            exception = dispatch_exception
+        for callback in callbacks:
+            callback(exception)
+
+    def add(
+        self,
+        issues: List[IndexedIssue],
+        on_dispatched: DispatchCallback,
+        priority: Optional[int] = None,
+    ) -> None:
+        """Add the issues of a request to the pending batch.
+
+        If the issues would push the pending batch over one of its limits, the
+        pending batch is dispatched first. The batch is then dispatched right
+        away if it has reached one of its limits. A single request exceeding
+        the limits thus forms a batch of its own.
+
+        Args:
+            issues (List[IndexedIssue]): The issues of the request.
+            on_dispatched (DispatchCallback): Called once the issues have been
+            dispatched, with the exception raised by the dispatch or None.
+            priority (Optional[int], optional): The priority of the request.
+            Defaults to None.
+        """
+        size_bytes: int = sum(len(issue.body) for issue in issues)
+        full_batch: Optional[List[IndexedIssue]] = None
+        full_callbacks: List[DispatchCallback] = []
+        full_priority: Optional[int] = None
+        with self._lock:
+            if self._issues and (
+                len(self._issues) + len(issues) > self._max_issues
+                or self._size_bytes + size_bytes > self._max_bytes
+            ):
+                full_batch = self._take_batch()
+                full_callbacks = self._take_callbacks()
+                full_priority = self._take_priority()
+            if self._deadline is None:
+                self._deadline = monotonic() + self.max_wait_s
+            self._issues.extend(issues)
+            self._callbacks.append(on_dispatched)
+            self._size_bytes += size_bytes
+            if priority is not None:
+                self._priority = max(priority, self._priority or 0)
+
+            completed_batch: Optional[List[IndexedIssue]] = None
+            completed_callbacks: List[DispatchCallback] = []
+            completed_priority: Optional[int] = None
+            if (
+                len(self._issues) >= self._max_issues
+                or self._size_bytes >= self._max_bytes
+            ):
+                completed_batch = self._take_batch()
+                completed_callbacks = self._take_callbacks()
+                completed_priority = self._take_priority()
+
+        if full_batch is not None:
+            self._dispatch_batch(full_batch, full_callbacks, full_priority)
+        if completed_batch is not None:
+            self._dispatch_batch(
+                completed_batch, completed_callbacks, completed_priority
+            )
+
+    def flush_expired(self, force: bool = False) -> int:
+        """Dispatch the pending batch if its oldest request has waited too long.
+
+        Args:
+            force (bool, optional): Whether to dispatch the pending batch
+            regardless of its age. Defaults to False.
+
+        Returns:
+            int: The number of dispatched issues.
+        """
+        with self._lock:
+            if self._deadline is None or (not force and monotonic() < self._deadline):
+                return 0
+            batch = self._take_batch()
+            callbacks = self._take_callbacks()
+            priority = self._take_priority()
+
+        if batch is None:
+            return 0
+        self._dispatch_batch(batch, callbacks, priority)
+
+        return len(batch)
+
+
+def create_request_batcher(dispatch: DispatchFunction) -> Optional[RequestBatcher]:
+    """Create the request batcher configured by the environment.
+
+    Uses the following environment variables:
+        - REQUEST_BATCH_MAX_ISSUES: The number of issues at which a batch is
+        dispatched. 0 disables request batching.
+        - REQUEST_BATCH_MAX_BYTES: The total size of the issue bodies at which
+        a batch is dispatched.
+        - REQUEST_BATCH_MAX_WAIT_MS: The longest time a request waits for its
+        batch to be dispatched.
+
+    Args:
+        dispatch (DispatchFunction): The function handing a batch of issues to
+        Celery.
+
+    Returns:
+        Optional[RequestBatcher]: The batcher, or None if request batching is
+        disabled.
+    """
+    if REQUEST_BATCH_MAX_ISSUES <= 0:
+        return None
+
+    return RequestBatcher(dispatch)
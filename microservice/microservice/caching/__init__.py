@@ -0,0 +1,5 @@
+"""The caching module.
+
+Consists of the caches which allow the workers to skip repeated work for issue
+bodies they have already processed.
+"""
@@ -0,0 +1,253 @@
+"""End-to-end cache of the final labels of issue bodies.
+
+Issue bodies which have been classified before are pushed through the whole
+classifier tree again whenever a tracker resends them. With the result cache
+enabled, the leaf nodes store the labels predicted for every issue under a hash
+of its body, and the gateway looks up the issues of each request before handing
+them to Celery. Issues found in the cache are answered by the gateway right
+away, along with the labels sent with them, and only the remaining issues are
+sent to the workers.
+
+The labels are stored per model version, i.e. a content hash of all files
+under trained_classifiers (see get_model_version). The workers write with the
+version of the models they have loaded, while the gateway regularly checks the
+files for changes and reads with the version found on disk. Once new models
+are deployed, cached labels of the previous models are thus no longer served,
+and they simply expire.
+
+As with result aggregation, two stores are available: an in-memory store,
+which only works if the gateway and the workers share a single process, and a
+Redis store shared by all processes.
+"""
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from os import getenv
+from typing import Any, Callable, Dict, List, Optional
+
+import redis
+import ujson
+
+RESULT_CACHE: str = getenv("RESULT_CACHE", "none")
+RESULT_CACHE_REDIS_URL: str = getenv(
+    "RESULT_CACHE_REDIS_URL", getenv("RESULT_BACKEND_URL", "redis://redis")
+)
+RESULT_CACHE_TTL_S: int = int(getenv("RESULT_CACHE_TTL_S", str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES: int = int(getenv("RESULT_CACHE_MAX_ENTRIES", "100000"))
+
+
+def get_body_hash(issue_body: str) -> str:
+    """Return the hash identifying an issue body in the result cache.
+
+    Args:
+        issue_body (str): The issue body.
+
+    Returns:
+        str: The hexadecimal hash of the issue body.
+    """
+    return hashlib.blake2b(
+        issue_body.encode("utf-8", "surrogatepass"), digest_size=16
+    ).hexdigest()
+
+
+class ResultCacheStore(ABC):
+    """Base class of the stores holding the cached labels."""
+
+    @abstractmethod
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Look up the serialised labels of the given keys.
+
+        Args:
+            keys (List[str]): The keys to be looked up.
+
+        Returns:
+            Dict[str, str]: The serialised labels by key. Keys which are not
+            cached are missing.
+        """
+
+    @abstractmethod
+    def put_many(self, entries: Dict[str, str]) -> None:
+        """Store serialised labels.
+
+        Args:
+            entries (Dict[str, str]): The serialised labels by key.
+        """
+
+
+class InMemoryResultCacheStore(ResultCacheStore):
+    """Result cache store keeping the labels in an LRU cache in this process."""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES) -> None:
+        """Initialise an empty store.
+
+        Args:
+            max_entries (int, optional): The maximum number of cached entries.
+            Defaults to RESULT_CACHE_MAX_ENTRIES.
+        """
+        self._max_entries: int = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        found_entries: Dict[str, str] = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    found_entries[key] = entry
+
+        return found_entries
+
+    def put_many(self, entries: Dict[str, str]) -> None:
+        with self._lock:
+            self._entries.update(entries)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisResultCacheStore(ResultCacheStore):
+    """Result cache store keeping the labels in Redis."""
+
+    def __init__(self, redis_url: str, ttl_s: int = RESULT_CACHE_TTL_S) -> None:
+        """Initialise the store.
+
+        Args:
+            redis_url (str): The URL of the Redis instance.
+            ttl_s (int, optional): The time after which cached labels expire.
+            Defaults to RESULT_CACHE_TTL_S.
+        """
+        self._redis = redis.Redis.from_url(redis_url)
+        self._ttl_s: int = ttl_s
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        if not keys:
+            return {}
+
+        return {
+            key: entry.decode("utf-8")
+            for key, entry in zip(keys, self._redis.mget(keys))
+            if entry is not None
+        }
+
+    def put_many(self, entries: Dict[str, str]) -> None:
+        pipeline = self._redis.pipeline(transaction=False)
+        for key, entry in entries.items():
+            pipeline.setex(key, self._ttl_s, entry)
+        pipeline.execute()
+
+
+class ResultCache:
+    """Cache mapping the body hashes of issues to their final labels.
+
+    Attributes:
+        model_version (str): The version of the models the labels belong to.
+        hits (int): The number of issues found in the cache.
+        misses (int): The number of issues not found in the cache.
+    """
+
+    def __init__(self, store: ResultCacheStore, model_version: str) -> None:
+        """Initialise the cache.
+
+        Args:
+            store (ResultCacheStore): The store holding the cached labels.
+            model_version (str): The version of the models the labels belong to.
+        """
+        self._store: ResultCacheStore = store
+        self.model_version: str = model_version
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _get_key(self, body_hash: str) -> str:
+        # Entries of the first format held all labels of the first request
+        # of an issue body rather than the predicted labels only.
+        return "result_cache:v2:" + self.model_version + ":" + body_hash
+
+    def get_many(self, body_hashes: List[str]) -> Dict[str, List[str]]:
+        """Look up the labels of the given body hashes.
+
+        Errors of the store are logged and treated as misses, so that a failing
+        cache never prevents issues from being classified.
+
+        Args:
+            body_hashes (List[str]): The body hashes to be looked up.
+
+        Returns:
+            Dict[str, List[str]]: The cached labels by body hash. Body hashes
+            which are not cached are missing.
+        """
+        unique_body_hashes: List[str] = list(dict.fromkeys(body_hashes))
+        try:
+            entries = self._store.get_many(
+                [self._get_key(body_hash) for body_hash in unique_body_hashes]
+            )
+        except redis.RedisError:
+            logging.exception("Looking up cached results failed.")
+            entries = {}
+
+        cached_labels: Dict[str, List[str]] = {
+            body_hash: ujson.loads(entries[self._get_key(body_hash)])
+            for body_hash in unique_body_hashes
+            if self._get_key(body_hash) in entries
+        }
+        self.hits += len(cached_labels)
+        self.misses += len(unique_body_hashes) - len(cached_labels)
+
+        return cached_labels
+
+    def put_many(self, labels: Dict[str, Any]) -> None:
+        """Store the final labels of classified issues.
+
+        Args:
+            labels (Dict[str, Any]): The labels by body hash.
+        """
+        if not labels:
+            return
+
+        try:
+            self._store.put_many(
+                {
+                    self._get_key(body_hash): ujson.dumps(issue_labels)
+                    for body_hash, issue_labels in labels.items()
+                }
+            )
+        except redis.RedisError:
+            logging.exception("Storing results in the result cache failed.")
+
+
+def create_result_cache(get_model_version: Callable[[], str]) -> Optional[ResultCache]:
+    """Create the result cache configured by the environment.
+
+    Uses the following environment variables:
+        - RESULT_CACHE: Either "none", "memory" or "redis" (without quotes).
+        - RESULT_CACHE_REDIS_URL: The URL of the Redis instance. Defaults to
+        RESULT_BACKEND_URL.
+
+    Args:
+        get_model_version (Callable[[], str]): Returns the version of the
+        models the labels belong to. Only called if result caching is enabled,
+        since it usually hashes all trained classifiers.
+
+    Raises:
+        ValueError: If RESULT_CACHE has an unknown value.
+
+    Returns:
+        Optional[ResultCache]: The cache, or None if result caching is disabled.
+    """
+    if RESULT_CACHE == "none":
+        return None
+    elif RESULT_CACHE == "memory":
+        return ResultCache(_in_memory_store, get_model_version())
+    elif RESULT_CACHE == "redis":
+        return ResultCache(
+            RedisResultCacheStore(RESULT_CACHE_REDIS_URL), get_model_version()
+        )
+    else:
+        raise ValueError("Unknown result cache: " + RESULT_CACHE)
+
+
+# Shared by all result caches of a process, so that the gateway and eagerly
+# executed tasks see the same labels.
+_in_memory_store = InMemoryResultCacheStore()
@@ -0,0 +1,282 @@
+"""Content-addressed cache of the feature vectors of issue bodies.
+
+The trackers frequently send the same issue bodies again, e.g. after an issue
+has been edited elsewhere, when trackers are re-synchronised or during
+relabelling sweeps. Transforming such a body again yields exactly the same
+feature vector, so the vectoriser workers keep the feature vectors of recently
+seen bodies and only call vectoriser.transform for bodies they have not seen.
+
+Feature vectors are keyed by a hash of the issue body along with the version
+of the vectoriser artifact (see get_vectoriser_version), so deploying a new
+vectoriser never serves feature vectors of the previous one. Each worker
+process holds an in-process LRU cache bounded by the total size of the cached
+feature vectors. Optionally, a Redis instance shared by all workers serves as
+a second tier, which is consulted on misses of the in-process cache.
+"""
+import hashlib
+import logging
+import struct
+from collections import OrderedDict
+from os import getenv
+from typing import Any, Dict, List, Optional
+
+import numpy
+import redis
+from scipy import sparse
+
+VECTORISATION_CACHE_MAX_BYTES: int = int(
+    getenv("VECTORISATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+VECTORISATION_CACHE_REDIS_URL: str = getenv("VECTORISATION_CACHE_REDIS_URL", "")
+VECTORISATION_CACHE_REDIS_TTL_S: int = int(
+    getenv("VECTORISATION_CACHE_REDIS_TTL_S", str(7 * 24 * 3600))
+)
+
+# Rough size of the key, the CSR matrix object and the LRU bookkeeping of a
+# single entry, which is added to the size of its buffers.
+_ENTRY_OVERHEAD_BYTES: int = 512
+_REDIS_HEADER = struct.Struct("<II")
+
+
+class CacheStatistics:
+    """Counters of a VectorisationCache.
+
+    Attributes:
+        hits (int): The number of lookups served by the in-process cache.
+        misses (int): The number of lookups not served by any tier.
+        evictions (int): The number of entries evicted from the in-process
+        cache to stay within its size limit.
+        redis_hits (int): The number of lookups served by Redis.
+        redis_errors (int): The number of failed Redis operations.
+        entries (int): The current number of entries of the in-process cache.
+        size_bytes (int): The current size of the in-process cache.
+    """
+
+    def __init__(self) -> None:
+        """Initialise all counters with zero."""
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.redis_hits: int = 0
+        self.redis_errors: int = 0
+        self.entries: int = 0
+        self.size_bytes: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the counters along with the overall hit ratio.
+
+        Returns:
+            Dict[str, Any]: The counters by name.
+        """
+        statistics: Dict[str, Any] = dict(vars(self))
+        lookups: int = self.hits + self.redis_hits + self.misses
+        statistics["hit_ratio"] = (
+            (self.hits + self.redis_hits) / lookups if lookups else 0.0
+        )
+
+        return statistics
+
+
+class VectorisationCache:
+    """Two-tier cache mapping issue bodies to their feature vectors.
+
+    A VectorisationCache is not to be shared between processes. Cached feature
+    vectors are 1xN CSR matrices which own their buffers, i.e. they do not keep
+    the matrix of the batch they were transformed in alive. They are handed out
+    as they are, so they must not be modified.
+    """
+
+    def __init__(
+        self,
+        vectoriser_version: str,
+        max_bytes: int = VECTORISATION_CACHE_MAX_BYTES,
+        redis_url: str = VECTORISATION_CACHE_REDIS_URL,
+        redis_ttl_s: int = VECTORISATION_CACHE_REDIS_TTL_S,
+    ) -> None:
+        """Initialise an empty cache.
+
+        Args:
+            vectoriser_version (str): The version of the vectoriser whose
+            feature vectors are cached.
+            max_bytes (int, optional): The size limit of the in-process cache.
+            0 disables the in-process cache. Defaults to
+            VECTORISATION_CACHE_MAX_BYTES.
+            redis_url (str, optional): The URL of the Redis instance serving as
+            the shared tier. An empty string disables the shared tier. Defaults
+            to VECTORISATION_CACHE_REDIS_URL.
+            redis_ttl_s (int, optional): The time after which entries expire
+            in Redis. Defaults to VECTORISATION_CACHE_REDIS_TTL_S.
+        """
+        self._vectoriser_version: bytes = vectoriser_version.encode("utf-8")
+        self._max_bytes: int = max_bytes
+        self._redis: Optional[redis.Redis] = (
+            redis.Redis.from_url(redis_url) if redis_url else None
+        )
+        self._redis_ttl_s: int = redis_ttl_s
+        self._entries: "OrderedDict[bytes, sparse.csr_matrix]" = OrderedDict()
+
+        self.statistics = CacheStatistics()
+
+    def get_key(self, issue_body: str) -> bytes:
+        """Return the cache key of an issue body.
+
+        Args:
+            issue_body (str): The issue body.
+
+        Returns:
+            bytes: The hash of the issue body and the vectoriser version.
+        """
+        key_hash = hashlib.blake2b(self._vectoriser_version, digest_size=16)
+        key_hash.update(issue_body.encode("utf-8", "surrogatepass"))
+
+        return key_hash.digest()
+
+    @staticmethod
+    def _get_entry_size(feature_vector: sparse.csr_matrix) -> int:
+        return (
+            feature_vector.data.nbytes
+            + feature_vector.indices.nbytes
+            + feature_vector.indptr.nbytes
+            + _ENTRY_OVERHEAD_BYTES
+        )
+
+    @staticmethod
+    def _encode(feature_vector: sparse.csr_matrix) -> bytes:
+        return (
+            _REDIS_HEADER.pack(feature_vector.nnz, feature_vector.shape[1])
+            + feature_vector.data.astype(numpy.float64, copy=False).tobytes()
+            + feature_vector.indices.astype(numpy.int32, copy=False).tobytes()
+        )
+
+    @staticmethod
+    def _decode(encoded_feature_vector: bytes) -> sparse.csr_matrix:
+        nnz, column_count = _REDIS_HEADER.unpack_from(encoded_feature_vector)
+        data_end: int = _REDIS_HEADER.size + 8 * nnz
+        data = numpy.frombuffer(
+            encoded_feature_vector[_REDIS_HEADER.size : data_end], dtype=numpy.float64
+        )
+        indices = numpy.frombuffer(encoded_feature_vector[data_end:], dtype=numpy.int32)
+
+        return sparse.csr_matrix(
+            (data, indices, numpy.array([0, nnz], dtype=numpy.int32)),
+            shape=(1, column_count),
+        )
+
+    def _put_in_process(self, key: bytes, feature_vector: sparse.csr_matrix) -> None:
+        """Add an entry to the in-process cache, evicting the oldest entries."""
+        entry_size: int = self._get_entry_size(feature_vector)
+        if entry_size > self._max_bytes or key in self._entries:
+            return
+
+        self._entries[key] = feature_vector
+        self.statistics.size_bytes += entry_size
+        while self.statistics.size_bytes > self._max_bytes:
+            _, evicted_feature_vector = self._entries.popitem(last=False)
+            self.statistics.size_bytes -= self._get_entry_size(evicted_feature_vector)
+            self.statistics.evictions += 1
+        self.statistics.entries = len(self._entries)
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, sparse.csr_matrix]:
+        """Look up the feature vectors of the given keys.
+
+        Keys missing in the in-process cache are looked up in Redis (if
+        enabled) with a single round trip. Feature vectors found in Redis are
+        added to the in-process cache. Repeated keys are looked up (and
+        counted in the statistics) only once.
+
+        Args:
+            keys (List[bytes]): The keys to be looked up.
+
+        Returns:
+            Dict[bytes, sparse.csr_matrix]: The cached feature vectors by key.
+            Keys which are not cached are missing.
+        """
+        found_feature_vectors: Dict[bytes, sparse.csr_matrix] = {}
+        unique_keys: List[bytes] = list(dict.fromkeys(keys))
+        missing_keys: List[bytes] = []
+        for key in unique_keys:
+            feature_vector = self._entries.get(key)
+            if feature_vector is None:
+                missing_keys.append(key)
+            else:
+                self._entries.move_to_end(key)
+                found_feature_vectors[key] = feature_vector
+        self.statistics.hits += len(found_feature_vectors)
+
+        if missing_keys and self._redis is not None:
+            try:
+                encoded_feature_vectors = self._redis.mget(
+                    [b"vectorisation_cache:" + key for key in missing_keys]
+                )
+            except redis.RedisError:
+                self.statistics.redis_errors += 1
+                logging.exception("Looking up feature vectors in Redis failed.")
+                encoded_feature_vectors = [None] * len(missing_keys)
+
+            for key, encoded_feature_vector in zip(
+                missing_keys, encoded_feature_vectors
+            ):
+                if encoded_feature_vector is not None:
+                    feature_vector = self._decode(encoded_feature_vector)
+                    found_feature_vectors[key] = feature_vector
+                    self._put_in_process(key, feature_vector)
+                    self.statistics.redis_hits += 1
+
+        self.statistics.misses += len(unique_keys) - len(found_feature_vectors)
+
+        return found_feature_vectors
+
+    def put_many(self, feature_vectors: Dict[bytes, sparse.csr_matrix]) -> None:
+        """Add freshly transformed feature vectors to all tiers.
+
+        The feature vectors are copied, since they are usually rows of a
+        larger matrix.
+
+        Args:
+            feature_vectors (Dict[bytes, sparse.csr_matrix]): The feature
+            vectors by key.
+        """
+        owned_feature_vectors: Dict[bytes, sparse.csr_matrix] = {
+            key: feature_vector.copy()
+            for key, feature_vector in feature_vectors.items()
+        }
+        for key, feature_vector in owned_feature_vectors.items():
+            self._put_in_process(key, feature_vector)
+
+        if owned_feature_vectors and self._redis is not None:
+            pipeline = self._redis.pipeline(transaction=False)
+            for key, feature_vector in owned_feature_vectors.items():
+                pipeline.setex(
+                    b"vectorisation_cache:" + key,
+                    self._redis_ttl_s,
+                    self._encode(feature_vector),
+                )
+            try:
+                pipeline.execute()
+            except redis.RedisError:
+                self.statistics.redis_errors += 1
+                logging.exception("Storing feature vectors in Redis failed.")
+
+
+def create_vectorisation_cache(vectoriser_version: str) -> Optional[VectorisationCache]:
+    """Create the vectorisation cache configured by the environment.
+
+    Uses the following environment variables:
+        - VECTORISATION_CACHE_MAX_BYTES: The size limit of the in-process cache
+        of each worker process. 0 disables the in-process cache.
+        - VECTORISATION_CACHE_REDIS_URL: The URL of the Redis instance serving
+        as the shared tier. Left empty, the shared tier is disabled.
+        - VECTORISATION_CACHE_REDIS_TTL_S: The time after which entries expire
+        in Redis.
+
+    Args:
+        vectoriser_version (str): The version of the vectoriser.
+
+    Returns:
+        Optional[VectorisationCache]: The cache, or None if both tiers are
+        disabled.
+    """
+    if VECTORISATION_CACHE_MAX_BYTES <= 0 and not VECTORISATION_CACHE_REDIS_URL:
+        return None
+
+    return VectorisationCache(vectoriser_version)
@@ -7,6 +7,11 @@ computations should be carried out asynchronously, Celery is used for this
 purpose.
 """
 from celery import Celery
+from microservice.classifier_celery.serialisation import (
+    register_issue_batch_serialiser,
+)
+
+register_issue_batch_serialiser()
 
 app = Celery("celery")
 
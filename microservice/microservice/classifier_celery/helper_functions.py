@@ -1,15 +1,55 @@
-"""Helper functions for the Celery tasks."""
+"""Helper functions for the Celery tasks.
+
+Besides the functions used by the tasks, this module records the metrics of
+every task (see the metrics module) using Celery's signals: Every task carries
+the time it was sent in its headers, from which the time it waited in its queue
+is determined once it is started. Likewise, the tasks of traced requests carry
+their trace ID (see the tracing module), and are logged as spans of the trace.
+"""
 import logging
+import threading
 from math import ceil
-from os import getenv
-from typing import Any, List, Tuple
+from os import getenv, getpid
+from time import monotonic, perf_counter, time
+from typing import Any, Dict, List, Optional, Tuple
 from multiprocessing import cpu_count
 
-import ujson
-from microservice.models.models import VectorisedIssue
+from celery import Task
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from microservice.caching.result_cache import ResultCache
+from microservice.caching.vectorisation_cache import VectorisationCache
+from microservice.aggregation.result_aggregator import (
+    AggregatedResults,
+    ResultAggregator,
+    create_aggregation_store,
+)
+from microservice.classifier_celery.celery import app as celery_app
+from microservice.classifier_celery.result_publisher import ResultPublisher
+from microservice.metrics.registry import (
+    ISSUE_COUNT_BUCKETS,
+    REGISTRY,
+    THROUGHPUT_BUCKETS,
+    start_metrics_server,
+)
+from microservice.metrics.tracing import (
+    TRACE_ID_HEADER,
+    get_trace_id,
+    log_span,
+    set_trace_id,
+)
+from microservice.models.feature_vectors import split_csr_rows
+from microservice.models.models import IndexedIssue, VectorisedIssue
+from microservice.models.parallel_vectorisation import transform_issue_bodies
 from microservice.tree_logic.classifier_tree import ClassifyTree, ClassifyTreeNode
-from pika import BlockingConnection, ConnectionParameters
-from pika.adapters.blocking_connection import BlockingChannel
+from pika import BasicProperties
+from pika.exceptions import AMQPError
 
 # Environment variables used throughout this module
 PIKA_EXCHANGE_NAME = getenv("PIKA_EXCHANGE_NAME", "classification")
@@ -17,23 +57,175 @@ PIKA_EXCHANGE_TYPE = getenv("PIKA_EXCHANGE_TYPE", "direct")
 PIKA_OUTPUT_QUEUE_NAME = getenv("PIKA_OUTPUT_QUEUE_NAME", "issue_classifier_output")
 PIKA_RABBITMQ_HOST = getenv("PIKA_RABBITMQ_HOST", "rabbitmq")
 PIKA_OUTPUT_ROUTING_KEY = getenv("PIKA_OUTPUT_ROUTING_KEY", "Classification.Results")
+PIKA_PUBLISHER_CONFIRMS = getenv("PIKA_PUBLISHER_CONFIRMS", "False").lower() == "true"
+PIKA_COALESCE_MAX_BYTES = int(getenv("PIKA_COALESCE_MAX_BYTES", "0"))
 CLASSIFY_QUEUE: str = getenv("CLASSIFY_QUEUE", "classify_queue")
+CLASSIFY_CHUNK_MIN_ISSUES: int = int(getenv("CLASSIFY_CHUNK_MIN_ISSUES", "16"))
+CLASSIFY_CHUNK_MAX_ISSUES: int = int(getenv("CLASSIFY_CHUNK_MAX_ISSUES", "1000"))
+CLASSIFIER_CONCURRENCY_TTL_S: float = float(
+    getenv("CLASSIFIER_CONCURRENCY_TTL_S", "60")
+)
+CLASSIFIER_INSPECT_TIMEOUT_S: float = float(getenv("CLASSIFIER_INSPECT_TIMEOUT_S", "1"))
 
+_result_publisher: Optional[ResultPublisher] = None
+_result_publisher_pid: Optional[int] = None
+_result_aggregator: Optional[ResultAggregator] = None
+_result_aggregator_pid: Optional[int] = None
+# The start of each running task as both a Unix timestamp and a perf_counter.
+_task_start_times: Dict[str, Tuple[float, float]] = {}
+_classifier_concurrency: Optional[int] = None
+_classifier_concurrency_expiry: float = 0.0
+_classifier_concurrency_lock = threading.Lock()
+_is_refreshing_classifier_concurrency: bool = False
+_is_split_plan_logged: bool = False
 
-def _init_publisher() -> Tuple[BlockingConnection, BlockingChannel]:
-    rabbitmq_connection_parameters = ConnectionParameters(host=PIKA_RABBITMQ_HOST)
-    rabbitmq_connection = BlockingConnection(rabbitmq_connection_parameters)
-    logging.info("Connection to RabbitMQ established. Setting up channel...")
-    rabbitmq_channel = rabbitmq_connection.channel()
-    logging.info("Channel set up. Declaring exchange...")
-    rabbitmq_channel.exchange_declare(
-        exchange=PIKA_EXCHANGE_NAME, exchange_type=PIKA_EXCHANGE_TYPE
-    )
+# Header of every task carrying the (wall clock) time the task was sent.
+ENQUEUED_AT_HEADER: str = "enqueued_at"
+_TASK_LABEL_NAMES: Tuple[str, ...] = ("task", "node_index")
+_task_seconds = REGISTRY.histogram(
+    "icm_task_seconds", "Processing time of tasks in seconds.", _TASK_LABEL_NAMES
+)
+_task_queue_wait_seconds = REGISTRY.histogram(
+    "icm_task_queue_wait_seconds",
+    "Time between sending and starting tasks in seconds.",
+    _TASK_LABEL_NAMES,
+)
+_task_issues = REGISTRY.histogram(
+    "icm_task_issues",
+    "Number of issues per task.",
+    _TASK_LABEL_NAMES,
+    ISSUE_COUNT_BUCKETS,
+)
+_task_issues_per_second = REGISTRY.histogram(
+    "icm_task_issues_per_second",
+    "Throughput of tasks in issues per second.",
+    _TASK_LABEL_NAMES,
+    THROUGHPUT_BUCKETS,
+)
+_task_issues_total = REGISTRY.counter(
+    "icm_task_issues_total", "Number of issues processed by tasks.", _TASK_LABEL_NAMES
+)
+_results_seconds = REGISTRY.histogram(
+    "icm_results_seconds", "Time spent sending results back in seconds."
+)
+_results_issues = REGISTRY.histogram(
+    "icm_results_issues",
+    "Number of results sent back at once.",
+    buckets=ISSUE_COUNT_BUCKETS,
+)
+
+
+def get_result_publisher() -> ResultPublisher:
+    """Return the result publisher of the current process.
+
+    The publisher is created on first use in each process. Since a connection
+    to RabbitMQ must not be shared between a parent process and its forked
+    children, a new publisher is created whenever the process ID has changed.
+
+    Uses the following environment variables:
+        - PIKA_RABBITMQ_HOST: Hostname of the running RabbitMQ instance.
+        - PIKA_EXCHANGE_NAME: The name of the RabbitMQ exchange.
+        - PIKA_EXCHANGE_TYPE: The type of the RabbitMQ exchange.
+        - PIKA_OUTPUT_ROUTING_KEY: The routing key binding the given exchange to
+        the output queue.
+        - PIKA_PUBLISHER_CONFIRMS: Whether to wait for publisher confirms.
+        - PIKA_COALESCE_MAX_BYTES: Result batches of a task smaller than this
+        are sent together at the end of the task. 0 disables coalescing.
+
+    Returns:
+        ResultPublisher: The result publisher of the current process.
+    """
+    global _result_publisher, _result_publisher_pid
+
+    if _result_publisher is None or _result_publisher_pid != getpid():
+        _result_publisher = ResultPublisher(
+            host=PIKA_RABBITMQ_HOST,
+            exchange_name=PIKA_EXCHANGE_NAME,
+            exchange_type=PIKA_EXCHANGE_TYPE,
+            routing_key=PIKA_OUTPUT_ROUTING_KEY,
+            confirm_delivery=PIKA_PUBLISHER_CONFIRMS,
+            coalesce_max_bytes=PIKA_COALESCE_MAX_BYTES,
+        )
+        _result_publisher_pid = getpid()
+
+    return _result_publisher
 
-    return rabbitmq_connection, rabbitmq_channel
 
+@worker_process_init.connect
+def _reset_result_publisher(**kwargs: Any) -> None:
+    """Drop the result publisher inherited from the parent process after forking."""
+    global _result_publisher, _result_publisher_pid
+
+    _result_publisher = None
+    _result_publisher_pid = None
+
+
+@task_postrun.connect
+def _flush_result_publisher(**kwargs: Any) -> None:
+    """Send the results coalesced during a task before the task is acknowledged.
+
+    task_postrun runs on the thread of the task, right after the task has
+    returned, so the connection of the publisher is never used by another
+    thread, and no results are left in memory once the task is acknowledged.
+    """
+    if _result_publisher is not None and _result_publisher_pid == getpid():
+        try:
+            _result_publisher.flush()
+        except AMQPError:
+            logging.exception("Sending the coalesced results failed.")
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _close_result_publisher(**kwargs: Any) -> None:
+    """Flush buffered results and close the connection of the result publisher."""
+    if _result_publisher is not None and _result_publisher_pid == getpid():
+        _result_publisher.close()
+
+
+def get_result_aggregator() -> Optional[ResultAggregator]:
+    """Return the result aggregator of the current process.
+
+    As with the result publisher, the aggregator is created on first use in
+    each process. Aggregated results are published using the result publisher
+    of the current process.
+
+    Returns:
+        Optional[ResultAggregator]: The result aggregator, or None if result
+        aggregation is disabled (see create_aggregation_store).
+    """
+    global _result_aggregator, _result_aggregator_pid
+
+    if _result_aggregator_pid != getpid():
+        aggregation_store = create_aggregation_store(celery_app.conf.task_always_eager)
+        _result_aggregator = (
+            ResultAggregator(aggregation_store, publish=publish_aggregated_results)
+            if aggregation_store is not None
+            else None
+        )
+        _result_aggregator_pid = getpid()
 
-def send_results_to_output(results: List[VectorisedIssue]) -> None:
+    return _result_aggregator
+
+
+def publish_aggregated_results(aggregated_results: AggregatedResults) -> None:
+    """Publish the aggregated results of a request using the result publisher.
+
+    Args:
+        aggregated_results (AggregatedResults): The results to be published.
+    """
+    get_result_publisher().publish(
+        aggregated_results.results,
+        properties=BasicProperties(
+            correlation_id=aggregated_results.request_id,
+            headers={"complete": aggregated_results.complete},
+        ),
+    )
+
+
+def send_results_to_output(
+    results: List[VectorisedIssue], result_cache: Optional[ResultCache] = None
+) -> None:
     """Send the classification results back to the output queue at RabbitMQ.
 
     Note that not the entire issue is returned. Only the classification results
@@ -41,29 +233,151 @@ def send_results_to_output(results: List[VectorisedIssue]) -> None:
     client can then map the classification results back to the originally sent
     issues using the id.
 
-    Uses the following environment variables:
-        - PIKA_EXCHANGE_NAME: The name of the RabbitMQ exchange.
-        - PIKA_OUTPUT_ROUTING_KEY: The routing key binding the given exchange to
-        the output queue.
+    The results are sent using the long-lived result publisher of the current
+    worker process (see get_result_publisher), so no new connection has to be
+    established for each batch of results.
+
+    If result aggregation is enabled, results of issues belonging to a request
+    are handed to the result aggregator instead, which publishes them once all
+    results of the request have arrived.
+
+    Otherwise, results of issues belonging to a request (which is the case if
+    the gateway batches requests) are published separately per request, each
+    message carrying the request ID as its correlation ID, so that results of
+    different requests sharing a task can still be told apart.
+
+    If a result cache is given, the labels attached by the classifier tree to
+    all issues carrying a body hash are stored in the cache (see
+    VectorisedIssue.predicted_labels), so that the gateway can answer the same
+    issue bodies right away in the future. The labels sent by the client are
+    left out, since they differ between requests of the same issue body.
 
     Args:
         results (List[VectorisedIssue]): The transformed issues to be sent to RabbitMQ.
+        result_cache (Optional[ResultCache], optional): The result cache of the
+        worker. Defaults to None.
     """
-    filtered_results = [result.dict(exclude={"body"}) for result in results]
-    serialised_results = ujson.dumps(filtered_results).encode("utf-8")
-
-    logging.info("Declaring exchange...")
-    rabbitmq_connection, rabbitmq_channel = _init_publisher()
-    logging.info("Exchange declared. Sending classifications now...")
-    rabbitmq_channel.basic_publish(
-        exchange=PIKA_EXCHANGE_NAME,
-        routing_key=PIKA_OUTPUT_ROUTING_KEY,
-        body=serialised_results,
+    start = perf_counter()
+    result_aggregator = get_result_aggregator()
+    unaggregated_results: List[Dict[str, Any]] = []
+    results_per_request: Dict[str, List[Dict[str, Any]]] = {}
+
+    for result in results:
+        filtered_result = result.to_result()
+        if result.request_id is not None:
+            results_per_request.setdefault(result.request_id, []).append(
+                filtered_result
+            )
+        else:
+            unaggregated_results.append(filtered_result)
+
+    if result_cache is not None:
+        result_cache.put_many(
+            {
+                result.body_hash: result.predicted_labels()
+                for result in results
+                if result.body_hash is not None
+            }
+        )
+    for request_id, request_results in results_per_request.items():
+        if result_aggregator is not None:
+            result_aggregator.add_results(request_id, request_results)
+        else:
+            get_result_publisher().publish(
+                request_results,
+                properties=BasicProperties(correlation_id=request_id),
+            )
+    if unaggregated_results:
+        get_result_publisher().publish(unaggregated_results)
+    duration: float = perf_counter() - start
+    _results_seconds.observe(duration)
+    _results_issues.observe(len(results))
+    log_span("send_results", time() - duration, duration, issues=len(results))
+    logging.info(
+        "Sent %d classifications of %d requests in %.1f ms.",
+        len(results),
+        len(results_per_request) + (1 if unaggregated_results else 0),
+        duration * 1000,
     )
 
-    logging.info("Classifications sent. Closing connection now...")
-    rabbitmq_connection.close()
-    logging.info("Connection closed. Goodbye :)")
+
+def vectorise_issue_bodies(
+    vectoriser: Any,
+    issues: List[IndexedIssue],
+    vectorisation_cache: Optional[VectorisationCache] = None,
+) -> List[VectorisedIssue]:
+    """Transform the bodies of the given issues in a single vectoriser call.
+
+    Instead of calling vectoriser.transform once per issue, which repeats
+    input validation, analyser set up and sparse matrix construction for every
+    single issue, all issue bodies are transformed at once into a single CSR
+    matrix. Each row of this matrix is then handed to the VectorisedIssue of
+    the corresponding issue. Every row is again a 1xN sparse matrix, i.e. the
+    classifiers receive exactly the same input as with per-issue transformation.
+
+    If a vectorisation cache is given, the feature vectors of bodies found in
+    the cache are taken from there, and only the remaining bodies are
+    transformed (each distinct body once) and added to the cache afterwards.
+
+    Large batches are split across the processes of the vectorisation pool,
+    if enabled (see the parallel_vectorisation module).
+
+    Args:
+        vectoriser (Any): The fitted vectoriser of the worker.
+        issues (List[IndexedIssue]): The issues to be transformed.
+        vectorisation_cache (Optional[VectorisationCache], optional): The
+        vectorisation cache of the worker. Defaults to None.
+
+    Returns:
+        List[VectorisedIssue]: The transformed issues in the same order as the
+        input issues.
+    """
+    if not issues:
+        return []
+
+    issue_bodies: List[str] = [issue.body for issue in issues]
+    feature_vectors: List[Any]
+    if vectorisation_cache is None:
+        feature_vectors = split_csr_rows(
+            transform_issue_bodies(vectoriser, issue_bodies)
+        )
+    else:
+        keys: List[bytes] = [
+            vectorisation_cache.get_key(issue_body) for issue_body in issue_bodies
+        ]
+        cached_feature_vectors = vectorisation_cache.get_many(keys)
+
+        uncached_bodies: Dict[bytes, str] = {}
+        for key, issue_body in zip(keys, issue_bodies):
+            if key not in cached_feature_vectors:
+                uncached_bodies.setdefault(key, issue_body)
+        if uncached_bodies:
+            transformed_feature_vectors = dict(
+                zip(
+                    uncached_bodies.keys(),
+                    split_csr_rows(
+                        transform_issue_bodies(
+                            vectoriser, list(uncached_bodies.values())
+                        )
+                    ),
+                )
+            )
+            vectorisation_cache.put_many(transformed_feature_vectors)
+            cached_feature_vectors.update(transformed_feature_vectors)
+
+        feature_vectors = [cached_feature_vectors[key] for key in keys]
+
+    return [
+        VectorisedIssue(
+            body=feature_vector,
+            index=issue.index,
+            labels=list(issue.labels),
+            request_id=issue.request_id,
+            body_hash=issue.body_hash,
+            input_label_count=len(issue.labels),
+        )
+        for feature_vector, issue in zip(feature_vectors, issues)
+    ]
 
 
 def get_node(
@@ -86,6 +400,111 @@ def get_node(
     return current_node
 
 
+def inspect_classifier_concurrency() -> Optional[int]:
+    """Ask the running workers for the number of classifier processes.
+
+    The workers consuming from CLASSIFY_QUEUE are found with Celery's remote
+    control command active_queues, and the sizes of their pools are summed up
+    using the command stats.
+
+    Uses the following environment variables:
+        - CLASSIFY_QUEUE: The queue of the classifier workers.
+        - CLASSIFIER_INSPECT_TIMEOUT_S: How long to wait for replies of the
+        workers.
+
+    Returns:
+        Optional[int]: The total concurrency of all classifier workers, or None
+        if no classifier worker replied.
+    """
+    inspector = celery_app.control.inspect(timeout=CLASSIFIER_INSPECT_TIMEOUT_S)
+    active_queues: Dict[str, List[Dict[str, Any]]] = inspector.active_queues() or {}
+    classifier_workers: List[str] = [
+        worker_name
+        for worker_name, queues in active_queues.items()
+        if any(queue.get("name") == CLASSIFY_QUEUE for queue in queues)
+    ]
+    if not classifier_workers:
+        return None
+
+    worker_stats: Dict[str, Dict[str, Any]] = (
+        celery_app.control.inspect(
+            destination=classifier_workers, timeout=CLASSIFIER_INSPECT_TIMEOUT_S
+        ).stats()
+        or {}
+    )
+
+    return (
+        sum(
+            worker_stats.get(worker_name, {}).get("pool", {}).get("max-concurrency", 1)
+            for worker_name in classifier_workers
+        )
+        or None
+    )
+
+
+def _refresh_classifier_concurrency() -> None:
+    """Update the cached classifier concurrency. Runs in a background thread."""
+    global _classifier_concurrency, _classifier_concurrency_expiry
+    global _is_refreshing_classifier_concurrency, _is_split_plan_logged
+
+    try:
+        classifier_concurrency = inspect_classifier_concurrency()
+    except Exception:
+        logging.exception("Inspecting the classifier workers failed.")
+        classifier_concurrency = None
+
+    with _classifier_concurrency_lock:
+        if classifier_concurrency is not None:
+            _classifier_concurrency = classifier_concurrency
+        _classifier_concurrency_expiry = monotonic() + CLASSIFIER_CONCURRENCY_TTL_S
+        _is_refreshing_classifier_concurrency = False
+        _is_split_plan_logged = False
+
+
+def get_classifier_concurrency() -> Tuple[int, str]:
+    """Return the number of classifier processes available in the cluster.
+
+    The concurrency is inspected in a background thread every
+    CLASSIFIER_CONCURRENCY_TTL_S seconds (see inspect_classifier_concurrency),
+    so tasks never wait for the replies of the workers. Until the first
+    inspection has succeeded, the CPU count of the current machine is used.
+
+    Returns:
+        Tuple[int, str]: The concurrency, along with its source, i.e. either
+        "inspect" or "cpu_count" (without quotes).
+    """
+    global _is_refreshing_classifier_concurrency
+
+    with _classifier_concurrency_lock:
+        if (
+            monotonic() >= _classifier_concurrency_expiry
+            and not _is_refreshing_classifier_concurrency
+        ):
+            _is_refreshing_classifier_concurrency = True
+            threading.Thread(
+                target=_refresh_classifier_concurrency,
+                name="classifier_concurrency",
+                daemon=True,
+            ).start()
+        classifier_concurrency = _classifier_concurrency
+
+    if classifier_concurrency is None:
+        return cpu_count(), "cpu_count"
+
+    return classifier_concurrency, "inspect"
+
+
+def _is_first_split_since_refresh() -> bool:
+    """Return whether no split plan has been logged since the last refresh."""
+    global _is_split_plan_logged
+
+    with _classifier_concurrency_lock:
+        is_first_split: bool = not _is_split_plan_logged
+        _is_split_plan_logged = True
+
+    return is_first_split
+
+
 def determine_issues_per_worker(issues: List[Any]) -> int:
     """Return the number of issues that each worker should process per task.
 
@@ -94,6 +513,16 @@ def determine_issues_per_worker(issues: List[Any]) -> int:
     vector transformation has been done in order to determine how to split the
     tasks across the classifier worker(s).
 
+    The issues are split evenly across all classifier processes of the cluster
+    (see get_classifier_concurrency), while each task holds at least
+    CLASSIFY_CHUNK_MIN_ISSUES issues, so that small requests do not turn into
+    many tiny tasks, and at most CLASSIFY_CHUNK_MAX_ISSUES issues, so that no
+    single task takes overly long.
+
+    The resulting split plan is logged at INFO level for the first request
+    after each refresh of the classifier concurrency, and at DEBUG level for
+    all other requests.
+
     Args:
         issues (List[Any]): The issues to be sent to the classifiers after
         vector transformation.
@@ -101,7 +530,126 @@ def determine_issues_per_worker(issues: List[Any]) -> int:
     Returns:
         int: The number of issues per task.
     """
-    computer_core_count: int = cpu_count()
+    classifier_concurrency, concurrency_source = get_classifier_concurrency()
     total_issue_count: int = len(issues)
+    issues_per_task: int = max(
+        CLASSIFY_CHUNK_MIN_ISSUES,
+        min(
+            CLASSIFY_CHUNK_MAX_ISSUES,
+            ceil(total_issue_count / classifier_concurrency),
+        ),
+        1,
+    )
+    logging.log(
+        logging.INFO if _is_first_split_since_refresh() else logging.DEBUG,
+        "Splitting %d issues into %d tasks of up to %d issues for %d classifier "
+        "processes (from %s).",
+        total_issue_count,
+        ceil(total_issue_count / issues_per_task),
+        issues_per_task,
+        classifier_concurrency,
+        concurrency_source,
+    )
+
+    return issues_per_task
+
+
+@worker_process_init.connect
+def _start_metrics_server(**kwargs: Any) -> None:
+    """Serve the metrics of a child process of a prefork pool right after forking."""
+    start_metrics_server()
+
+
+@before_task_publish.connect
+def _add_task_headers(headers: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+    """Carry the time a task is sent and the active trace, if any, in its headers."""
+    if headers is None:
+        return
+
+    headers[ENQUEUED_AT_HEADER] = time()
+    trace_id: Optional[str] = get_trace_id()
+    if trace_id is not None:
+        headers[TRACE_ID_HEADER] = trace_id
+
+
+def _get_task_metric_labels(
+    task: Task, args: Optional[Tuple[Any, ...]], kwargs: Optional[Dict[str, Any]]
+) -> Tuple[str, str]:
+    """Return the name of a task and, for classify_issues, its node index."""
+    task_name: str = task.name.rsplit(".", 1)[-1]
+    if task_name != "classify_issues":
+        return task_name, ""
 
-    return ceil(total_issue_count / computer_core_count)
+    node_index: Any = (
+        args[1] if args and len(args) > 1 else (kwargs or {}).get("node_index", 1)
+    )
+
+    return task_name, str(node_index)
+
+
+def _get_task_issue_count(args: Optional[Tuple[Any, ...]]) -> Optional[int]:
+    """Return the number of issues passed to a task, if any."""
+    if not args or not isinstance(args[0], list):
+        return None
+
+    return len(args[0])
+
+
+@task_prerun.connect
+def _record_task_start(
+    task_id: str = "",
+    task: Optional[Task] = None,
+    args: Optional[Tuple[Any, ...]] = None,
+    kwargs: Optional[Dict[str, Any]] = None,
+    **signal_kwargs: Any,
+) -> None:
+    """Record the queue wait and the size of a task when it is started.
+
+    The metrics endpoint of the process is started along with its first task,
+    e.g. for workers running a solo pool. If the task belongs to a traced
+    request, the trace is active until the task has finished.
+    """
+    if task is None:
+        return
+
+    start_metrics_server()
+    set_trace_id(getattr(task.request, TRACE_ID_HEADER, None))
+    _task_start_times[task_id] = (time(), perf_counter())
+    labels = _get_task_metric_labels(task, args, kwargs)
+    enqueued_at: Optional[float] = getattr(task.request, ENQUEUED_AT_HEADER, None)
+    if enqueued_at is not None:
+        _task_queue_wait_seconds.observe(max(0.0, time() - enqueued_at), *labels)
+    issue_count: Optional[int] = _get_task_issue_count(args)
+    if issue_count is not None:
+        _task_issues.observe(issue_count, *labels)
+
+
+@task_postrun.connect
+def _record_task_end(
+    task_id: str = "",
+    task: Optional[Task] = None,
+    args: Optional[Tuple[Any, ...]] = None,
+    kwargs: Optional[Dict[str, Any]] = None,
+    **signal_kwargs: Any,
+) -> None:
+    """Record the processing time and the processed issues of a finished task."""
+    start: Optional[Tuple[float, float]] = _task_start_times.pop(task_id, None)
+    if task is None or start is None:
+        return
+
+    duration: float = perf_counter() - start[1]
+    labels = _get_task_metric_labels(task, args, kwargs)
+    log_span(
+        labels[0],
+        start[0],
+        duration,
+        node_index=labels[1] or None,
+        issues=_get_task_issue_count(args),
+    )
+    set_trace_id(None)
+    _task_seconds.observe(duration, *labels)
+    issue_count: Optional[int] = _get_task_issue_count(args)
+    if issue_count is not None:
+        _task_issues_total.inc(issue_count, *labels)
+        if duration > 0:
+            _task_issues_per_second.observe(issue_count / duration, *labels)
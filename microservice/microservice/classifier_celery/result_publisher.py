@@ -0,0 +1,311 @@
+"""Long-lived RabbitMQ publisher for the classification results.
+
+Instead of opening a new connection to RabbitMQ for every batch of results,
+each worker process keeps a single ResultPublisher with an open connection and
+channel. Should the connection break, e.g. since the broker restarted or the
+connection was closed due to missed heartbeats, the publisher reconnects and
+retries the publish.
+
+Optionally, the publisher can wait for publisher confirms, i.e. each publish
+only returns once RabbitMQ has acknowledged the message, and coalesce small
+result batches into a single message. Since results are sent as a JSON array
+of result objects, coalesced messages have the very same format as regular
+ones. Coalesced results are flushed at the end of every task, on the thread of
+the task (see helper_functions._flush_result_publisher), so they are sent
+before the task is acknowledged and never touch the connection from another
+thread.
+
+The counters of the publisher are exposed as metrics as well (see the metrics
+package).
+"""
+import logging
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+import ujson
+from pika import BasicProperties, BlockingConnection, ConnectionParameters
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.exceptions import AMQPError
+
+from microservice.metrics.registry import REGISTRY
+
+_published_messages_total = REGISTRY.counter(
+    "icm_result_publisher_messages_total", "Number of result messages sent."
+)
+_published_bytes_total = REGISTRY.counter(
+    "icm_result_publisher_bytes_total", "Total size of the sent result messages."
+)
+_coalesced_batches_total = REGISTRY.counter(
+    "icm_result_publisher_coalesced_batches_total",
+    "Number of result batches sent as part of a coalesced message.",
+)
+_reconnects_total = REGISTRY.counter(
+    "icm_result_publisher_reconnects_total",
+    "Number of times the connection to RabbitMQ was re-established.",
+)
+_failed_publishes_total = REGISTRY.counter(
+    "icm_result_publisher_failed_publishes_total",
+    "Number of failed attempts to publish results.",
+)
+_publish_seconds = REGISTRY.histogram(
+    "icm_result_publisher_publish_seconds", "Time spent on a single publish."
+)
+
+
+class PublisherStatistics:
+    """Counters of a ResultPublisher.
+
+    Attributes:
+        published_messages (int): The number of messages sent to RabbitMQ.
+        published_bytes (int): The total size of the sent message bodies.
+        coalesced_batches (int): The number of result batches which were
+        sent as part of a coalesced message.
+        reconnects (int): How often the connection had to be re-established.
+        failed_publishes (int): The number of failed publish attempts.
+        total_publish_seconds (float): The total time spent publishing.
+        max_publish_seconds (float): The longest time spent on a single publish.
+    """
+
+    def __init__(self) -> None:
+        """Initialise all counters with zero."""
+        self.published_messages: int = 0
+        self.published_bytes: int = 0
+        self.coalesced_batches: int = 0
+        self.reconnects: int = 0
+        self.failed_publishes: int = 0
+        self.total_publish_seconds: float = 0.0
+        self.max_publish_seconds: float = 0.0
+
+    def record_publish(self, message_size: int, duration: float) -> None:
+        """Record a successful publish.
+
+        Args:
+            message_size (int): The size of the message body in bytes.
+            duration (float): The time the publish took in seconds.
+        """
+        self.published_messages += 1
+        self.published_bytes += message_size
+        self.total_publish_seconds += duration
+        self.max_publish_seconds = max(self.max_publish_seconds, duration)
+        _published_messages_total.inc()
+        _published_bytes_total.inc(message_size)
+        _publish_seconds.observe(duration)
+
+    def record_coalesced_batches(self, batch_count: int) -> None:
+        """Record that result batches were sent as a single message.
+
+        Args:
+            batch_count (int): The number of batches of the message.
+        """
+        self.coalesced_batches += batch_count
+        _coalesced_batches_total.inc(batch_count)
+
+    def record_reconnect(self) -> None:
+        """Record that the connection had to be re-established."""
+        self.reconnects += 1
+        _reconnects_total.inc()
+
+    def record_failed_publish(self) -> None:
+        """Record a failed publish attempt."""
+        self.failed_publishes += 1
+        _failed_publishes_total.inc()
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the counters along with the mean publish latency.
+
+        Returns:
+            Dict[str, Any]: The counters by name.
+        """
+        statistics: Dict[str, Any] = dict(vars(self))
+        statistics["mean_publish_seconds"] = (
+            self.total_publish_seconds / self.published_messages
+            if self.published_messages
+            else 0.0
+        )
+
+        return statistics
+
+
+class ResultPublisher:
+    """Publisher keeping a single connection to RabbitMQ open.
+
+    A ResultPublisher is not to be shared between processes or threads, since
+    pika connections are not thread-safe. Its connection is created lazily on
+    the first publish, i.e. after a worker process has been forked.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        exchange_name: str,
+        exchange_type: str,
+        routing_key: str,
+        confirm_delivery: bool = False,
+        coalesce_max_bytes: int = 0,
+        max_attempts: int = 3,
+    ) -> None:
+        """Initialise the publisher without connecting to RabbitMQ yet.
+
+        Args:
+            host (str): Hostname of the running RabbitMQ instance.
+            exchange_name (str): The name of the exchange to publish to.
+            exchange_type (str): The type of the exchange to publish to.
+            routing_key (str): The routing key of the output queue.
+            confirm_delivery (bool, optional): Whether to wait for publisher
+            confirms. Defaults to False.
+            coalesce_max_bytes (int, optional): Result batches whose serialised
+            size is below this number of bytes are buffered and sent together
+            once the buffer is full or flush is called. 0 disables coalescing.
+            Defaults to 0.
+            max_attempts (int, optional): How often a publish is attempted
+            before giving up. Defaults to 3.
+        """
+        self._connection_parameters = ConnectionParameters(host=host)
+        self._exchange_name: str = exchange_name
+        self._exchange_type: str = exchange_type
+        self._routing_key: str = routing_key
+        self._confirm_delivery: bool = confirm_delivery
+        self._coalesce_max_bytes: int = coalesce_max_bytes
+        self._max_attempts: int = max_attempts
+
+        self._connection: Optional[BlockingConnection] = None
+        self._channel: Optional[BlockingChannel] = None
+        self._has_connected: bool = False
+        self._buffered_results: List[bytes] = []
+        self._buffered_bytes: int = 0
+
+        self.statistics = PublisherStatistics()
+
+    def _connect(self) -> BlockingChannel:
+        """Return an open channel, connecting to RabbitMQ if necessary.
+
+        Returns:
+            BlockingChannel: The open channel.
+        """
+        if self._channel is not None and self._channel.is_open:
+            return self._channel
+
+        self._disconnect()
+        if self._has_connected:
+            self.statistics.record_reconnect()
+            logging.warning("Reconnecting result publisher to RabbitMQ...")
+
+        self._connection = BlockingConnection(self._connection_parameters)
+        self._channel = self._connection.channel()
+        self._channel.exchange_declare(
+            exchange=self._exchange_name, exchange_type=self._exchange_type
+        )
+        if self._confirm_delivery:
+            self._channel.confirm_delivery()
+        self._has_connected = True
+        logging.info("Result publisher connected to RabbitMQ.")
+
+        return self._channel
+
+    def _disconnect(self) -> None:
+        """Close the connection to RabbitMQ, ignoring errors of broken connections."""
+        if self._connection is not None and self._connection.is_open:
+            try:
+                self._connection.close()
+            except AMQPError:
+                pass
+        self._connection = None
+        self._channel = None
+
+    def _publish_message(
+        self, message_body: bytes, properties: Optional[BasicProperties] = None
+    ) -> None:
+        """Publish a single message, reconnecting and retrying on failure.
+
+        Args:
+            message_body (bytes): The message body to be published.
+            properties (Optional[BasicProperties], optional): The AMQP
+            properties of the message. Defaults to None.
+
+        Raises:
+            AMQPError: If the message could not be published after
+            max_attempts attempts.
+        """
+        for attempt in range(1, self._max_attempts + 1):
+            start = perf_counter()
+            try:
+                channel = self._connect()
+                # Processes pending frames, e.g. a close sent by the broker while
+                # the connection was idle, before the message is handed over.
+                self._connection.process_data_events(time_limit=0)  # type: ignore
+                channel.basic_publish(
+                    exchange=self._exchange_name,
+                    routing_key=self._routing_key,
+                    body=message_body,
+                    properties=properties,
+                )
+            except AMQPError:
+                self.statistics.record_failed_publish()
+                self._disconnect()
+                logging.exception(
+                    "Publishing results failed (attempt "
+                    + str(attempt)
+                    + " of "
+                    + str(self._max_attempts)
+                    + ")."
+                )
+                if attempt == self._max_attempts:
+                    raise
+            else:
+                self.statistics.record_publish(
+                    len(message_body), perf_counter() - start
+                )
+                return
+
+    def publish(
+        self,
+        results: List[Dict[str, Any]],
+        properties: Optional[BasicProperties] = None,
+    ) -> None:
+        """Publish a batch of results as a JSON array.
+
+        If coalescing is enabled and the batch is small enough (and no
+        properties are given), the batch is buffered instead and sent along
+        with other buffered batches once the buffer is full or flush is called.
+
+        Args:
+            results (List[Dict[str, Any]]): The results to be published.
+            properties (Optional[BasicProperties], optional): The AMQP
+            properties of the message. Defaults to None.
+        """
+        message_body: bytes = ujson.dumps(results).encode("utf-8")
+
+        if (
+            properties is not None
+            or len(message_body) >= self._coalesce_max_bytes
+            or not results
+        ):
+            self.flush()
+            self._publish_message(message_body, properties)
+            return
+
+        self._buffered_results.append(message_body[1:-1])
+        self._buffered_bytes += len(message_body)
+        if self._buffered_bytes >= self._coalesce_max_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        """Send all buffered result batches as a single message."""
+        if not self._buffered_results:
+            return
+
+        message_body: bytes = b"[" + b",".join(self._buffered_results) + b"]"
+        self.statistics.record_coalesced_batches(len(self._buffered_results))
+        self._buffered_results = []
+        self._buffered_bytes = 0
+        self._publish_message(message_body)
+
+    def close(self) -> None:
+        """Flush all buffered results and close the connection."""
+        try:
+            self.flush()
+        finally:
+            self._disconnect()
+            logging.info(
+                "Result publisher closed. Statistics: " + str(self.statistics.as_dict())
+            )
@@ -0,0 +1,311 @@
+"""Compact, pickle-free serialiser for the messages of the Celery tasks.
+
+By default, Celery messages are serialised with pickle, which means that every
+VectorisedIssue is pickled along with its own sparse matrix. The issue_batch
+serialiser instead encodes all VectorisedIssue instances of a task as a single
+CSR matrix, i.e. three numpy buffers (data, indices and indptr), while the
+indices, labels, request IDs, body hashes and input label counts of the issues
+are encoded as JSON. IndexedIssue instances are encoded as JSON as well.
+
+A message consists of the length of its JSON header (4 bytes, little endian),
+the JSON header itself and the numpy buffers, each aligned to 8 bytes. On
+decoding, the numpy arrays are created as views of the message instead of
+copies, and the feature vector of each issue is a 1xN CSR matrix viewing its
+row of the buffers (see split_csr_rows). Since nothing but JSON and raw numeric
+buffers is decoded, the serialiser is safe to use with untrusted messages,
+unlike pickle. Malformed messages, e.g. truncated ones or those whose CSR
+buffers do not describe a valid matrix, are rejected with a ValueError.
+
+The serialiser is registered with kombu under the name issue_batch and used
+once CELERY_TASK_SERIALIZER is set to issue_batch (see celery_config.py).
+"""
+import struct
+from typing import Any, Dict, List, Tuple
+
+import numpy
+import ujson
+from kombu.serialization import register
+from microservice.models.feature_vectors import split_csr_rows, stack_feature_vectors
+from microservice.models.models import IndexedIssue, VectorisedIssue
+from scipy import sparse
+
+ISSUE_BATCH_SERIALISER_NAME: str = "issue_batch"
+ISSUE_BATCH_CONTENT_TYPE: str = "application/x-issue-batch"
+
+_HEADER_LENGTH = struct.Struct("<I")
+_BUFFER_ALIGNMENT: int = 8
+_VECTORISED_ISSUES_KEY: str = "__vectorised_issues__"
+_INDEXED_ISSUES_KEY: str = "__indexed_issues__"
+# Kinds of the numpy arrays in messages: booleans, integers and floats.
+_ARRAY_DTYPE_KINDS: str = "biuf"
+
+
+class _BufferWriter:
+    """Collects the numpy buffers of a message along with their offsets."""
+
+    def __init__(self) -> None:
+        self.buffers: List[bytes] = []
+        self.size: int = 0
+
+    def add(self, array: numpy.ndarray) -> Dict[str, Any]:
+        """Add an array and return its description for the JSON header.
+
+        Args:
+            array (numpy.ndarray): The array to be added.
+
+        Returns:
+            Dict[str, Any]: The offset, dtype and shape of the array.
+        """
+        padding: int = -self.size % _BUFFER_ALIGNMENT
+        if padding:
+            self.buffers.append(b"\0" * padding)
+            self.size += padding
+
+        description = {
+            "offset": self.size,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+        array_bytes: bytes = numpy.ascontiguousarray(array).tobytes()
+        self.buffers.append(array_bytes)
+        self.size += len(array_bytes)
+
+        return description
+
+
+def _read_array(buffers: memoryview, description: Dict[str, Any]) -> numpy.ndarray:
+    """Create a (read-only) view of an array in the buffers of a message.
+
+    Args:
+        buffers (memoryview): The buffer section of the message.
+        description (Dict[str, Any]): The description of the array.
+
+    Raises:
+        ValueError: If the array is not numeric or exceeds the buffers.
+
+    Returns:
+        numpy.ndarray: The array.
+    """
+    shape: Tuple[int, ...] = tuple(description["shape"])
+    dtype = numpy.dtype(description["dtype"])
+    if dtype.kind not in _ARRAY_DTYPE_KINDS or any(size < 0 for size in shape):
+        raise ValueError("Invalid array in issue_batch message")
+
+    return numpy.frombuffer(
+        buffers,
+        dtype=dtype,
+        count=int(numpy.prod(shape)),
+        offset=description["offset"],
+    ).reshape(shape)
+
+
+def _encode_vectorised_issues(
+    issues: List[VectorisedIssue], buffer_writer: _BufferWriter
+) -> Dict[str, Any]:
+    issue_bodies: List[Any] = [issue.body for issue in issues]
+    encoded_issues: Dict[str, Any] = {
+        "index": [issue.index for issue in issues],
+        "labels": [issue.labels for issue in issues],
+        "request_id": [issue.request_id for issue in issues],
+        "body_hash": [issue.body_hash for issue in issues],
+        "input_label_count": [issue.input_label_count for issue in issues],
+    }
+
+    feature_vectors = stack_feature_vectors(issue_bodies)
+    if sparse.issparse(feature_vectors):
+        encoded_issues["shape"] = list(feature_vectors.shape)
+        encoded_issues["data"] = buffer_writer.add(feature_vectors.data)
+        encoded_issues["indices"] = buffer_writer.add(feature_vectors.indices)
+        encoded_issues["indptr"] = buffer_writer.add(feature_vectors.indptr)
+    else:
+        encoded_issues["dense"] = buffer_writer.add(feature_vectors)
+
+    return encoded_issues
+
+
+def _decode_vectorised_issues(
+    encoded_issues: Dict[str, Any], buffers: memoryview
+) -> List[VectorisedIssue]:
+    issue_bodies: List[Any]
+    if "dense" in encoded_issues:
+        dense_feature_vectors = _read_array(buffers, encoded_issues["dense"])
+        issue_bodies = [
+            dense_feature_vectors[row_index : row_index + 1]
+            for row_index in range(dense_feature_vectors.shape[0])
+        ]
+    else:
+        feature_vectors = sparse.csr_matrix(
+            (
+                _read_array(buffers, encoded_issues["data"]),
+                _read_array(buffers, encoded_issues["indices"]),
+                _read_array(buffers, encoded_issues["indptr"]),
+            ),
+            shape=tuple(encoded_issues["shape"]),
+            copy=False,
+        )
+        # Out-of-range indices would make scipy read beyond the buffers.
+        feature_vectors.check_format(full_check=True)
+        issue_bodies = split_csr_rows(feature_vectors)
+
+    encoded_fields: List[List[Any]] = [
+        encoded_issues[field]
+        for field in (
+            "index",
+            "labels",
+            "request_id",
+            "body_hash",
+            "input_label_count",
+        )
+    ]
+    if any(len(values) != len(issue_bodies) for values in encoded_fields):
+        raise ValueError("Inconsistent number of issues in issue_batch message")
+
+    return [
+        VectorisedIssue(
+            index=index,
+            body=issue_body,
+            labels=labels,
+            request_id=request_id,
+            body_hash=body_hash,
+            input_label_count=input_label_count,
+        )
+        for index, issue_body, labels, request_id, body_hash, input_label_count in zip(
+            encoded_issues["index"],
+            issue_bodies,
+            encoded_issues["labels"],
+            encoded_issues["request_id"],
+            encoded_issues["body_hash"],
+            encoded_issues["input_label_count"],
+        )
+    ]
+
+
+def _encode_value(value: Any, buffer_writer: _BufferWriter) -> Any:
+    """Turn the given value into something that can be encoded as JSON.
+
+    Lists of VectorisedIssue and IndexedIssue instances are replaced by their
+    compact encodings, tuples are encoded as lists.
+
+    Args:
+        value (Any): The value to be encoded.
+        buffer_writer (_BufferWriter): The writer collecting numpy buffers.
+
+    Returns:
+        Any: The JSON-serialisable value.
+    """
+    if isinstance(value, (list, tuple)):
+        if value and all(isinstance(item, VectorisedIssue) for item in value):
+            return {
+                _VECTORISED_ISSUES_KEY: _encode_vectorised_issues(
+                    list(value), buffer_writer
+                )
+            }
+        if value and all(isinstance(item, IndexedIssue) for item in value):
+            return {
+                _INDEXED_ISSUES_KEY: [
+                    [
+                        issue.index,
+                        issue.body,
+                        issue.labels,
+                        issue.request_id,
+                        issue.body_hash,
+                    ]
+                    for issue in value
+                ]
+            }
+        return [_encode_value(item, buffer_writer) for item in value]
+    elif isinstance(value, dict):
+        return {key: _encode_value(item, buffer_writer) for key, item in value.items()}
+    else:
+        return value
+
+
+def _decode_value(value: Any, buffers: memoryview) -> Any:
+    """Reverse _encode_value.
+
+    Args:
+        value (Any): The value decoded from JSON.
+        buffers (memoryview): The buffer section of the message.
+
+    Returns:
+        Any: The decoded value.
+    """
+    if isinstance(value, list):
+        return [_decode_value(item, buffers) for item in value]
+    elif isinstance(value, dict):
+        if _VECTORISED_ISSUES_KEY in value:
+            return _decode_vectorised_issues(value[_VECTORISED_ISSUES_KEY], buffers)
+        if _INDEXED_ISSUES_KEY in value:
+            return [
+                IndexedIssue(
+                    index=index,
+                    body=body,
+                    labels=labels,
+                    request_id=request_id,
+                    body_hash=body_hash,
+                )
+                for index, body, labels, request_id, body_hash in value[
+                    _INDEXED_ISSUES_KEY
+                ]
+            ]
+        return {key: _decode_value(item, buffers) for key, item in value.items()}
+    else:
+        return value
+
+
+def dumps(message: Any) -> bytes:
+    """Serialise a message using the issue_batch format.
+
+    Args:
+        message (Any): The message, usually the (args, kwargs, embed) tuple of
+        a task.
+
+    Returns:
+        bytes: The serialised message.
+    """
+    buffer_writer = _BufferWriter()
+    header: bytes = ujson.dumps(_encode_value(message, buffer_writer)).encode("utf-8")
+    header_padding: bytes = b" " * (
+        -(_HEADER_LENGTH.size + len(header)) % _BUFFER_ALIGNMENT
+    )
+
+    return b"".join(
+        [_HEADER_LENGTH.pack(len(header) + len(header_padding)), header, header_padding]
+        + buffer_writer.buffers
+    )
+
+
+def loads(serialised_message: bytes) -> Any:
+    """Deserialise a message serialised with dumps.
+
+    Args:
+        serialised_message (bytes): The serialised message.
+
+    Raises:
+        ValueError: If the message is malformed.
+
+    Returns:
+        Any: The message. Tuples are returned as lists.
+    """
+    message_view = memoryview(serialised_message)
+    try:
+        (header_length,) = _HEADER_LENGTH.unpack_from(message_view)
+        header_end: int = _HEADER_LENGTH.size + header_length
+        if header_end > len(message_view):
+            raise ValueError("Truncated header")
+        header = ujson.loads(bytes(message_view[_HEADER_LENGTH.size : header_end]))
+
+        return _decode_value(header, message_view[header_end:])
+    except (struct.error, ValueError, KeyError, TypeError, IndexError) as error:
+        raise ValueError("Malformed issue_batch message: " + str(error)) from error
+
+
+def register_issue_batch_serialiser() -> None:
+    """Register the issue_batch serialiser with kombu."""
+    register(
+        ISSUE_BATCH_SERIALISER_NAME,
+        dumps,
+        loads,
+        content_type=ISSUE_BATCH_CONTENT_TYPE,
+        content_encoding="binary",
+    )
@@ -1,20 +1,54 @@
-"""Custom base task classes for the Celery tasks classify_issues and vectorise_issues.
+"""Custom base task classes for the Celery tasks of the microservice.
 
-This module contains the custom base task classes for classify_issues and
-vectorise_issues as defined in the module tasks. Using custom base task classes
-allows the instantiation and storage of the classifier tree and vectoriser for
-each of classify_issues and vectorise_issues respectively.
+This module contains the custom base task classes for classify_issues,
+vectorise_issues and vectorise_and_classify_issues as defined in the module
+tasks. Using custom base task classes allows the instantiation and storage of
+the classifier tree and vectoriser for each of classify_issues and
+vectorise_issues respectively, and of both for vectorise_and_classify_issues.
+
+Celery instantiates every registered task in every process using the app, so
+the task classes do not load their models on instantiation. Instead, each
+worker preloads the models of the tasks routed to the queues it consumes from
+(see preload_models), and any other model is only loaded on first use, e.g.
+with tasks run eagerly. With the prefork pool, the models are thus loaded once
+in the parent process of the worker before the child processes are forked, so
+that the children share the memory pages of the models instead of each holding
+a copy.
 """
-from typing import List, Optional
+import gc
+from os import getenv
+from time import perf_counter
+from typing import Any, Iterable, List, Optional
 
+from microservice.caching.result_cache import ResultCache, create_result_cache
+from microservice.caching.vectorisation_cache import (
+    VectorisationCache,
+    create_vectorisation_cache,
+)
 from microservice.config.classifier_config import Configuration
-from microservice.config.load_classifier import get_vectoriser
+from microservice.config.load_classifier import (
+    get_model_version,
+    get_vectoriser,
+    get_vectoriser_version,
+)
+from microservice.models.parallel_vectorisation import (
+    start_vectorisation_pool,
+    stop_vectorisation_pool,
+)
 from microservice.tree_logic.classifier_tree import ClassifyTree
+from scipy import sparse
 
 import logging
 from celery import Task
+from celery.signals import worker_init, worker_process_shutdown, worker_shutdown
 
 default_label_classes = Configuration().get_value_from_config("labelClasses")
+MODEL_WARM_UP: bool = getenv("MODEL_WARM_UP", "True").lower() == "true"
+
+_WARM_UP_ISSUE_BODY: str = (
+    "The application crashes with an error when the API is called. Please add"
+    " documentation for this feature."
+)
 
 
 class ClassifyTask(Task):
@@ -26,24 +60,45 @@ class ClassifyTask(Task):
     """
 
     _classify_tree: Optional[ClassifyTree] = None
+    _result_cache: Optional[ResultCache] = None
 
     def __init__(self, label_classes: List[str] = default_label_classes) -> None:
         """Initialise the classify_issues task class.
 
-        This is where an instance of ClassifyTree is created and kept during the
-        lifetime of the worker. Based on the provided label classes, the
+        The instance of ClassifyTree kept during the lifetime of the worker is
+        created on first access of classify_tree, unless it has been preloaded
+        (see preload_models). Based on the provided label classes, the
         classifier tree is automatically generated. The default value of
         label_classes is found in load_config.json under "labelClasses" (without
         quotes), but a custom set of label classes can be supplied as well. In
         this case, it is the duty of the user to ensure that corresponding
         classifiers exist for the custom label classes.
 
+        The classifier tree is stored on the ClassifyTask class itself, so that
+        every task class derived from it (in particular VectoriseClassifyTask)
+        shares the same instance instead of loading the classifiers again.
+
+        Along with the classifier tree, the result cache is created (see
+        create_result_cache), using the content hash of the trained
+        classifiers as its model version (see get_model_version).
+
+        Args:
+            label_classes (List[str], optional): The label classes to be used
+            for the classifiers. Defaults to default_label_classes.
+        """
+        self._label_classes: List[str] = label_classes
+
+    @staticmethod
+    def load_classify_tree(label_classes: List[str] = default_label_classes) -> None:
+        """Create the classifier tree unless it has been created already.
+
         Args:
             label_classes (List[str], optional): The label classes to be used
             for the classifiers. Defaults to default_label_classes.
         """
-        if self._classify_tree is None:
-            self._classify_tree = ClassifyTree(
+        if ClassifyTask._classify_tree is None:
+            ClassifyTask._result_cache = create_result_cache(get_model_version)
+            ClassifyTask._classify_tree = ClassifyTree(
                 label_classes,
             )
             logging.info(
@@ -57,8 +112,20 @@ class ClassifyTask(Task):
         Returns:
             ClassifyTree: The classifier tree.
         """
+        ClassifyTask.load_classify_tree(self._label_classes)
         return self._classify_tree
 
+    @property
+    def result_cache(self) -> Optional[ResultCache]:
+        """Getter for the result cache.
+
+        Returns:
+            Optional[ResultCache]: The result cache, or None if result caching
+            is disabled.
+        """
+        ClassifyTask.load_classify_tree(self._label_classes)
+        return self._result_cache
+
 
 class VectoriseTask(Task):
     """The vectoriser base task for vectorise_issues.
@@ -69,19 +136,34 @@ class VectoriseTask(Task):
     """
 
     _vectoriser: Optional[ClassifyTree] = None
+    _vectorisation_cache: Optional[VectorisationCache] = None
 
     def __init__(self) -> None:
         """Initialise the vectorise_issues task class.
 
-        This is where an instance of the vectoriser is created and kept during
-        the lifetime of the worker. The vectoriser is loaded with the help of
-        the get_vectoriser function in the load_classifier module. A custom
+        The vectoriser kept during the lifetime of the worker is loaded on first
+        access of vectoriser, unless it has been preloaded (see
+        preload_models). The vectoriser is loaded with the help of the
+        get_vectoriser function in the load_classifier module. A custom
         classifier can also be provided, in which case it is the duty of the
         user to ensure that the vectoriser is found in the proper path as
-        defined in the load_config.json file.
+        defined in the load_config.json file. As with ClassifyTask, the
+        vectoriser is stored on the class and thus shared by all derived task
+        classes.
+
+        Along with the vectoriser, the vectorisation cache is created (see
+        create_vectorisation_cache), keyed by the version of the loaded
+        vectoriser artifact.
         """
-        if self._vectoriser is None:
-            self._vectoriser = get_vectoriser()
+
+    @staticmethod
+    def load_vectoriser() -> None:
+        """Load the vectoriser unless it has been loaded already."""
+        if VectoriseTask._vectoriser is None:
+            VectoriseTask._vectoriser = get_vectoriser()
+            VectoriseTask._vectorisation_cache = create_vectorisation_cache(
+                get_vectoriser_version()
+            )
 
     @property
     def vectoriser(self):
@@ -90,4 +172,233 @@ class VectoriseTask(Task):
         Returns:
             Any: The vectoriser.
         """
+        VectoriseTask.load_vectoriser()
         return self._vectoriser
+
+    @property
+    def vectorisation_cache(self) -> Optional[VectorisationCache]:
+        """Getter for the vectorisation cache.
+
+        Returns:
+            Optional[VectorisationCache]: The vectorisation cache, or None if
+            caching is disabled.
+        """
+        VectoriseTask.load_vectoriser()
+        return self._vectorisation_cache
+
+
+class VectoriseClassifyTask(ClassifyTask, VectoriseTask):
+    """The combined base task for vectorise_and_classify_issues.
+
+    This task class holds both the vectoriser and the classifier tree, so that
+    a single worker can turn issue bodies into labels without handing the
+    feature vectors to another worker through RabbitMQ. As with ClassifyTask
+    and VectoriseTask, both are created exactly once per worker.
+    """
+
+    def __init__(self, label_classes: List[str] = default_label_classes) -> None:
+        """Initialise the vectorise_and_classify_issues task class.
+
+        Args:
+            label_classes (List[str], optional): The label classes to be used
+            for the classifiers. Defaults to default_label_classes.
+        """
+        ClassifyTask.__init__(self, label_classes=label_classes)
+        VectoriseTask.__init__(self)
+
+
+def get_preloaded_task_classes(worker: Any) -> List[type]:
+    """Return the base task classes whose models a worker is to preload.
+
+    These are the base classes of the tasks routed (see task_routes in
+    celery_config.py) to the queues the worker consumes from. A worker not
+    consuming from any of these queues, e.g. one started without -Q, may
+    receive any task, so it preloads the models of all task classes.
+
+    Args:
+        worker (Any): The worker sending the worker_init signal.
+
+    Returns:
+        List[type]: The base task classes, e.g. [ClassifyTask] for the
+        classifier workers.
+    """
+    consumed_queue_names: Iterable[str] = worker.app.amqp.queues.consume_from.keys()
+    task_classes: List[type] = [
+        type(worker.app.tasks[task_name]).__base__
+        for task_name, queue_name in worker.app.conf.task_routes.items()
+        if queue_name in consumed_queue_names
+    ]
+
+    return task_classes or [ClassifyTask, VectoriseTask]
+
+
+def _get_worker_role(classify_tree_loaded: bool, vectoriser_loaded: bool) -> str:
+    """Return the role of a worker, as logged, by the models it has loaded."""
+    if classify_tree_loaded and vectoriser_loaded:
+        return "pipeline"
+    if classify_tree_loaded:
+        return "classifier"
+    return "vectoriser"
+
+
+def _warm_up_models(warm_up_classify_tree: bool, warm_up_vectoriser: bool) -> List[str]:
+    """Run a dummy issue body through the loaded models.
+
+    The vectoriser transforms the dummy issue body, and every node of the
+    classifier tree classifies its feature vector. Without the vectoriser, i.e.
+    on classifier workers, the tree classifies an empty feature vector of the
+    width its classifiers expect instead, which takes the same code paths.
+
+    Args:
+        warm_up_classify_tree (bool): Whether the classifier tree is loaded.
+        warm_up_vectoriser (bool): Whether the vectoriser is loaded.
+
+    Returns:
+        List[str]: The warm-up time of each model, formatted for the log.
+    """
+    warm_up_timings: List[str] = []
+    feature_vectors: Any = None
+
+    if warm_up_vectoriser:
+        start = perf_counter()
+        feature_vectors = VectoriseTask._vectoriser.transform(  # type: ignore
+            [_WARM_UP_ISSUE_BODY]
+        )
+        warm_up_timings.append(
+            "vectoriser warm-up {:.3f}s".format(perf_counter() - start)
+        )
+
+    if warm_up_classify_tree:
+        classify_tree: ClassifyTree = ClassifyTask._classify_tree  # type: ignore
+        if feature_vectors is None:
+            feature_count: Optional[int] = classify_tree.get_feature_count()
+            if feature_count is None:
+                logging.warning(
+                    "Skipping the warm-up of the classifier tree, since the number"
+                    " of features of its classifiers is unknown."
+                )
+                return warm_up_timings
+            feature_vectors = sparse.csr_matrix((1, feature_count))
+
+        node_durations: List[float] = classify_tree.warm_up(feature_vectors)
+        warm_up_timings.extend(
+            "node {} warm-up {:.3f}s".format(node_index, duration)
+            for node_index, duration in enumerate(node_durations, start=1)
+        )
+
+    return warm_up_timings
+
+
+def preload_models(task_classes: List[type]) -> None:
+    """Load and warm up the models of the given task classes, then freeze the heap.
+
+    This runs in the worker_init signal, i.e. before the worker starts
+    consuming tasks, so that no request has to wait for the models to be
+    loaded. Only the models used by the tasks of the worker are loaded, i.e.
+    the classifier tree for ClassifyTask, the vectoriser for VectoriseTask and
+    both for VectoriseClassifyTask (see get_preloaded_task_classes). Unless
+    MODEL_WARM_UP is disabled, the loaded models are then warmed up (see
+    _warm_up_models), since the first call of each model is considerably
+    slower than the following ones. The statistics of early exit voting are
+    reset after the warm-up, before the heap is frozen (see
+    ClassifyTree.warm_up). The time spent loading each artifact (see
+    load_classifier.py) and warming up each model is logged along with the
+    role of the worker, i.e. classifier, vectoriser or pipeline.
+
+    The parent process of a prefork worker loads the models before forking its
+    child processes. Forked children share all memory pages of the parent
+    until a page is written to. Without further measures, this happens soon
+    for the pages of the models, since every garbage collection run of a child
+    updates the bookkeeping of all objects tracked by the garbage collector.
+    gc.freeze moves all objects existing at this point to a permanent
+    generation, which is never collected, so the model pages stay shared.
+
+    Large numpy arrays of the models can additionally be memory-mapped from
+    their files (see MODEL_MMAP_MODE in load_classifier.py), in which case
+    their pages are shared through the page cache of the operating system.
+
+    Finally, if the vectoriser is loaded, the processes transforming large
+    batches of issue bodies are forked, if enabled (see the
+    parallel_vectorisation module), which share the pages of the frozen
+    vectoriser the same way.
+
+    Args:
+        task_classes (List[type]): The base task classes of the tasks the
+        worker consumes.
+    """
+    preload_classify_tree: bool = any(
+        issubclass(task_class, ClassifyTask) for task_class in task_classes
+    )
+    preload_vectoriser: bool = any(
+        issubclass(task_class, VectoriseTask) for task_class in task_classes
+    )
+    boot_timings: List[str] = []
+    boot_start = perf_counter()
+
+    if preload_classify_tree:
+        start = perf_counter()
+        ClassifyTask.load_classify_tree()
+        boot_timings.append(
+            "classifier tree load {:.3f}s".format(perf_counter() - start)
+        )
+
+    if preload_vectoriser:
+        start = perf_counter()
+        VectoriseTask.load_vectoriser()
+        boot_timings.append("vectoriser load {:.3f}s".format(perf_counter() - start))
+
+    if MODEL_WARM_UP:
+        boot_timings.extend(
+            _warm_up_models(
+                warm_up_classify_tree=preload_classify_tree,
+                warm_up_vectoriser=preload_vectoriser,
+            )
+        )
+
+    gc.collect()
+    gc.freeze()
+    boot_timings.append("total {:.3f}s".format(perf_counter() - boot_start))
+    logging.info(
+        "Models preloaded for the "
+        + _get_worker_role(preload_classify_tree, preload_vectoriser)
+        + " worker: "
+        + ", ".join(boot_timings)
+        + "."
+    )
+    logging.info(
+        str(gc.get_freeze_count()) + " objects moved to the permanent generation."
+    )
+    if preload_vectoriser:
+        start_vectorisation_pool(VectoriseTask._vectoriser)
+
+
+@worker_init.connect
+def _preload_models_before_fork(sender: Any, **kwargs: Any) -> None:
+    """Preload the models of the worker's tasks in the parent process."""
+    preload_models(get_preloaded_task_classes(sender))
+
+
+@worker_shutdown.connect
+def _stop_vectorisation_pool(**kwargs: Any) -> None:
+    """Terminate the processes transforming large batches of issue bodies."""
+    stop_vectorisation_pool()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _log_voting_statistics(**kwargs: Any) -> None:
+    """Log how many ensemble member evaluations were skipped per tree node."""
+    if ClassifyTask._classify_tree is None:
+        return
+
+    for node_index, node in enumerate(
+        ClassifyTask._classify_tree.tree_node_generator(), start=1
+    ):
+        get_report = getattr(node.classifier, "get_report", None)
+        if get_report is not None:
+            logging.info(
+                "Early exit voting of node "
+                + str(node_index)
+                + ": "
+                + str(get_report())
+            )
@@ -3,97 +3,115 @@
 This module contains two tasks: classify_issues for classification of
 VectorisedIssue instances, and vectorise_issues for transformation of
 IndexedIssue instances (more precisely, their corresponding body attributes)
-into their feature vectors, on which basis classification takes place.
+into their feature vectors, on which basis classification takes place. In
+addition, vectorise_and_classify_issues combines both for workers running the
+fused pipeline.
 
-Both tasks inherit from base classes, namely ClassifyTask and VectoriseTask.
+The tasks inherit from base classes, namely ClassifyTask, VectoriseTask and
+VectoriseClassifyTask.
 This allows for maintaining a state of a task during runtime, in particular the
-ClassifyTree for classify_issues and vectoriser for vectorise_issues. As per
-Celery logic, the __init__ function of each task is executed only once for each
-worker, therefore the same instantiated classifiers and vectorisers are reused
-by each worker for each task call.
+ClassifyTree for classify_issues and vectoriser for vectorise_issues. The
+models are loaded only once for each worker (see the task_classes module),
+therefore the same instantiated classifiers and vectorisers are reused by each
+worker for each task call.
+
+Every task is sent with the AMQP priority of the task it was sent from, so the
+priority the gateway assigned to a request applies to all tasks of the request.
+
+Each task logs a single summary of the issues it processed. Since the issues
+themselves are never logged, logging costs the same regardless of the size of
+the feature vectors. Traced requests (see the tracing module) additionally log
+the sub-steps of the tasks as spans.
 """
 import logging
 from os import getenv
-from typing import List
+from time import perf_counter
+from typing import List, Optional
+
+from celery import Task
+from microservice.caching.vectorisation_cache import VectorisationCache
 from microservice.classifier_celery.celery import app as celery_app
 from microservice.classifier_celery.helper_functions import (
-    get_node,
     send_results_to_output,
     determine_issues_per_worker,
+    vectorise_issue_bodies,
+)
+from microservice.classifier_celery.task_classes import (
+    ClassifyTask,
+    VectoriseClassifyTask,
+    VectoriseTask,
 )
-from microservice.classifier_celery.task_classes import ClassifyTask, VectoriseTask
+from microservice.metrics.tracing import span
 from microservice.models.models import IndexedIssue, VectorisedIssue
-from microservice.tree_logic.classifier_tree import ClassifyTree
+from microservice.tree_logic.classifier_tree import (
+    ClassifyTree,
+    ClassifyTreeNodeEntry,
+)
 
-logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.DEBUG)
+LOG_LEVEL: str = getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(format="%(levelname)s:%(message)s", level=LOG_LEVEL)
 
 CLASSIFY_QUEUE: str = getenv("CLASSIFY_QUEUE", "classify_queue")
+CLASSIFY_TREE_MODE: str = getenv("CLASSIFY_TREE_MODE", "per_node")
+
+
+def _get_task_priority(task: Task) -> Optional[int]:
+    """Return the AMQP priority of the message of the task being executed.
+
+    Args:
+        task (Task): The task being executed.
+
+    Returns:
+        Optional[int]: The priority, or None if the message had none, e.g. if
+        priorities are disabled or the task is called directly.
+    """
+    delivery_info = task.request.delivery_info or {}
+
+    return delivery_info.get("priority")
 
 
 def _forward_issues(
+    classify_tree: ClassifyTree,
     node_index: int,
-    is_root_node: bool,
     is_leaf_node: bool,
     to_left_child: List[VectorisedIssue],
     to_right_child: List[VectorisedIssue],
+    priority: Optional[int] = None,
 ) -> None:
     """Forward the issues for further processing or to RabbitMQ back to the client.
 
     Depending on whether the forwarding node is a leaf node or not, the results
-    are forwarded either to the child nodes, or back to RabbitMQ.
+    are forwarded either to the child nodes, or back to RabbitMQ. The indices of
+    the child nodes are taken from the node table of the classifier tree (see
+    ClassifyTree.get_child_routes).
 
     Args:
+        classify_tree (ClassifyTree): The classifier tree of the worker.
         node_index (int): The index of the forwarding node in the tree.
         is_leaf_node (bool): Whether the forwarding node is a leaf node.
         to_left_child (List[VectorisedIssue]): The list of VectorisedIssue
         instances to be forwarded to the left child node (if such a node exists.)
         to_right_child (List[VectorisedIssue]): The list of VectorisedIssue
         instances to be forwarded to the right child node (if such a node exists.)
+        priority (Optional[int], optional): The priority of the tasks sent to
+        the child nodes. Defaults to None.
     """
     if is_leaf_node:
-        logging.info(
-            "Current node is a leaf node. Sending results back to output queue."
-        )
         aggregated_results: List[VectorisedIssue] = to_left_child + to_right_child
         if aggregated_results:
-            send_results_to_output(aggregated_results)
+            send_results_to_output(aggregated_results, classify_issues.result_cache)
         else:
-            logging.info("Results are empty. Nothing to send, nothing more to do...")
+            logging.debug("Leaf node %d has no results to send.", node_index)
     else:
-        logging.info(
-            "Current node is not a leaf node. Sending results to corresponding nodes."
-        )
-
-        if is_root_node:
-            logging.debug("Current node is the root node.")
-
-            left_child_index: int = 2 * node_index
-            right_child_index: int = 2 * node_index + 1
-            logging.debug("Left child index: " + str(left_child_index))
-            logging.debug("Right child index: " + str(right_child_index))
-
-            logging.debug("Sending issues to children now...")
-            if to_left_child:
-                classify_issues.signature(
-                    (to_left_child, left_child_index),
-                    queue=CLASSIFY_QUEUE,
-                ).delay()
-
-            if to_right_child:
-                classify_issues.signature(
-                    (to_right_child, right_child_index),
-                    queue=CLASSIFY_QUEUE,
-                ).delay()
-        else:
-            logging.debug("Current node is NOT the root node.")
-            child_index: int = 2 + node_index
-            to_child: List[VectorisedIssue] = to_left_child + to_right_child
-
-            if to_child:
-                logging.debug("Sending issue to single child now...")
-                classify_issues.signature(
-                    (to_child, child_index), queue=CLASSIFY_QUEUE
-                ).delay()
+        for child_index, to_child in classify_tree.get_child_routes(
+            node_index, to_left_child, to_right_child
+        ):
+            logging.debug(
+                "Sending %d issues to child node %d.", len(to_child), child_index
+            )
+            classify_issues.signature(
+                (to_child, child_index), queue=CLASSIFY_QUEUE, priority=priority
+            ).delay()
 
 
 @celery_app.task(base=ClassifyTask)
@@ -120,6 +138,21 @@ def classify_issues(issues: List[VectorisedIssue], node_index: int = 1) -> None:
     task is retried using another worker, which, under the assumption that every
     worker possesses its own ClassifyTree instance, is possible.
 
+    The above describes the default per-node mode. If the environment variable
+    CLASSIFY_TREE_MODE is set to "whole_tree" (without quotes), the task
+    instead walks the entire (sub)tree below the given node in-process using
+    ClassifyTree.classify and sends the final labels of all of its issues back
+    to RabbitMQ directly. This saves one round trip through the broker, along
+    with the (de)serialisation of the issues, per tree level, at the cost of
+    the tree levels no longer being spread across several workers.
+
+    In both modes, the chains of label nodes below the root node, whose
+    predictions do not depend on each other (see ClassifyTree.get_label_group),
+    are evaluated concurrently by a single task unless PARALLEL_LABEL_NODES is
+    disabled. Instead of one task per label class, a single task per knowledge
+    class thus attaches all labels, and the issues are forwarded from the last
+    node of the chain.
+
     In addition, the classify_issues task is set to a custom route, i.e.
     classify_issue tasks are routed to a specific queue as defined in
     celery_config.py. This allows for dedicated workers for classification are
@@ -132,40 +165,77 @@ def classify_issues(issues: List[VectorisedIssue], node_index: int = 1) -> None:
         node_index (int, optional): Index of classifier to be utilised for this
         specific call. If none is specified, the root node (with index 1) is assumed. Defaults to 1.
     """
-    logging.info("Current node index: " + str(node_index))
-    logging.info("Received issue for classification: " + str(issues))
-
+    start: float = perf_counter()
     classify_tree: ClassifyTree = classify_issues.classify_tree
-    max_node_index = classify_tree.get_node_count()
-    logging.info("Node count in classification tree: " + str(max_node_index))
 
-    current_node = get_node(node_index=node_index, classify_tree=classify_tree)
+    if CLASSIFY_TREE_MODE == "whole_tree":
+        results: List[VectorisedIssue] = classify_tree.classify(
+            issues, start_node_index=node_index
+        )
+        logging.info(
+            "Classified %d issues with the tree below node %d in %.1f ms.",
+            len(issues),
+            node_index,
+            (perf_counter() - start) * 1000,
+        )
+        if results:
+            send_results_to_output(results, classify_issues.result_cache)
+        return
 
     to_left_child: List[VectorisedIssue]
     to_right_child: List[VectorisedIssue]
-    to_left_child, to_right_child = current_node.classify(issues)
-    logging.info("Issues destined for the left node: " + str(to_left_child))
-    logging.info("Issues destined for the right node: " + str(to_right_child))
+    last_node_index, to_left_child, to_right_child = classify_tree.classify_label_group(
+        issues, node_index
+    )
+    node_entry: ClassifyTreeNodeEntry = classify_tree.get_node_entry(last_node_index)
+    logging.info(
+        "Classified %d issues with nodes %d to %d in %.1f ms: %d left, %d right.",
+        len(issues),
+        node_index,
+        last_node_index,
+        (perf_counter() - start) * 1000,
+        len(to_left_child),
+        len(to_right_child),
+    )
 
-    is_leaf_node: bool = not current_node.has_children()
-    is_root_node: bool = current_node.is_root_node()
     _forward_issues(
-        node_index=node_index,
-        is_root_node=is_root_node,
-        is_leaf_node=is_leaf_node,
+        classify_tree=classify_tree,
+        node_index=last_node_index,
+        is_leaf_node=node_entry.is_leaf_node,
         to_left_child=to_left_child,
         to_right_child=to_right_child,
+        priority=_get_task_priority(classify_issues),
     )
 
 
-def _forward_issues_to_classifiers(vectorised_issues: List[VectorisedIssue]) -> None:
+def _forward_issues_to_classifiers(
+    vectorised_issues: List[VectorisedIssue], priority: Optional[int] = None
+) -> None:
     issues_per_task: int = determine_issues_per_worker(vectorised_issues)
     chunks: List[List[VectorisedIssue]] = [
         vectorised_issues[x : x + issues_per_task]
         for x in range(0, len(vectorised_issues), issues_per_task)
     ]
     for chunk in chunks:
-        classify_issues.signature((chunk,), queue=CLASSIFY_QUEUE).delay()
+        classify_issues.signature(
+            (chunk,), queue=CLASSIFY_QUEUE, priority=priority
+        ).delay()
+
+
+def _log_vectorisation(
+    vectorised_issues: List[VectorisedIssue],
+    vectorisation_cache: Optional[VectorisationCache],
+    duration: float,
+) -> None:
+    logging.info(
+        "Transformed %d issues in %.1f ms.", len(vectorised_issues), duration * 1000
+    )
+    if vectorisation_cache is not None and logging.getLogger().isEnabledFor(
+        logging.DEBUG
+    ):
+        logging.debug(
+            "Vectorisation cache: %s", vectorisation_cache.statistics.as_dict()
+        )
 
 
 @celery_app.task(base=VectoriseTask)
@@ -179,7 +249,11 @@ def vectorise_issues(
     issue label(s) most suitable for that given issue.
 
     Since transformation only needs to take place once, an already transformed
-    issue will not be transfromed again.
+    issue will not be transfromed again. All issue bodies of a task are
+    transformed in a single call to the vectoriser (see vectorise_issue_bodies),
+    which is considerably faster than transforming each issue on its own.
+    Bodies whose feature vectors are found in the vectorisation cache of the
+    worker are not transformed at all.
 
     In addition, the vectorise_issues task is set to a custom route, i.e.
     vectorise_issues tasks are routed to a specific queue as defined in
@@ -193,22 +267,55 @@ def vectorise_issues(
     Returns:
         List[VectorisedIssue]: The transformed issues as as list of VectorisedIssue.
     """
-    vectorised_issues: List[VectorisedIssue] = []
+    start: float = perf_counter()
     vectoriser = vectorise_issues.vectoriser
+    vectorised_issues: List[VectorisedIssue] = vectorise_issue_bodies(
+        vectoriser=vectoriser,
+        issues=issues,
+        vectorisation_cache=vectorise_issues.vectorisation_cache,
+    )
+    _log_vectorisation(
+        vectorised_issues,
+        vectorise_issues.vectorisation_cache,
+        perf_counter() - start,
+    )
 
-    for current_issue in issues:
-        logging.info("Current issue to be transformed: " + str(current_issue))
-        current_issue_body = current_issue.body
-        vectorised_current_issue_body = vectoriser.transform([current_issue_body])
-        logging.debug("Transformed issue body: " + str(vectorised_current_issue_body))
+    _forward_issues_to_classifiers(
+        vectorised_issues=vectorised_issues,
+        priority=_get_task_priority(vectorise_issues),
+    )
 
-        vectorised_issue: VectorisedIssue = VectorisedIssue(
-            body=vectorised_current_issue_body,
-            index=current_issue.index,
-            labels=current_issue.labels,
-        )
-        logging.debug("Transformed issue: " + str(vectorised_issue))
 
-        vectorised_issues.append(vectorised_issue)
+@celery_app.task(base=VectoriseClassifyTask)
+def vectorise_and_classify_issues(issues: List[IndexedIssue]) -> None:
+    """Vectorise and classify the input issues within a single task.
+
+    This is the task of the fused pipeline. The issue bodies are transformed
+    just like in vectorise_issues, but instead of being forwarded to
+    classify_issues through RabbitMQ, the feature vectors are classified right
+    away by walking the entire classifier tree of the worker. The final labels
+    are then sent back to RabbitMQ.
+
+    The task is routed to its own queue as defined in celery_config.py, which
+    is consumed by workers holding both the vectoriser and the classifier tree.
+
+    Args:
+        issues (List[IndexedIssue]): The list of IndexedIssue to be classified.
+    """
+    start: float = perf_counter()
+    with span("vectorise", issues=len(issues)):
+        vectorised_issues: List[VectorisedIssue] = vectorise_issue_bodies(
+            vectoriser=vectorise_and_classify_issues.vectoriser,
+            issues=issues,
+            vectorisation_cache=vectorise_and_classify_issues.vectorisation_cache,
+        )
+    _log_vectorisation(
+        vectorised_issues,
+        vectorise_and_classify_issues.vectorisation_cache,
+        perf_counter() - start,
+    )
 
-    _forward_issues_to_classifiers(vectorised_issues=vectorised_issues)
+    classify_tree: ClassifyTree = vectorise_and_classify_issues.classify_tree
+    results: List[VectorisedIssue] = classify_tree.classify(vectorised_issues)
+    if results:
+        send_results_to_output(results, vectorise_and_classify_issues.result_cache)
@@ -21,11 +21,20 @@ task_routes = {
     "microservice.classifier_celery.tasks.vectorise_issues": getenv(
         "VECTORISE_QUEUE", "vectorise_queue"
     ),
+    "microservice.classifier_celery.tasks.vectorise_and_classify_issues": getenv(
+        "PIPELINE_QUEUE", "pipeline_queue"
+    ),
 }
 
-result_serializer = "pickle"
-task_serializer = "pickle"
-accept_content = ["pickle"]
+# Number of AMQP priority levels of the queues above (0 disables priorities).
+# Changing it requires deleting the queues, since RabbitMQ does not allow
+# redeclaring a queue with different arguments.
+task_queue_max_priority = int(getenv("REQUEST_MAX_PRIORITY", "0")) or None
+
+# Either pickle or issue_batch (see classifier_celery/serialisation.py)
+task_serializer = getenv("CELERY_TASK_SERIALIZER", "pickle")
+result_serializer = task_serializer
+accept_content = [task_serializer]
 
 task_acks_late = True
 task_ignore_result = True
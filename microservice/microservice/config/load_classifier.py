@@ -1,11 +1,30 @@
-from typing import List
+import hashlib
+import logging
+from os import getenv
+from pathlib import Path
+from time import perf_counter
+from typing import List, Optional, Tuple
 
 import joblib
 from microservice.config.classifier_config import Configuration
 
 config = Configuration()
+# Either tfidf (the fitted TfidfVectorizer and the classifiers trained against
+# it) or hashing (HashingTfidfVectoriser and the classifiers retrained against
+# it by tools/train_hashing_models.py, which live in a folder of their own).
+VECTORISER_MODE: str = getenv("VECTORISER_MODE", "tfidf")
 classifier_locations = config.get_value_from_config("classifier classifierLocations")
-root_folder = config.get_value_from_config("classifier path loadFolder")
+root_folder = config.get_value_from_config(
+    "classifier path hashingLoadFolder"
+    if VECTORISER_MODE == "hashing"
+    else "classifier path loadFolder"
+)
+# Either empty (load into memory) or a numpy.memmap mode such as "r". Only
+# takes effect for uncompressed files (see tools/uncompress_models.py).
+MODEL_MMAP_MODE: Optional[str] = getenv("MODEL_MMAP_MODE", "") or None
+
+_model_files_signature: Optional[Tuple[Tuple[str, int, int], ...]] = None
+_model_version: Optional[str] = None
 
 
 def get_classifier(labels: List[str]):
@@ -19,8 +38,10 @@ def get_classifier(labels: List[str]):
     _path: str = "{}/{}".format(root_folder, classifier_path)
     assert classifier_path is not None, "Labels: {}".format(labels)
 
-    classifier = joblib.load(_path)
+    start = perf_counter()
+    classifier = joblib.load(_path, mmap_mode=MODEL_MMAP_MODE)
     assert classifier is not None, "Classifier couldn't be loaded from {}".format(_path)
+    logging.info("Loaded {} in {:.3f}s".format(_path, perf_counter() - start))
 
     return classifier
 
@@ -28,19 +49,73 @@ def get_classifier(labels: List[str]):
 def get_voting_classifier():
     classifier_path = config.get_value_from_config("trainingConstants voting")
     path: str = "{}/{}".format(root_folder, classifier_path)
-    classifier = joblib.load(path)
+    classifier = joblib.load(path, mmap_mode=MODEL_MMAP_MODE)
 
     assert classifier is not None, "Classifier at {} couldn't be loaded".format(path)
 
     return classifier
 
 
+def get_vectoriser_path() -> str:
+    return config.get_value_from_config(
+        "vectorizer path hashingLoadPath"
+        if VECTORISER_MODE == "hashing"
+        else "vectorizer path loadPath"
+    )
+
+
 def get_vectoriser():
-    _vectoriser_path = config.get_value_from_config("vectorizer path loadPath")
-    vectoriser = joblib.load(_vectoriser_path)
+    _vectoriser_path = get_vectoriser_path()
+    start = perf_counter()
+    vectoriser = joblib.load(_vectoriser_path, mmap_mode=MODEL_MMAP_MODE)
 
     assert vectoriser is not None, "Vectoriser at {} couldn't be loaded".format(
         _vectoriser_path
     )
+    logging.info(
+        "Loaded {} in {:.3f}s".format(_vectoriser_path, perf_counter() - start)
+    )
 
     return vectoriser
+
+
+def get_vectoriser_version() -> str:
+    # Content hash of the vectoriser artifact, so that anything derived from
+    # its feature vectors can be told apart once a new vectoriser is deployed.
+    _vectoriser_path = get_vectoriser_path()
+    vectoriser_hash = hashlib.sha256()
+    with open(_vectoriser_path, "rb") as vectoriser_file:
+        for block in iter(lambda: vectoriser_file.read(1 << 20), b""):
+            vectoriser_hash.update(block)
+
+    return vectoriser_hash.hexdigest()[:16]
+
+
+def get_model_version() -> str:
+    # Content hash of all files under the load folder (classifiers, voting
+    # classifier and vectoriser). Since hashing reads every file, the hash is
+    # only recomputed once the size or modification time of a file changed.
+    global _model_files_signature, _model_version
+
+    model_files: List[Path] = sorted(
+        path for path in Path(root_folder).rglob("*") if path.is_file()
+    )
+    model_files_signature = tuple(
+        (
+            str(path.relative_to(root_folder)),
+            path.stat().st_size,
+            path.stat().st_mtime_ns,
+        )
+        for path in model_files
+    )
+    if model_files_signature != _model_files_signature:
+        model_hash = hashlib.sha256()
+        for path in model_files:
+            model_hash.update(str(path.relative_to(root_folder)).encode("utf-8"))
+            with open(path, "rb") as model_file:
+                for block in iter(lambda: model_file.read(1 << 20), b""):
+                    model_hash.update(block)
+        _model_files_signature = model_files_signature
+        _model_version = model_hash.hexdigest()[:16]
+
+    return _model_version  # type: ignore
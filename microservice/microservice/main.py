@@ -8,30 +8,107 @@ processing.
 
 Once classification is finished, they are returned by the leaf nodes of the
 classification tree back to RabbitMQ. Note that, in order to return results as
-soon as possible, classifications are not aggregated. Instead, they are returned
-back with their corresponding indices, which would serve in mapping the
-classifications to their respective issues.
+soon as possible, classifications are not aggregated by default. Instead, they
+are returned back with their corresponding indices, which would serve in mapping
+the classifications to their respective issues. If result aggregation is
+enabled (see the aggregation module), all results of a request are returned as
+a single message instead, carrying the correlation ID of the request. If the
+result cache is enabled (see the caching module), issues whose bodies have been
+classified before are answered by the client right away, and only the
+remaining issues are forwarded to Celery.
+
+By default, the client consumes requests one at a time over a blocking
+connection. With PIKA_GATEWAY_MODE set to "asyncio" (without quotes), the
+asyncio client below is used instead, which keeps up to PIKA_PREFETCH_COUNT
+requests in flight, deserialises and dispatches them concurrently in a thread
+pool and acknowledges each request only once it has been handed to Celery.
+
+Requests of at least REQUEST_STREAMING_MIN_BYTES bytes are parsed
+incrementally and handed to Celery in chunks of REQUEST_CHUNK_ISSUES issues as
+they are parsed, so large backfill requests neither have to be held in memory
+as a whole nor end up as a single huge task.
+
+If REQUEST_MAX_PRIORITY is set, requests are consumed and processed according to
+their AMQP priority, which is passed on to all of their Celery tasks. If fair
+scheduling is enabled (see the fair_scheduler module), the chunks of requests
+from different clients are handed to Celery in turns, so a single client
+sending a large backfill cannot hold up everyone else.
+
+If METRICS_PORT is set, the client exposes the processing time, queue wait,
+size and throughput of the requests it handles (see the metrics module). A
+sampled fraction of the requests is traced through the gateway and all workers
+(see the tracing module).
 
 This necessities the use of unique keys for each classification request. Failure
 to do so does not result in incorrect results, but could make it essentially
 impossible to correctly map the classification results back to the issue bodies.
 """
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from os import getenv
-from typing import Any, List, Optional
+from time import perf_counter, time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from uuid import uuid4
 
+import ujson
 from pika import ConnectionParameters
+from pika.adapters.asyncio_connection import AsyncioConnection
 from pika.adapters.blocking_connection import BlockingChannel, BlockingConnection
+from pika.channel import Channel
 from pika.spec import Basic, BasicProperties
-from pydantic.tools import parse_raw_as
 
-from microservice.classifier_celery.tasks import vectorise_issues
-from microservice.models.models import IndexedIssue
+from microservice.aggregation.result_aggregator import (
+    AggregatedResults,
+    ResultAggregator,
+    create_aggregation_store,
+)
+from microservice.batching.fair_scheduler import FairScheduler, create_fair_scheduler
+from microservice.batching.request_batcher import (
+    DispatchCallback,
+    DispatchGroup,
+    RequestBatcher,
+    create_request_batcher,
+)
+from microservice.caching.result_cache import (
+    ResultCache,
+    create_result_cache,
+    get_body_hash,
+)
+from microservice.classifier_celery.celery import app as celery_app
+from microservice.classifier_celery.tasks import (
+    vectorise_and_classify_issues,
+    vectorise_issues,
+)
+from microservice.config.load_classifier import get_model_version
+from microservice.models.issue_stream import (
+    count_json_array_elements,
+    iterate_indexed_issue_chunks,
+)
+from microservice.metrics.registry import (
+    ISSUE_COUNT_BUCKETS,
+    REGISTRY,
+    THROUGHPUT_BUCKETS,
+    start_metrics_server,
+)
+from microservice.metrics.tracing import log_span, sample_trace_id, span, use_trace
+from microservice.models.models import IndexedIssue, parse_indexed_issues
 
-logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.DEBUG)
+LOG_LEVEL: str = getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(format="%(levelname)s:%(message)s", level=LOG_LEVEL)
 
 # Environment variables used throughout this module
-PIKA_AUTO_ACK: bool = bool(getenv("PIKA_AUTO_ACK", True))
+PIKA_AUTO_ACK: bool = getenv("PIKA_AUTO_ACK", "True").lower() == "true"
+PIKA_PREFETCH_COUNT: int = int(getenv("PIKA_PREFETCH_COUNT", "32"))
+PIKA_GATEWAY_MODE: str = getenv("PIKA_GATEWAY_MODE", "blocking")
+PIKA_DISPATCH_THREADS: int = int(getenv("PIKA_DISPATCH_THREADS", "8"))
+REQUEST_STREAMING_MIN_BYTES: int = int(
+    getenv("REQUEST_STREAMING_MIN_BYTES", str(1024 * 1024))
+)
+REQUEST_CHUNK_ISSUES: int = int(getenv("REQUEST_CHUNK_ISSUES", "1000"))
+REQUEST_MAX_PRIORITY: int = int(getenv("REQUEST_MAX_PRIORITY", "0"))
+REQUEST_DEFAULT_PRIORITY: int = int(getenv("REQUEST_DEFAULT_PRIORITY", "0"))
 PIKA_INPUT_ROUTING_KEY: str = getenv(
     "PIKA_INPUT_ROUTING_KEY", "Classification.Classify"
 )
@@ -49,6 +126,36 @@ PIKA_OUTPUT_QUEUE_NAME: str = getenv(
 PIKA_RABBITMQ_HOST: str = getenv("PIKA_RABBITMQ_HOST", "localhost")
 CLASSIFY_QUEUE: str = getenv("CLASSIFY_QUEUE", "classify_queue")
 VECTORISE_QUEUE: str = getenv("VECTORISE_QUEUE", "vectorise_queue")
+PIPELINE_QUEUE: str = getenv("PIPELINE_QUEUE", "pipeline_queue")
+PIPELINE_TOPOLOGY: str = getenv("PIPELINE_TOPOLOGY", "split")
+RESULT_AGGREGATION_FLUSH_INTERVAL_S: float = float(
+    getenv("RESULT_AGGREGATION_FLUSH_INTERVAL_S", "1")
+)
+RESULT_CACHE_VERSION_CHECK_INTERVAL_S: float = float(
+    getenv("RESULT_CACHE_VERSION_CHECK_INTERVAL_S", "30")
+)
+
+_request_seconds = REGISTRY.histogram(
+    "icm_gateway_request_seconds",
+    "Time from taking up a request until all of its issues are dispatched in seconds.",
+)
+_request_queue_wait_seconds = REGISTRY.histogram(
+    "icm_gateway_request_queue_wait_seconds",
+    "Time between publishing a request (if timestamped) and receiving it in seconds.",
+)
+_request_issues = REGISTRY.histogram(
+    "icm_gateway_request_issues",
+    "Number of issues per request.",
+    buckets=ISSUE_COUNT_BUCKETS,
+)
+_request_issues_per_second = REGISTRY.histogram(
+    "icm_gateway_request_issues_per_second",
+    "Throughput of requests in issues per second.",
+    buckets=THROUGHPUT_BUCKETS,
+)
+_request_issues_total = REGISTRY.counter(
+    "icm_gateway_request_issues_total", "Number of issues of all requests."
+)
 
 
 class ICMPikaClient(object):
@@ -59,8 +166,15 @@ class ICMPikaClient(object):
 
     Default values for several configuration options, such as
     the host for the running RabbitMQ instance, can be found above.
+
+    Attributes:
+        auto_ack (bool): Whether requests are acknowledged on delivery rather
+        than once they have been handed to Celery. Always False if request
+        batching or fair scheduling is enabled (see _init_acknowledgements).
     """
 
+    auto_ack: bool = PIKA_AUTO_ACK
+
     def __init__(self) -> None:
         """Initialise the pika client.
 
@@ -70,12 +184,22 @@ class ICMPikaClient(object):
         3. Declares the input queue for the classification requests.
         4. Declares the output queue for the classification results.
         5. Binds the routing keys to the input and output queues.
+        6. Sets up the result aggregator, if result aggregation is enabled.
+        7. Sets up the result cache, if result caching is enabled.
+        8. Sets up the request batcher, if request batching is enabled.
+        9. Sets up the fair scheduler, if fair scheduling is enabled.
+        10. Decides whether requests are acknowledged on delivery.
         """
         self._init_connection()
         self._declare_exchange()
         self._declare_input_queue()
         self._declare_output_queue()
         self._bind_routing_keys_to_queues()
+        self._init_result_aggregator()
+        self._init_result_cache()
+        self._init_request_batcher()
+        self._init_fair_scheduler()
+        self._init_acknowledgements()
 
     def _init_connection(self) -> None:
         """Establish a connection to the RabbitMQ instance.
@@ -83,8 +207,10 @@ class ICMPikaClient(object):
         Uses the follwing environment variable:
             - PIKA_RABBITMQ_HOST: Hostname of the running RabbitMQ instance to connect to.
         """
-        connection = BlockingConnection(ConnectionParameters(host=PIKA_RABBITMQ_HOST))
-        self.channel: BlockingChannel = connection.channel()
+        self.connection = BlockingConnection(
+            ConnectionParameters(host=PIKA_RABBITMQ_HOST)
+        )
+        self.channel: BlockingChannel = self.connection.channel()
 
     def _declare_exchange(self) -> None:
         """Declare a RabbitMQ exchange for both classification requests and results.
@@ -114,9 +240,18 @@ class ICMPikaClient(object):
             - PIKA_IS_QUEUE_EXCLUSIVE: Whether the queue should be declared as
             exclusive,
             i.e. whether the queue can only be used by the channel of the declaring running pika client.
+            - REQUEST_MAX_PRIORITY: The highest AMQP priority of requests. If
+            greater than 0, the queue is declared as a priority queue, so that
+            requests of a higher priority are delivered first.
         """
         input_queue: Any = self.channel.queue_declare(
-            queue=PIKA_INPUT_QUEUE_NAME, durable=True
+            queue=PIKA_INPUT_QUEUE_NAME,
+            durable=True,
+            arguments=(
+                {"x-max-priority": REQUEST_MAX_PRIORITY}
+                if REQUEST_MAX_PRIORITY > 0
+                else None
+            ),
         )
         self.input_queue: Optional[str] = input_queue.method.queue
 
@@ -164,6 +299,307 @@ class ICMPikaClient(object):
                 routing_key=PIKA_OUTPUT_ROUTING_KEY,
             )
 
+    def _init_result_aggregator(self) -> None:
+        """Set up the result aggregator if result aggregation is enabled.
+
+        The gateway registers every request with the aggregator and regularly
+        flushes the results of requests which did not complete in time.
+        Aggregated results of these requests are published through the
+        channel of the gateway.
+        """
+        aggregation_store = create_aggregation_store(celery_app.conf.task_always_eager)
+        self.result_aggregator: Optional[ResultAggregator] = (
+            ResultAggregator(
+                aggregation_store, publish=self._publish_aggregated_results
+            )
+            if aggregation_store is not None
+            else None
+        )
+
+    def _publish_aggregated_results(
+        self, aggregated_results: AggregatedResults
+    ) -> None:
+        """Publish the aggregated results of a request to the output queue.
+
+        Args:
+            aggregated_results (AggregatedResults): The results to be published.
+        """
+        self._publish_results(
+            ujson.dumps(aggregated_results.results).encode("utf-8"),
+            BasicProperties(
+                correlation_id=aggregated_results.request_id,
+                headers={"complete": aggregated_results.complete},
+            ),
+        )
+
+    def _publish_results(self, body: bytes, properties: BasicProperties) -> None:
+        """Publish results to the output queue through the channel of the client.
+
+        Args:
+            body (bytes): The serialised results.
+            properties (BasicProperties): The properties of the message.
+        """
+        self.channel.basic_publish(
+            exchange=PIKA_EXCHANGE_NAME,
+            routing_key=PIKA_OUTPUT_ROUTING_KEY,
+            body=body,
+            properties=properties,
+        )
+
+    def _call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        """Schedule a callback on the connection of the client.
+
+        Args:
+            delay (float): The delay in seconds.
+            callback (Callable[[], None]): The callback to be called.
+        """
+        self.connection.call_later(delay, callback)
+
+    def _flush_expired_results(self) -> None:
+        """Flush the results of expired requests and schedule the next flush.
+
+        Exceptions are logged, and the next flush is scheduled in any case.
+        Otherwise, an exception would escape start_consuming and stop the
+        gateway, or, in the thread pool of the asynchronous client, be lost
+        along with all further flushes.
+
+        Uses the following environment variable:
+            - RESULT_AGGREGATION_FLUSH_INTERVAL_S: The interval in seconds at
+            which expired requests are flushed.
+        """
+        if self.result_aggregator is not None:
+            try:
+                self.result_aggregator.flush_expired()
+            except Exception:
+                logging.exception("Flushing expired requests failed.")
+            finally:
+                self._call_later(
+                    RESULT_AGGREGATION_FLUSH_INTERVAL_S, self._flush_expired_results
+                )
+
+    def _init_result_cache(self) -> None:
+        """Set up the result cache if result caching is enabled.
+
+        The model version of the cache is the content hash of the files under
+        trained_classifiers, which is checked for changes regularly (see
+        _check_model_version).
+        """
+        self.result_cache: Optional[ResultCache] = create_result_cache(
+            get_model_version
+        )
+
+    def _check_model_version(self) -> None:
+        """Update the model version of the result cache and schedule the next check.
+
+        Once the trained classifiers have changed, the labels cached for the
+        previous models are no longer looked up. As with
+        _flush_expired_results, exceptions are logged and the next check is
+        scheduled in any case, e.g. if the trained classifiers are being
+        replaced.
+
+        Uses the following environment variable:
+            - RESULT_CACHE_VERSION_CHECK_INTERVAL_S: The interval in seconds at
+            which the trained classifiers are checked for changes.
+        """
+        if self.result_cache is not None:
+            try:
+                model_version: str = get_model_version()
+                if model_version != self.result_cache.model_version:
+                    logging.info(
+                        "Trained classifiers changed. Using result cache version "
+                        + model_version
+                        + "."
+                    )
+                    self.result_cache.model_version = model_version
+            except Exception:
+                logging.exception("Checking the trained classifiers failed.")
+            finally:
+                self._call_later(
+                    RESULT_CACHE_VERSION_CHECK_INTERVAL_S, self._check_model_version
+                )
+
+    def _answer_cached_issues(
+        self, header_frame: BasicProperties, indexed_issues: List[IndexedIssue]
+    ) -> List[IndexedIssue]:
+        """Answer the issues whose labels are found in the result cache.
+
+        Every issue is tagged with the hash of its body, which the leaf nodes
+        use to cache its labels. The cache only holds the labels attached by
+        the classifier tree, so the labels sent along with each issue are put
+        in front of them, as the workers do. The results of cached issues are
+        then either handed to the result aggregator, or published right away as
+        a single message carrying the correlation ID of the request.
+
+        Args:
+            header_frame (BasicProperties): The properties of the request message.
+            indexed_issues (List[IndexedIssue]): The issues of the request.
+
+        Returns:
+            List[IndexedIssue]: The issues which still have to be classified.
+        """
+        if self.result_cache is None:
+            return indexed_issues
+
+        for indexed_issue in indexed_issues:
+            indexed_issue.body_hash = get_body_hash(indexed_issue.body)
+        cached_labels = self.result_cache.get_many(
+            [indexed_issue.body_hash for indexed_issue in indexed_issues]
+        )
+        if not cached_labels:
+            return indexed_issues
+
+        uncached_issues: List[IndexedIssue] = []
+        cached_results: List[Dict[str, Any]] = []
+        for indexed_issue in indexed_issues:
+            labels = cached_labels.get(indexed_issue.body_hash)  # type: ignore
+            if labels is None:
+                uncached_issues.append(indexed_issue)
+            else:
+                cached_results.append(
+                    {
+                        "index": indexed_issue.index,
+                        "labels": indexed_issue.labels + labels,
+                    }
+                )
+        logging.info("Answering %d issues from the result cache.", len(cached_results))
+
+        if self.result_aggregator is not None:
+            self.result_aggregator.add_results(
+                indexed_issues[0].request_id, cached_results  # type: ignore
+            )
+        else:
+            self._publish_results(
+                ujson.dumps(cached_results).encode("utf-8"),
+                BasicProperties(correlation_id=header_frame.correlation_id),
+            )
+
+        return uncached_issues
+
+    def _register_request(
+        self, header_frame: BasicProperties, issue_count: int
+    ) -> Optional[str]:
+        """Register the request with the result aggregator.
+
+        The correlation ID of the request is used as its request ID. If the
+        client did not set one, a random request ID is generated. Every issue
+        of the request is to be tagged with the request ID, so that its result
+        can be attributed to the request. This is also done if requests are
+        batched, so that the results of the requests of a batch can be told
+        apart.
+
+        Args:
+            header_frame (BasicProperties): The properties of the request message.
+            issue_count (int): The number of issues of the request.
+
+        Raises:
+            ValueError: If result aggregation is enabled and a request with the
+            same correlation ID is still pending. The request is then dropped
+            (see _settle_issue_request).
+
+        Returns:
+            Optional[str]: The request ID, or None if the issues do not need to
+            be tagged.
+        """
+        if self.result_aggregator is None and self.request_batcher is None:
+            return None
+
+        request_id: str = header_frame.correlation_id or uuid4().hex
+        if self.result_aggregator is not None:
+            self.result_aggregator.register_request(request_id, issue_count)
+
+        return request_id
+
+    def _get_request_priority(self, header_frame: BasicProperties) -> Optional[int]:
+        """Return the priority with which the tasks of a request are sent.
+
+        Uses the following environment variables:
+            - REQUEST_MAX_PRIORITY: The highest priority. 0 disables priorities.
+            - REQUEST_DEFAULT_PRIORITY: The priority of requests without one.
+
+        Args:
+            header_frame (BasicProperties): The properties of the request message.
+
+        Returns:
+            Optional[int]: The AMQP priority of the request, capped to
+            REQUEST_MAX_PRIORITY, or None if priorities are disabled.
+        """
+        if REQUEST_MAX_PRIORITY <= 0:
+            return None
+
+        priority: int = (
+            header_frame.priority
+            if header_frame.priority is not None
+            else REQUEST_DEFAULT_PRIORITY
+        )
+
+        return max(0, min(priority, REQUEST_MAX_PRIORITY))
+
+    def _get_client_id(self, header_frame: BasicProperties) -> str:
+        """Return the ID of the client a request came from.
+
+        The client is identified by the header client_id of the request
+        message, or else by its AMQP properties app_id or user_id. Requests
+        without any of them are attributed to the same anonymous client.
+
+        Args:
+            header_frame (BasicProperties): The properties of the request message.
+
+        Returns:
+            str: The ID of the client.
+        """
+        headers: Dict[str, Any] = header_frame.headers or {}
+
+        return str(
+            headers.get("client_id")
+            or header_frame.app_id
+            or header_frame.user_id
+            or ""
+        )
+
+    def _iterate_issue_chunks(
+        self, header_frame: BasicProperties, message_body: bytes
+    ) -> Iterator[List[IndexedIssue]]:
+        """Deserialise and register a request, handing out its issues in chunks.
+
+        Requests of at least REQUEST_STREAMING_MIN_BYTES bytes are parsed
+        incrementally, and handed out in chunks of at most REQUEST_CHUNK_ISSUES
+        issues as they are parsed (see iterate_indexed_issue_chunks). If result
+        aggregation is enabled, the number of issues of such a request has to
+        be known before its first chunk is dispatched, so the request is
+        scanned once beforehand. Smaller requests are parsed at once and handed
+        out as a single chunk.
+
+        Args:
+            header_frame (BasicProperties): The properties of the request message.
+            message_body (bytes): The body of the message.
+
+        Yields:
+            Iterator[List[IndexedIssue]]: The chunks of issues, tagged with the
+            request ID (see _register_request).
+        """
+        chunks: Iterable[List[IndexedIssue]]
+        if len(message_body) < REQUEST_STREAMING_MIN_BYTES:
+            indexed_issues: List[IndexedIssue] = self._deserialise_issue_request(
+                message_body=message_body
+            )
+            issue_count: int = len(indexed_issues)
+            chunks = [indexed_issues]
+        else:
+            logging.debug("Deserialising issues incrementally...")
+            issue_count = (
+                count_json_array_elements(message_body)
+                if self.result_aggregator is not None
+                else 0
+            )
+            chunks = iterate_indexed_issue_chunks(message_body, REQUEST_CHUNK_ISSUES)
+
+        request_id: Optional[str] = self._register_request(header_frame, issue_count)
+        for chunk in chunks:
+            if request_id is not None:
+                for indexed_issue in chunk:
+                    indexed_issue.request_id = request_id
+            yield chunk
+
     def _deserialise_issue_request(
         self,
         message_body: bytes,
@@ -180,23 +616,347 @@ class ICMPikaClient(object):
         classification results back to their original issues based on that id.
 
         Parsing is performed in two steps: the input is parsed from bytes into
-        JSON using json.loads, then the result is parsed into pydantic
-        IndexedIssue objects. Both of these operations are performed by the
-        single function call parse_raw_as, which acts as a wrapper for
-        json.loads and parse_raw.
+        JSON using json.loads, then each object is validated and turned into an
+        IndexedIssue. Both of these operations are performed by the single
+        function call parse_indexed_issues.
 
         Args: message_body (bytes): The input issue to be classified.
 
-        Returns: List[IndexedIssue]: The list of issues parsed as pydantic
+        Returns: List[IndexedIssue]: The list of issues parsed as
         IndexedIssues.
         """
-        logging.info("Deserialising issues...")
         indexed_issues: List[IndexedIssue] = []
-        indexed_issues = parse_raw_as(List[IndexedIssue], message_body)
-        logging.info("Issues deserialised successfully.")
+        indexed_issues = parse_indexed_issues(message_body)
 
         return indexed_issues
 
+    def _init_request_batcher(self) -> None:
+        """Set up the request batcher if request batching is enabled.
+
+        The issues of small requests are then collected into batches, which are
+        handed to Celery once they are large enough or once their oldest
+        request has waited long enough (see _flush_expired_batch).
+        """
+        self.request_batcher: Optional[RequestBatcher] = create_request_batcher(
+            self._dispatch_issues
+        )
+
+    def _flush_expired_batch(self) -> None:
+        """Dispatch the pending batch if it is due and schedule the next check.
+
+        The pending batch is checked twice per REQUEST_BATCH_MAX_WAIT_MS, so a
+        request waits at most one and a half times as long as configured. A
+        failed dispatch is logged and the next check is scheduled regardless,
+        so later batches are still dispatched (see _flush_expired_results).
+        """
+        if self.request_batcher is not None:
+            try:
+                self.request_batcher.flush_expired()
+            except Exception:
+                logging.exception("Dispatching the expired batch failed.")
+            finally:
+                self._call_later(
+                    self.request_batcher.max_wait_s / 2, self._flush_expired_batch
+                )
+
+    def _init_fair_scheduler(self) -> None:
+        """Set up the fair scheduler if fair scheduling is enabled.
+
+        The scheduler hands the chunks of the pending requests to Celery in
+        turns while the queue of the workers is short (see
+        _get_queued_tasks), and is pumped regularly while chunks are waiting
+        (see _pump_fair_scheduler).
+        """
+        self.fair_scheduler: Optional[FairScheduler] = create_fair_scheduler(
+            self._get_queued_tasks
+        )
+
+    def _init_acknowledgements(self) -> None:
+        """Acknowledge requests manually if they are held back in the gateway.
+
+        Batched requests wait in the gateway until their batch is dispatched,
+        and with fair scheduling, requests wait until all of their chunks have
+        been handed over in turns. Acknowledged on delivery, they would be lost
+        if the gateway crashed in the meantime, and the broker would deliver
+        any number of them to the gateway, which would hold all of them in
+        memory. PIKA_AUTO_ACK is thus overridden if request batching or fair
+        scheduling is enabled. Requests are then only acknowledged once they
+        have been handed to Celery (see _settle_issue_request), and at most
+        PIKA_PREFETCH_COUNT of them wait in the gateway.
+        """
+        if self.auto_ack and (
+            self.request_batcher is not None or self.fair_scheduler is not None
+        ):
+            logging.warning(
+                "PIKA_AUTO_ACK is ignored with request batching or fair "
+                "scheduling. Requests are acknowledged once they have been "
+                "handed to Celery."
+            )
+            self.auto_ack = False
+
+    def _get_queued_tasks(self) -> int:
+        """Return the number of tasks waiting for the first workers of the pipeline.
+
+        The message count of the queue is obtained by passively declaring the
+        queue over a connection of Celery's connection pool.
+
+        Returns:
+            int: The number of tasks waiting in VECTORISE_QUEUE, or in
+            PIPELINE_QUEUE with the fused topology. 0 if the queue does not
+            exist yet.
+        """
+        queue_name: str = (
+            PIPELINE_QUEUE if PIPELINE_TOPOLOGY == "fused" else VECTORISE_QUEUE
+        )
+        with celery_app.pool.acquire(block=True) as connection:
+            channel = connection.channel()
+            try:
+                return channel.queue_declare(
+                    queue=queue_name, passive=True
+                ).message_count
+            except connection.channel_errors:
+                return 0
+            finally:
+                channel.close()
+
+    def _pump_fair_scheduler(self) -> None:
+        """Hand waiting chunks to Celery if possible and schedule the next pump.
+
+        Exceptions are logged and the next pump is scheduled in any case, so a
+        single failure does not leave the remaining chunks waiting forever
+        (see _flush_expired_results).
+        """
+        if self.fair_scheduler is not None:
+            try:
+                self.fair_scheduler.pump()
+            except Exception:
+                logging.exception("Pumping the fair scheduler failed.")
+            finally:
+                self._call_later(
+                    self.fair_scheduler.interval_s, self._pump_fair_scheduler
+                )
+
+    def _dispatch_issues(
+        self, indexed_issues: List[IndexedIssue], priority: Optional[int] = None
+    ) -> None:
+        """Hand issues to Celery for classification.
+
+        Uses the following environment variables:
+            - PIPELINE_TOPOLOGY: Either "split" (without quotes), in which case
+            the issues are sent to the vectoriser workers, or "fused" (without
+            quotes), in which case they are sent to the pipeline workers, which
+            vectorise and classify them within a single task.
+            - VECTORISE_QUEUE: The queue to which the issues will be first sent
+            for the creation of feature vectors.
+            - CLASSIFY_QUEUE: The queue to which the feature vectors created
+            from the will be sent from the vectoriser to the classifiers.
+            - PIPELINE_QUEUE: The queue of the pipeline workers.
+
+        Args:
+            indexed_issues (List[IndexedIssue]): The issues to be classified.
+            priority (Optional[int], optional): The AMQP priority of the task.
+            Defaults to None.
+        """
+        if PIPELINE_TOPOLOGY == "fused":
+            vectorise_and_classify_issues.signature(
+                (indexed_issues,), queue=PIPELINE_QUEUE, priority=priority
+            ).apply_async()
+        else:
+            vectorise_issues.signature(
+                (indexed_issues,), queue=VECTORISE_QUEUE, priority=priority
+            ).apply_async()
+        logging.debug("Sent %d issues to Celery.", len(indexed_issues))
+
+    def _forward_issues(
+        self,
+        header_frame: BasicProperties,
+        indexed_issues: List[IndexedIssue],
+        on_dispatched: DispatchCallback,
+    ) -> None:
+        """Hand a chunk of issues of a request to Celery.
+
+        Issues whose labels are found in the result cache are answered right
+        away (see _answer_cached_issues), and only the remaining issues are
+        sent to Celery (see _dispatch_issues). If request batching is enabled,
+        the remaining issues are added to the pending batch instead. Either way,
+        the issues are sent with the priority of the request (see
+        _get_request_priority).
+
+        Args:
+            header_frame (BasicProperties): The properties of the request message.
+            indexed_issues (List[IndexedIssue]): The issues of the chunk.
+            on_dispatched (DispatchCallback): Called once the issues have been
+            handed to Celery. Not called if an exception is raised.
+        """
+        indexed_issues = self._answer_cached_issues(header_frame, indexed_issues)
+        priority: Optional[int] = self._get_request_priority(header_frame)
+        if not indexed_issues:
+            logging.info("All issues answered from the result cache.")
+            on_dispatched(None)
+        elif self.request_batcher is not None:
+            self.request_batcher.add(indexed_issues, on_dispatched, priority)
+        else:
+            self._dispatch_issues(indexed_issues, priority)
+            on_dispatched(None)
+
+    def _process_issue_request(
+        self,
+        header_frame: BasicProperties,
+        message_body: bytes,
+        on_dispatched: DispatchCallback,
+    ) -> None:
+        """Deserialise an issue classification request and hand it to Celery.
+
+        Each chunk of the request (see _iterate_issue_chunks) is forwarded as
+        soon as it has been parsed (see _iterate_dispatch_steps). If fair
+        scheduling is enabled, the request is submitted to the fair scheduler
+        instead, which forwards its chunks in turns with those of the requests
+        of other clients.
+
+        Args:
+            header_frame (BasicProperties): The properties of the request message.
+            message_body (bytes): The body of the message.
+            on_dispatched (DispatchCallback): Called once the issues have been
+            handed to Celery, with the exception raised on the way or None.
+        """
+        if header_frame.timestamp is not None:
+            # AMQP timestamps only have a resolution of seconds.
+            _request_queue_wait_seconds.observe(
+                max(0.0, time() - header_frame.timestamp)
+            )
+        steps: Iterator[None] = self._iterate_dispatch_steps(
+            header_frame, message_body, on_dispatched
+        )
+        if self.fair_scheduler is None:
+            for _ in steps:
+                pass
+        else:
+            self.fair_scheduler.submit(
+                self._get_client_id(header_frame),
+                self._get_request_priority(header_frame) or 0,
+                steps,
+            )
+
+    def _iterate_dispatch_steps(
+        self,
+        header_frame: BasicProperties,
+        message_body: bytes,
+        on_dispatched: DispatchCallback,
+    ) -> Iterator[None]:
+        """Forward the chunks of a request one at a time.
+
+        Each step forwards a single chunk (see _forward_issues) and parses the
+        next one, so the last step also finds out that the request is complete.
+        The request counts as dispatched once all of its chunks have been
+        dispatched. Should parsing fail part-way through a large request, the
+        chunks parsed before remain dispatched. The metrics of the request are
+        recorded from the first step on, i.e. with fair scheduling, they
+        include the time spent waiting for the turns of other requests.
+
+        If the request is traced, the trace is active while each chunk is
+        forwarded, so the tasks of the chunk carry its trace ID. Chunks which
+        are batched with other requests (see the request_batcher module) are
+        sent without a trace.
+
+        Args:
+            header_frame (BasicProperties): The properties of the request message.
+            message_body (bytes): The body of the message.
+            on_dispatched (DispatchCallback): Called once the issues have been
+            handed to Celery, with the exception raised on the way or None.
+
+        Yields:
+            Iterator[None]: Nothing, once after each but the last chunk.
+        """
+        start: float = perf_counter()
+        start_time: float = time()
+        trace_id: Optional[str] = sample_trace_id(header_frame.headers)
+        issue_count: int = 0
+        chunk_count: int = 0
+        dispatch_group = DispatchGroup(on_dispatched)
+        exception: Optional[BaseException] = None
+        try:
+            for chunk_index, indexed_issues in enumerate(
+                self._iterate_issue_chunks(header_frame, message_body)
+            ):
+                if chunk_index > 0:
+                    yield
+                issue_count += len(indexed_issues)
+                chunk_count += 1
+                with use_trace(trace_id), span(
+                    "dispatch_chunk", issues=len(indexed_issues)
+                ):
+                    self._forward_issues(
+                        header_frame, indexed_issues, dispatch_group.add_part()
+                    )
+        except Exception as processing_exception:
+            exception = processing_exception
+        dispatch_group.close(exception)
+
+        duration: float = perf_counter() - start
+        log_span(
+            "gateway",
+            start_time,
+            duration,
+            trace_id=trace_id,
+            correlation_id=header_frame.correlation_id,
+            issues=issue_count,
+            chunks=chunk_count,
+        )
+        logging.info(
+            "Dispatched %d issues of request %s in %d chunks in %.1f ms.",
+            issue_count,
+            header_frame.correlation_id,
+            chunk_count,
+            duration * 1000,
+        )
+        _request_seconds.observe(duration)
+        _request_issues.observe(issue_count)
+        _request_issues_total.inc(issue_count)
+        if duration > 0:
+            _request_issues_per_second.observe(issue_count / duration)
+
+    def _settle_issue_request(
+        self,
+        channel: Any,
+        method_frame: Basic.Deliver,
+        exception: Optional[BaseException],
+    ) -> None:
+        """Acknowledge or reject a request once it has been handed to Celery.
+
+        Malformed requests fail again however often they are delivered, so they
+        are dropped right away. Any other request is requeued once, e.g. if the
+        broker could not be reached by Celery, and dropped if it fails again.
+        If requests are acknowledged on delivery (see auto_ack), failures are
+        only logged.
+
+        Args:
+            channel (Any): The channel through which the request came.
+            method_frame (Basic.Deliver): The delivery of the request.
+            exception (Optional[BaseException]): The exception raised while
+            processing the request, or None if it succeeded.
+        """
+        if self.auto_ack:
+            if exception is not None:
+                logging.error("Processing issue request failed.", exc_info=exception)
+            return
+        if not channel.is_open:
+            # The broker delivers the request again on another channel.
+            logging.warning("Channel closed before the request could be settled.")
+            return
+
+        if exception is None:
+            channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+            return
+
+        requeue: bool = not method_frame.redelivered and not isinstance(
+            exception, ValueError
+        )
+        logging.error(
+            "Processing issue request failed. Requeueing: " + str(requeue),
+            exc_info=exception,
+        )
+        channel.basic_nack(delivery_tag=method_frame.delivery_tag, requeue=requeue)
+
     def _handle_issue_request(
         self,
         channel: BlockingChannel,
@@ -210,13 +970,12 @@ class ICMPikaClient(object):
         from JSON into Tuples. Each Tuple contains (1) the issue body, and (2)
         the ID of the issue. Both body and ID must be strings. The ID is chosen
         as a string to allow for different data types that may be used by
-        different services.
+        different services. The issues are then sent to Celery (see
+        _process_issue_request).
 
-        Uses the following environment variables:
-            - VECTORISE_QUEUE: The queue to which the issues will be first sent
-            for the creation of feature vectors.
-            - CLASSIFY_QUEUE: The queue to which the feature vectors created
-            from the will be sent from the vectoriser to the classifiers.
+        Unless PIKA_AUTO_ACK is enabled, the request is acknowledged once it
+        has been handed to Celery, and rejected if it could not be processed
+        (see _settle_issue_request).
 
         Args:
             channel (BlockingChannel): The pika BlockingChannel through which
@@ -229,15 +988,12 @@ class ICMPikaClient(object):
             mode, the priority, and the content encoding.
             message_body (bytes): The body of the message.
         """
-        indexed_issues: List[IndexedIssue] = self._deserialise_issue_request(
-            message_body=message_body
+        self._process_issue_request(
+            header_frame,
+            message_body,
+            partial(self._settle_issue_request, channel, method_frame),
         )
 
-        vectorise_issues.signature(
-            (indexed_issues,), queue=VECTORISE_QUEUE
-        ).apply_async()
-        logging.info("Issues sent to Celery for processing.")
-
     def start_consuming_issue_requests(self) -> None:
         """Begins consuming issue requests for processing.
 
@@ -246,19 +1002,194 @@ class ICMPikaClient(object):
         to the callback function handle_issue_request, which in turn passes the message using
         celery to its workers for processing.
 
-        Uses the following environment variable:
+        Uses the following environment variables:
             - PIKA_AUTO_ACK: Whether the client should acknowledge all incoming requests
             to inform the RabbitMQ instance of the successful reception of the message.
+            Otherwise, requests are acknowledged once they have been handed to Celery.
+            - PIKA_PREFETCH_COUNT: The maximum number of unacknowledged requests
+            delivered to the client, if PIKA_AUTO_ACK is disabled.
         """
+        if not self.auto_ack:
+            self.channel.basic_qos(prefetch_count=PIKA_PREFETCH_COUNT)
         self.channel.basic_consume(
             queue=self.input_queue,
             on_message_callback=self._handle_issue_request,
-            auto_ack=PIKA_AUTO_ACK,
+            auto_ack=self.auto_ack,
         )
+        self._flush_expired_results()
+        self._flush_expired_batch()
+        self._pump_fair_scheduler()
+        self._check_model_version()
         logging.info("Now consuming issue classification requests...")
         self.channel.start_consuming()
 
 
+class AsyncICMPikaClient(ICMPikaClient):
+    """Issue Classifier Microservice Pika RabbitMQ Client based on asyncio.
+
+    The blocking client handles one request at a time, so deserialising a
+    large request and handing it to Celery delays every request behind it. This
+    client consumes requests over a pika AsyncioConnection instead. Up to
+    PIKA_PREFETCH_COUNT requests are delivered at once, and each of them is
+    deserialised and sent to Celery in a thread pool of PIKA_DISPATCH_THREADS
+    threads, while the event loop keeps receiving further requests.
+
+    Requests are always acknowledged manually, once they have been handed to
+    Celery. Should the client crash, the requests still in flight are thus
+    delivered again rather than lost. A request which was handed to Celery
+    right before a crash may be classified twice, though.
+
+    The exchange and queues are declared over a blocking connection during
+    initialisation, exactly like by the blocking client. Everything touching
+    the asyncio connection or its channel runs on the event loop, so results
+    published from the thread pool (e.g. those of cached issues) are handed to
+    the event loop first.
+    """
+
+    auto_ack: bool = False
+
+    def __init__(self) -> None:
+        """Initialise the pika client.
+
+        Performs the initialisation of the blocking client, closes its
+        connection and sets up the event loop and the thread pool.
+        """
+        super().__init__()
+        self.connection.close()
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(
+            max_workers=PIKA_DISPATCH_THREADS, thread_name_prefix="gateway_dispatch"
+        )
+
+    def _publish_results(self, body: bytes, properties: BasicProperties) -> None:
+        self._loop.call_soon_threadsafe(
+            self._publish_results_on_channel, body, properties
+        )
+
+    def _publish_results_on_channel(
+        self, body: bytes, properties: BasicProperties
+    ) -> None:
+        if not self.channel.is_open:
+            logging.error("Channel closed. Results could not be published.")
+            return
+
+        super()._publish_results(body, properties)
+
+    def _call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        # The periodic callbacks access Redis and the file system, so they are
+        # run in the thread pool as well. They may reschedule themselves from
+        # there, hence the detour through call_soon_threadsafe.
+        self._loop.call_soon_threadsafe(
+            self._loop.call_later,
+            delay,
+            partial(self._loop.run_in_executor, self._executor, callback),
+        )
+
+    def _on_connection_open(self, connection: AsyncioConnection) -> None:
+        """Open a channel once the connection has been established.
+
+        Args:
+            connection (AsyncioConnection): The established connection.
+        """
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_closed(
+        self, connection: AsyncioConnection, reason: BaseException
+    ) -> None:
+        """Stop the event loop once the connection has been closed or lost.
+
+        Args:
+            connection (AsyncioConnection): The closed connection.
+            reason (BaseException): The reason the connection was closed.
+        """
+        logging.error("Connection to RabbitMQ closed: " + str(reason))
+        self._loop.stop()
+
+    def _on_channel_open(self, channel: Channel) -> None:
+        """Set the prefetch count of the channel once it has been opened.
+
+        Uses the following environment variable:
+            - PIKA_PREFETCH_COUNT: The maximum number of requests in flight.
+
+        Args:
+            channel (Channel): The opened channel.
+        """
+        self.channel = channel  # type: ignore
+        channel.basic_qos(
+            prefetch_count=PIKA_PREFETCH_COUNT, callback=self._on_prefetch_count_set
+        )
+
+    def _on_prefetch_count_set(self, method_frame: Any) -> None:
+        """Start consuming requests once the prefetch count has been set.
+
+        Args:
+            method_frame (Any): The Basic.QosOk frame of the broker.
+        """
+        self.channel.basic_consume(
+            queue=self.input_queue,
+            on_message_callback=self._handle_issue_request,
+            auto_ack=False,
+        )
+        self._flush_expired_results()
+        self._flush_expired_batch()
+        self._pump_fair_scheduler()
+        self._check_model_version()
+        logging.info(
+            "Now consuming issue classification requests with up to "
+            + str(PIKA_PREFETCH_COUNT)
+            + " requests in flight..."
+        )
+
+    def _handle_issue_request(
+        self,
+        channel: Channel,
+        method_frame: Basic.Deliver,
+        header_frame: BasicProperties,
+        message_body: bytes,
+    ) -> None:
+        """Hand an incoming issue classification request to the thread pool.
+
+        Args:
+            channel (Channel): The channel through which the request came.
+            method_frame (Basic.Deliver): The delivery of the request.
+            header_frame (BasicProperties): The properties of the request.
+            message_body (bytes): The body of the message.
+        """
+        self._executor.submit(
+            self._process_issue_request,
+            header_frame,
+            message_body,
+            partial(
+                self._loop.call_soon_threadsafe,
+                self._settle_issue_request,
+                channel,
+                method_frame,
+            ),
+        )
+
+    def start_consuming_issue_requests(self) -> None:
+        """Connect to RabbitMQ and run the event loop until the connection closes.
+
+        Uses the following environment variable:
+            - PIKA_RABBITMQ_HOST: Hostname of the running RabbitMQ instance to connect to.
+        """
+        asyncio.set_event_loop(self._loop)
+        self.connection = AsyncioConnection(
+            ConnectionParameters(host=PIKA_RABBITMQ_HOST),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_closed,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=self._loop,
+        )
+        try:
+            self._loop.run_forever()
+        finally:
+            self._executor.shutdown(wait=True)
+
+
 if __name__ == "__main__":
-    pika_client = ICMPikaClient()
+    start_metrics_server()
+    pika_client: ICMPikaClient = (
+        AsyncICMPikaClient() if PIKA_GATEWAY_MODE == "asyncio" else ICMPikaClient()
+    )
     pika_client.start_consuming_issue_requests()
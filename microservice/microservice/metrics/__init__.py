@@ -0,0 +1,6 @@
+"""The metrics module.
+
+Consists of the registry of the Prometheus-style metrics of a process, along
+with the HTTP endpoint exposing them, and of the sampled tracing of requests
+through the gateway and the workers.
+"""
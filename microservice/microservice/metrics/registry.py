@@ -0,0 +1,402 @@
+"""Prometheus-style metrics of the gateway and the workers.
+
+Each process of the microservice, i.e. the gateway and every process of a
+Celery worker doing actual work, records counters and histograms of its own, e.g.
+the processing time and size of every task. If METRICS_PORT is set, the
+metrics are exposed in the Prometheus text format under /metrics by an HTTP
+server running in a background thread of the process.
+
+Since several processes of a worker run within the same container, each
+process serves its metrics on its own port: The gateway and the main process
+of a worker use METRICS_PORT, and the child processes of a prefork pool use
+METRICS_PORT plus one plus the index of the child process, i.e. the port
+numbers are stable across restarts of child processes.
+
+The throughput of single tasks and requests is recorded in issues per second,
+while the overall throughput follows from the counters, e.g.
+rate(icm_task_issues_total[1m]).
+"""
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import getenv, getpid
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from billiard.process import current_process
+
+METRICS_PORT: int = int(getenv("METRICS_PORT", "0"))
+
+# Upper bounds of the buckets of histograms of durations in seconds, of numbers
+# of issues and of issues per second, respectively.
+DURATION_BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+ISSUE_COUNT_BUCKETS: Tuple[float, ...] = (
+    1,
+    2,
+    5,
+    10,
+    20,
+    50,
+    100,
+    200,
+    500,
+    1000,
+    2000,
+    5000,
+    10000,
+)
+
+THROUGHPUT_BUCKETS: Tuple[float, ...] = (
+    10,
+    50,
+    100,
+    500,
+    1000,
+    5000,
+    10000,
+    50000,
+    100000,
+)
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_server_pid: Optional[int] = None
+_metrics_server_lock = threading.Lock()
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if not label_names:
+        return ""
+
+    return (
+        "{"
+        + ",".join(
+            name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+            for name, value in zip(label_names, label_values)
+        )
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing count, e.g. of processed issues.
+
+    Attributes:
+        name (str): The name of the metric.
+        description (str): The help text of the metric.
+        label_names (Tuple[str, ...]): The names of the labels of the metric.
+    """
+
+    def __init__(
+        self, name: str, description: str, label_names: Sequence[str] = ()
+    ) -> None:
+        """Initialise the counter without any values.
+
+        Args:
+            name (str): The name of the metric.
+            description (str): The help text of the metric.
+            label_names (Sequence[str], optional): The names of the labels of
+            the metric. Defaults to ().
+        """
+        self.name: str = name
+        self.description: str = description
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        """Increase the counter of the given label values.
+
+        Args:
+            amount (float, optional): The amount to add. Defaults to 1.
+            label_values (str): The values of the labels in the order of
+            label_names.
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        """Return the lines of the metric in the Prometheus text format.
+
+        Returns:
+            List[str]: The lines of the metric.
+        """
+        lines: List[str] = [
+            "# HELP " + self.name + " " + self.description,
+            "# TYPE " + self.name + " counter",
+        ]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(
+                    self.name
+                    + _format_labels(self.label_names, label_values)
+                    + " "
+                    + _format_value(value)
+                )
+
+        return lines
+
+
+class Histogram:
+    """A distribution of observed values, e.g. of processing times.
+
+    Attributes:
+        name (str): The name of the metric.
+        description (str): The help text of the metric.
+        label_names (Tuple[str, ...]): The names of the labels of the metric.
+        buckets (Tuple[float, ...]): The upper bounds of the buckets.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> None:
+        """Initialise the histogram without any observations.
+
+        Args:
+            name (str): The name of the metric.
+            description (str): The help text of the metric.
+            label_names (Sequence[str], optional): The names of the labels of
+            the metric. Defaults to ().
+            buckets (Sequence[float], optional): The upper bounds of the
+            buckets in ascending order. Defaults to DURATION_BUCKETS.
+        """
+        self.name: str = name
+        self.description: str = description
+        self.label_names: Tuple[str, ...] = tuple(label_names)
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self._lock = threading.Lock()
+        # The count of each bucket (not cumulative, plus one for +Inf) and the
+        # sum of the observations by label values.
+        self._bucket_counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Record an observation for the given label values.
+
+        Args:
+            value (float): The observed value.
+            label_values (str): The values of the labels in the order of
+            label_names.
+        """
+        bucket_index: int = bisect_left(self.buckets, value)
+        with self._lock:
+            bucket_counts = self._bucket_counts.get(label_values)
+            if bucket_counts is None:
+                bucket_counts = self._bucket_counts[label_values] = [0] * (
+                    len(self.buckets) + 1
+                )
+                self._sums[label_values] = 0.0
+            bucket_counts[bucket_index] += 1
+            self._sums[label_values] += value
+
+    def render(self) -> List[str]:
+        """Return the lines of the metric in the Prometheus text format.
+
+        Returns:
+            List[str]: The lines of the metric.
+        """
+        lines: List[str] = [
+            "# HELP " + self.name + " " + self.description,
+            "# TYPE " + self.name + " histogram",
+        ]
+        label_names: Tuple[str, ...] = self.label_names + ("le",)
+        with self._lock:
+            for label_values, bucket_counts in sorted(self._bucket_counts.items()):
+                cumulative_count: int = 0
+                for upper_bound, bucket_count in zip(
+                    self.buckets + (float("inf"),), bucket_counts
+                ):
+                    cumulative_count += bucket_count
+                    lines.append(
+                        self.name
+                        + "_bucket"
+                        + _format_labels(
+                            label_names,
+                            label_values
+                            + (
+                                "+Inf"
+                                if upper_bound == float("inf")
+                                else _format_value(upper_bound),
+                            ),
+                        )
+                        + " "
+                        + str(cumulative_count)
+                    )
+                labels: str = _format_labels(self.label_names, label_values)
+                lines.append(
+                    self.name + "_sum" + labels + " " + repr(self._sums[label_values])
+                )
+                lines.append(
+                    self.name + "_count" + labels + " " + str(cumulative_count)
+                )
+
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of a process."""
+
+    def __init__(self) -> None:
+        """Initialise the registry without any metrics."""
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, object] = {}
+
+    def counter(
+        self, name: str, description: str, label_names: Sequence[str] = ()
+    ) -> Counter:
+        """Create and register a counter.
+
+        Args:
+            name (str): The name of the metric.
+            description (str): The help text of the metric.
+            label_names (Sequence[str], optional): The names of the labels of
+            the metric. Defaults to ().
+
+        Returns:
+            Counter: The registered counter.
+        """
+        counter = Counter(name, description, label_names)
+        with self._lock:
+            self._metrics[name] = counter
+
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> Histogram:
+        """Create and register a histogram.
+
+        Args:
+            name (str): The name of the metric.
+            description (str): The help text of the metric.
+            label_names (Sequence[str], optional): The names of the labels of
+            the metric. Defaults to ().
+            buckets (Sequence[float], optional): The upper bounds of the
+            buckets in ascending order. Defaults to DURATION_BUCKETS.
+
+        Returns:
+            Histogram: The registered histogram.
+        """
+        histogram = Histogram(name, description, label_names, buckets)
+        with self._lock:
+            self._metrics[name] = histogram
+
+        return histogram
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text format.
+
+        Returns:
+            str: The metrics, sorted by name.
+        """
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+
+        return (
+            "\n".join(line for metric in metrics for line in metric.render())  # type: ignore
+            + "\n"
+        )
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Handler serving the metrics of the registry under /metrics."""
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body: bytes = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        # Scrapes are frequent, so they are not logged.
+        pass
+
+
+def get_metrics_port() -> int:
+    """Return the port on which the current process serves its metrics.
+
+    Returns:
+        int: METRICS_PORT for the gateway and the main process of a worker,
+        and METRICS_PORT plus one plus the index of the process for the child
+        processes of a prefork pool.
+    """
+    process_index: Optional[int] = getattr(current_process(), "index", None)
+
+    return METRICS_PORT if process_index is None else METRICS_PORT + 1 + process_index
+
+
+def start_metrics_server() -> Optional[ThreadingHTTPServer]:
+    """Start serving the metrics of the current process, if not done yet.
+
+    Starting the server is attempted at most once per process. Child processes
+    forked after the server was started in their parent start a server of their
+    own.
+
+    Uses the following environment variable:
+        - METRICS_PORT: The base port of the metrics endpoints. 0 disables
+        them.
+
+    Returns:
+        Optional[ThreadingHTTPServer]: The server, or None if the endpoint is
+        disabled or could not be started.
+    """
+    global _metrics_server, _metrics_server_pid
+
+    if METRICS_PORT <= 0:
+        return None
+
+    with _metrics_server_lock:
+        if _metrics_server_pid == getpid():
+            return _metrics_server
+
+        port: int = get_metrics_port()
+        try:
+            metrics_server = ThreadingHTTPServer(("", port), _MetricsRequestHandler)
+        except OSError:
+            logging.exception("Metrics endpoint could not listen on port " + str(port))
+            _metrics_server, _metrics_server_pid = None, getpid()
+            return None
+
+        metrics_server.daemon_threads = True
+        threading.Thread(
+            target=metrics_server.serve_forever, name="metrics_server", daemon=True
+        ).start()
+        _metrics_server, _metrics_server_pid = metrics_server, getpid()
+        logging.info("Serving metrics on port " + str(port) + " under /metrics.")
+
+        return metrics_server
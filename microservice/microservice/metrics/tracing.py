@@ -0,0 +1,146 @@
+"""Sampled tracing of requests through the gateway and the workers.
+
+A fraction of TRACE_SAMPLE_RATE of all requests is traced end-to-end, along
+with every request whose message carries a trace_id header. The gateway assigns
+each traced request a trace ID, which is carried in the headers of all Celery
+tasks sent on behalf of the request: Whenever a task is sent while a trace is
+active (see use_trace), the task carries the trace ID of the active trace, and
+the trace is active while a traced task is executed. The tasks a traced task
+sends, i.e. those of the next nodes of the classifier tree, are thus traced as
+well.
+
+Each traced step, i.e. a span, is logged as a single line by the logger
+microservice.trace once it has finished, e.g.
+
+    trace_id=3f2a... span=classify_issues node_index=2 issues=100 start=...
+    duration_ms=12.345
+
+Since start is a Unix timestamp, the spans of a trace logged by different
+processes can be put in order by collecting the lines of all processes and
+sorting them by start. Requests which are not traced only cost a lookup of the
+active trace per span.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import getenv
+from random import random
+from time import perf_counter, time
+from typing import Any, Dict, Iterator, Optional
+from uuid import uuid4
+
+TRACE_SAMPLE_RATE: float = float(getenv("TRACE_SAMPLE_RATE", "0"))
+
+# Header of requests and tasks carrying the trace ID of traced requests.
+TRACE_ID_HEADER: str = "trace_id"
+
+_trace_logger = logging.getLogger("microservice.trace")
+_trace_id: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+
+
+def sample_trace_id(headers: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Decide whether a request is traced and return its trace ID if so.
+
+    Uses the following environment variable:
+        - TRACE_SAMPLE_RATE: The fraction of requests to trace, between 0 (the
+        default) and 1.
+
+    Args:
+        headers (Optional[Dict[str, Any]], optional): The headers of the
+        request message. A trace_id header forces the request to be traced
+        with the given trace ID. Defaults to None.
+
+    Returns:
+        Optional[str]: The trace ID, or None if the request is not traced.
+    """
+    if headers and headers.get(TRACE_ID_HEADER):
+        return str(headers[TRACE_ID_HEADER])
+    if TRACE_SAMPLE_RATE > 0 and random() < TRACE_SAMPLE_RATE:
+        return uuid4().hex
+
+    return None
+
+
+def get_trace_id() -> Optional[str]:
+    """Return the trace ID of the active trace, or None if there is none."""
+    return _trace_id.get()
+
+
+def set_trace_id(trace_id: Optional[str]) -> None:
+    """Activate the given trace in the current thread, or deactivate it with None."""
+    _trace_id.set(trace_id)
+
+
+@contextmanager
+def use_trace(trace_id: Optional[str]) -> Iterator[None]:
+    """Activate the given trace within the context.
+
+    Args:
+        trace_id (Optional[str]): The trace ID, or None to trace nothing.
+
+    Yields:
+        Iterator[None]: Nothing.
+    """
+    token = _trace_id.set(trace_id)
+    try:
+        yield
+    finally:
+        _trace_id.reset(token)
+
+
+def log_span(
+    name: str,
+    start: float,
+    duration: float,
+    trace_id: Optional[str] = None,
+    **fields: Any,
+) -> None:
+    """Log a finished span of the given or of the active trace, if any.
+
+    Args:
+        name (str): The name of the span, e.g. the name of a task.
+        start (float): The Unix timestamp at which the span started.
+        duration (float): The duration of the span in seconds.
+        trace_id (Optional[str], optional): The trace ID. Defaults to the
+        trace ID of the active trace.
+        fields (Any): Further values describing the span, e.g. the number of
+        issues. Fields which are None are left out.
+    """
+    trace_id = trace_id or _trace_id.get()
+    if trace_id is None or not _trace_logger.isEnabledFor(logging.INFO):
+        return
+
+    _trace_logger.info(
+        "trace_id=%s span=%s %sstart=%.6f duration_ms=%.3f",
+        trace_id,
+        name,
+        "".join(
+            key + "=" + str(value) + " "
+            for key, value in fields.items()
+            if value is not None
+        ),
+        start,
+        duration * 1000,
+    )
+
+
+@contextmanager
+def span(name: str, **fields: Any) -> Iterator[None]:
+    """Log the context as a span of the active trace, if any.
+
+    Args:
+        name (str): The name of the span.
+        fields (Any): Further values describing the span.
+
+    Yields:
+        Iterator[None]: Nothing.
+    """
+    if _trace_id.get() is None:
+        yield
+        return
+
+    start, start_counter = time(), perf_counter()
+    try:
+        yield
+    finally:
+        log_span(name, start, perf_counter() - start_counter, **fields)
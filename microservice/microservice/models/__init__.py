@@ -1 +1 @@
-"""The pydantic models module."""
+"""The models module."""
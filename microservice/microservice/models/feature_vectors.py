@@ -0,0 +1,104 @@
+"""Helpers for handling the feature vectors of VectorisedIssue instances.
+
+The body of a VectorisedIssue is a 1xN matrix, usually a scipy CSR matrix. Since
+feature vectors are transformed, classified and serialised per chunk of issues,
+they frequently have to be split into rows and stacked back together. The
+generic scipy functions for this (row indexing and sparse.vstack) validate and
+convert their inputs for every single row, which becomes the dominant cost for
+chunks of hundreds or thousands of issues. The helpers in this module work on
+the underlying CSR buffers directly instead.
+"""
+from typing import Any, List
+
+import numpy
+from scipy import sparse
+
+
+def split_csr_rows(feature_vectors: sparse.csr_matrix) -> List[sparse.csr_matrix]:
+    """Split a CSR matrix into 1xN CSR matrices, one per row.
+
+    Each row is created from slices of the buffers of the input matrix using
+    the CSR constructor with copy=False, which only runs its constant-time
+    checks. The constructor still copies such small slices of a larger buffer
+    (see csr_matrix.prune), so the data and indices of the row are pointed back
+    to the slices afterwards. The rows thus share their buffers with the input
+    matrix, e.g. with a message decoded by the issue_batch serialiser.
+
+    Args:
+        feature_vectors (sparse.csr_matrix): The matrix to be split.
+
+    Returns:
+        List[sparse.csr_matrix]: The rows of the matrix.
+    """
+    row_type = type(feature_vectors)
+    row_shape = (1, feature_vectors.shape[1])
+    data, indices, indptr = (
+        feature_vectors.data,
+        feature_vectors.indices,
+        feature_vectors.indptr,
+    )
+
+    rows: List[sparse.csr_matrix] = []
+    for row_index in range(feature_vectors.shape[0]):
+        row_start, row_end = indptr[row_index], indptr[row_index + 1]
+        row_data, row_indices = data[row_start:row_end], indices[row_start:row_end]
+        row = row_type(
+            (
+                row_data,
+                row_indices,
+                numpy.array([0, row_end - row_start], dtype=indptr.dtype),
+            ),
+            shape=row_shape,
+            copy=False,
+        )
+        row.data, row.indices = row_data, row_indices
+        rows.append(row)
+
+    return rows
+
+
+def stack_feature_vectors(feature_vectors: List[Any]) -> Any:
+    """Stack feature vectors into a single matrix, one row per feature vector.
+
+    CSR matrices are stacked by concatenating their buffers. Any other sparse
+    matrices are stacked using sparse.vstack, and dense feature vectors using
+    numpy.vstack.
+
+    Args:
+        feature_vectors (List[Any]): The feature vectors to be stacked. All of
+        them must have the same number of columns.
+
+    Returns:
+        Any: A CSR matrix if the feature vectors are sparse, otherwise a numpy
+        array.
+    """
+    if not all(sparse.issparse(feature_vector) for feature_vector in feature_vectors):
+        return numpy.vstack(feature_vectors)
+    if any(feature_vector.format != "csr" for feature_vector in feature_vectors):
+        return sparse.vstack(feature_vectors, format="csr")
+
+    row_counts = numpy.array(
+        [feature_vector.shape[0] for feature_vector in feature_vectors]
+    )
+    nnz_counts = numpy.array([feature_vector.nnz for feature_vector in feature_vectors])
+    nnz_offsets = numpy.repeat(numpy.cumsum(nnz_counts) - nnz_counts, row_counts)
+    indptr = numpy.zeros(int(row_counts.sum()) + 1, dtype=numpy.int64)
+    indptr[1:] = (
+        numpy.concatenate(
+            [feature_vector.indptr[1:] for feature_vector in feature_vectors]
+        )
+        + nnz_offsets
+    )
+
+    return sparse.csr_matrix(
+        (
+            numpy.concatenate(
+                [feature_vector.data for feature_vector in feature_vectors]
+            ),
+            numpy.concatenate(
+                [feature_vector.indices for feature_vector in feature_vectors]
+            ),
+            indptr,
+        ),
+        shape=(len(indptr) - 1, feature_vectors[0].shape[1]),
+    )
@@ -0,0 +1,129 @@
+"""A TF-IDF vectoriser without a vocabulary.
+
+The trained vectoriser is a fitted TfidfVectorizer with (1,2)-grams, whose
+vocabulary maps every uni- and bigram seen during training to its column. The
+vocabulary is a dict of millions of strings, which is slow to unpickle, cannot
+be memory-mapped and thus takes up memory in every vectoriser process.
+
+HashingTfidfVectoriser produces the same kind of feature vectors, i.e. the
+l2-normalised TF-IDF weights of the (1,2)-grams of an issue body, but hashes
+each n-gram into a fixed number of columns instead of looking it up. The only
+fitted state is the IDF of each column, stored as a dense numpy array, which
+loads in an instant and is shared through the page cache with MODEL_MMAP_MODE.
+Distinct n-grams may share a column, which the classifiers have to be retrained
+against (see tools/train_hashing_models.py).
+"""
+from typing import Iterable, Optional, Tuple
+
+import numpy
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+# Besides the IDF weights, the number of columns determines the size of the
+# weights of the linear members of the ensembles, so it trades collisions of
+# n-grams against the memory of the classifiers.
+DEFAULT_FEATURE_COUNT: int = 2**18
+
+
+class HashingTfidfVectoriser:
+    """TF-IDF vectoriser hashing n-grams into a fixed number of columns.
+
+    The tokenisation and weighting follow the defaults of TfidfVectorizer, i.e.
+    lowercased word tokens of at least two characters, raw term counts, smooth
+    IDF weights and l2 normalisation, so the retrained classifiers see feature
+    vectors of the same scale as before.
+
+    Attributes:
+        ngram_range (Tuple[int, int]): The lower and upper bound of the lengths
+        of the n-grams.
+        n_features (int): The number of columns of the feature vectors.
+        idf_ (Optional[numpy.ndarray]): The IDF weight of each column once
+        fitted, or None before.
+    """
+
+    def __init__(
+        self,
+        ngram_range: Tuple[int, int] = (1, 2),
+        n_features: int = DEFAULT_FEATURE_COUNT,
+    ) -> None:
+        """Initialise the vectoriser without IDF weights.
+
+        Args:
+            ngram_range (Tuple[int, int], optional): The lower and upper bound
+            of the lengths of the n-grams. Defaults to (1, 2).
+            n_features (int, optional): The number of columns of the feature
+            vectors. Defaults to DEFAULT_FEATURE_COUNT.
+        """
+        self.ngram_range: Tuple[int, int] = ngram_range
+        self.n_features: int = n_features
+        self.idf_: Optional[numpy.ndarray] = None
+
+    def _get_hasher(self) -> HashingVectorizer:
+        # The hasher holds no state besides its parameters, so it is created on
+        # demand rather than pickled along with the IDF weights.
+        return HashingVectorizer(
+            ngram_range=self.ngram_range,
+            n_features=self.n_features,
+            alternate_sign=False,
+            norm=None,
+        )
+
+    def _count_terms(self, raw_documents: Iterable[str]) -> sparse.csr_matrix:
+        term_counts: sparse.csr_matrix = self._get_hasher().transform(raw_documents)
+        term_counts.sum_duplicates()
+
+        return term_counts
+
+    def fit(self, raw_documents: Iterable[str]) -> "HashingTfidfVectoriser":
+        """Fit the IDF weight of each column on the given documents.
+
+        Args:
+            raw_documents (Iterable[str]): The training documents.
+
+        Returns:
+            HashingTfidfVectoriser: The vectoriser itself.
+        """
+        term_counts = self._count_terms(raw_documents)
+        document_count: int = term_counts.shape[0]
+        document_frequencies = numpy.bincount(
+            term_counts.indices, minlength=self.n_features
+        )
+        self.idf_ = (
+            numpy.log((1 + document_count) / (1 + document_frequencies)) + 1
+        ).astype(numpy.float32)
+
+        return self
+
+    def transform(self, raw_documents: Iterable[str]) -> sparse.csr_matrix:
+        """Transform the given documents into their feature vectors.
+
+        Args:
+            raw_documents (Iterable[str]): The documents, e.g. issue bodies.
+
+        Raises:
+            ValueError: If the vectoriser has not been fitted.
+
+        Returns:
+            sparse.csr_matrix: The feature vectors, one row per document.
+        """
+        if self.idf_ is None:
+            raise ValueError("HashingTfidfVectoriser has not been fitted")
+
+        feature_vectors = self._count_terms(raw_documents)
+        feature_vectors.data *= self.idf_[feature_vectors.indices]
+
+        return normalize(feature_vectors, copy=False)
+
+    def fit_transform(self, raw_documents: Iterable[str]) -> sparse.csr_matrix:
+        """Fit the vectoriser and transform the given documents.
+
+        Args:
+            raw_documents (Iterable[str]): The training documents.
+
+        Returns:
+            sparse.csr_matrix: The feature vectors, one row per document.
+        """
+        raw_documents = list(raw_documents)
+
+        return self.fit(raw_documents).transform(raw_documents)
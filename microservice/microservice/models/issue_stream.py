@@ -0,0 +1,209 @@
+"""Incremental deserialisation of large classification requests.
+
+A classification request is a JSON array of issues. Parsed with
+parse_indexed_issues, the whole array is first turned into Python objects and
+then into IndexedIssue instances, all of which are kept alive until the request
+has been handed to Celery as a single task. For backfill requests of tens of thousands of issues,
+this causes a large memory spike in the gateway, and a single vectoriser has to
+process the whole request on its own.
+
+The helpers in this module parse the array one element at a time instead, and
+hand out the issues in chunks of bounded size. Each chunk can be sent to Celery
+before the next one is parsed, so only a single chunk of IndexedIssue instances
+exists at any time, and the chunks are spread across the vectoriser workers.
+The message body is decoded into text one window of bytes at a time as well,
+so besides the message body itself, only the text of the current window is
+held, instead of a decoded copy of the whole body (up to four times its size).
+"""
+import codecs
+import json
+import re
+from typing import Any, Iterator, List
+
+from microservice.models.models import IndexedIssue
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters which may continue a number decoded at the end of the window.
+_NUMBER_CONTINUATION = re.compile(r"[0-9.eE+-]*\Z")
+_DECODER = json.JSONDecoder()
+# Number of bytes of the message body decoded at a time.
+_WINDOW_BYTES: int = 64 * 1024
+
+
+class _TextWindow:
+    """The text of a JSON message body, decoded one window of bytes at a time.
+
+    The window holds the text from the current position on. Text before the
+    current position is dropped whenever the next window of bytes is decoded.
+    """
+
+    def __init__(self, message_body: bytes, window_bytes: int) -> None:
+        """Initialise the window before the start of the message body.
+
+        Args:
+            message_body (bytes): The message body encoded in either UTF-8,
+            UTF-16 or UTF-32.
+            window_bytes (int): The number of bytes decoded at a time.
+        """
+        self._message_body = memoryview(message_body)
+        self._decoder = codecs.getincrementaldecoder(
+            json.detect_encoding(message_body)
+        )()
+        self._window_bytes: int = window_bytes
+        self._decoded_bytes: int = 0
+        self._dropped_characters: int = 0
+        self.text: str = ""
+        self.position: int = 0
+
+    def get_offset(self) -> int:
+        """Return the offset of the current position in the whole text."""
+        return self._dropped_characters + self.position
+
+    def read_more(self) -> bool:
+        """Decode the next window of bytes, dropping the text already parsed.
+
+        Returns:
+            bool: Whether any bytes were left to be decoded.
+        """
+        if self._decoded_bytes >= len(self._message_body):
+            return False
+
+        # Reading at least as much as is still held keeps parsing large
+        # elements linear, since they are parsed again after each read.
+        window_end: int = self._decoded_bytes + max(
+            self._window_bytes, len(self.text) - self.position
+        )
+        window = self._message_body[self._decoded_bytes : window_end]
+        self._decoded_bytes += len(window)
+        self._dropped_characters += self.position
+        self.text = self.text[self.position :] + self._decoder.decode(
+            window, final=self._decoded_bytes >= len(self._message_body)
+        )
+        self.position = 0
+
+        return True
+
+    def next_character(self) -> str:
+        """Skip whitespace and return the next character, or "" at the end."""
+        while True:
+            self.position = _WHITESPACE.match(  # type: ignore
+                self.text, self.position
+            ).end()
+            if self.position < len(self.text) or not self.read_more():
+                return self.text[self.position : self.position + 1]
+
+    def decode_value(self) -> Any:
+        """Decode the JSON value after the current position and move past it.
+
+        Raises:
+            ValueError: If the text at the current position is not a valid JSON
+            value.
+
+        Returns:
+            Any: The decoded value.
+        """
+        self.next_character()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.text, self.position)
+            except json.JSONDecodeError as decode_exception:
+                # The value may continue in the next window of bytes.
+                if self.read_more():
+                    continue
+                raise ValueError(
+                    decode_exception.msg
+                    + " at position "
+                    + str(self._dropped_characters + decode_exception.pos)
+                )
+
+            # So may a number or literal ending with the window, e.g. 1.5 of
+            # 1.5e3, or true of a truncated element.
+            if (
+                _NUMBER_CONTINUATION.match(self.text, end) is not None
+                and self.read_more()
+            ):
+                continue
+            self.position = end
+
+            return value
+
+
+def iterate_json_array(message_body: bytes) -> Iterator[Any]:
+    """Parse the elements of a JSON array one at a time.
+
+    Args:
+        message_body (bytes): The JSON array encoded in either UTF-8, UTF-16 or
+        UTF-32.
+
+    Raises:
+        ValueError: If the message body is not a valid JSON array. Since the
+        elements are parsed lazily, this is only raised once the invalid part
+        is reached, i.e. after all elements before it have been handed out.
+
+    Yields:
+        Iterator[Any]: The parsed elements of the array.
+    """
+    text_window = _TextWindow(message_body, _WINDOW_BYTES)
+    if text_window.next_character() != "[":
+        raise ValueError(
+            "Expected a JSON array at position " + str(text_window.get_offset())
+        )
+
+    text_window.position += 1
+    if text_window.next_character() == "]":
+        text_window.position += 1
+    else:
+        while True:
+            yield text_window.decode_value()
+
+            delimiter: str = text_window.next_character()
+            if delimiter not in (",", "]"):
+                raise ValueError(
+                    "Expected , or ] at position " + str(text_window.get_offset())
+                )
+            text_window.position += 1
+            if delimiter == "]":
+                break
+
+    if text_window.next_character() != "":
+        raise ValueError("Unexpected data after the JSON array")
+
+
+def count_json_array_elements(message_body: bytes) -> int:
+    """Count the elements of a JSON array without keeping them.
+
+    Args:
+        message_body (bytes): The JSON array encoded in either UTF-8, UTF-16 or
+        UTF-32.
+
+    Returns:
+        int: The number of elements of the array.
+    """
+    return sum(1 for _ in iterate_json_array(message_body))
+
+
+def iterate_indexed_issue_chunks(
+    message_body: bytes, chunk_size: int
+) -> Iterator[List[IndexedIssue]]:
+    """Parse a classification request into chunks of IndexedIssue instances.
+
+    Args:
+        message_body (bytes): The JSON array of issues.
+        chunk_size (int): The maximum number of issues per chunk.
+
+    Raises:
+        ValueError: If the message body is not a valid JSON array of issues.
+
+    Yields:
+        Iterator[List[IndexedIssue]]: The non-empty chunks of issues in the
+        order of the request.
+    """
+    chunk: List[IndexedIssue] = []
+    for element in iterate_json_array(message_body):
+        chunk.append(IndexedIssue.parse_obj(element))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
@@ -1,25 +1,139 @@
-"""Pydantic models for issues.
+"""Models for issues.
 
 This class contains two models: IndexedIssue to denote indexed issues with
 their regular string representation of the issue body, and VectorisedIssue
 which is largely the same as IndexedIssue except for the fact that the issue
 body consists of a numpy array. This numpy array represents the feature
 vectors of the corresponding IndexedIssue body with the same index.
+
+Both models are plain classes with __slots__ rather than pydantic models, since
+they are created, copied and converted for every single issue on the hot path
+of the gateway and the workers, where the validation and dict conversion of
+pydantic made up a noticeable share of the CPU time. Constructing a model does
+not validate its arguments, which is only needed for input from clients.
+IndexedIssue.parse_obj and parse_indexed_issues validate such input, accepting
+and converting the index, body and labels exactly like the former pydantic
+models did (see tests/unit/test_models.py). The request ID and the body hash are
+never taken from clients, as they are set by the microservice itself.
 """
-from typing import Any, List, Union
+import json
+from math import isfinite
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+_FIELD_NAMES = ("index", "body", "labels", "request_id", "body_hash")
+_VALIDATED_STR_TYPES = (str, int, float)
+
+
+def _validate_str(value: Any, field_name: str) -> str:
+    """Validate a string field like pydantic, i.e. converting numbers to str."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, _VALIDATED_STR_TYPES):
+        return str(value)
+    raise ValueError(field_name + ": str type expected")
+
+
+def _validate_index(value: Any) -> Union[int, str]:
+    """Validate an index like pydantic validates Union[int, str].
+
+    The value is converted to an int if possible, i.e. for numbers and strings
+    of integers, and to a string otherwise.
+    """
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        if isfinite(value):
+            return int(value)
+        return str(value)
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    raise ValueError("index: int or str type expected")
+
+
+def _validate_labels(value: Any) -> List[str]:
+    if not isinstance(value, (list, tuple)):
+        raise ValueError("labels: list type expected")
+
+    return [_validate_str(label, "labels") for label in value]
+
+
+class _Issue:
+    """Base class of IndexedIssue and VectorisedIssue.
+
+    Attributes:
+        index (Union[int, str]): The index of the issue.
+        body (Any): The issue body.
+        labels (List[str]): The labels of the issue.
+        request_id (Optional[str]): The ID of the request of the issue.
+        body_hash (Optional[str]): The hash of the original issue body.
+    """
+
+    __slots__ = _FIELD_NAMES
+    _field_names: Tuple[str, ...] = _FIELD_NAMES
+
+    def __init__(
+        self,
+        index: Union[int, str],
+        body: Any,
+        labels: Optional[List[str]] = None,
+        request_id: Optional[str] = None,
+        body_hash: Optional[str] = None,
+    ) -> None:
+        self.index: Union[int, str] = index
+        self.body: Any = body
+        self.labels: List[str] = labels if labels is not None else []
+        self.request_id: Optional[str] = request_id
+        self.body_hash: Optional[str] = body_hash
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, field_name) == getattr(other, field_name)
+            for field_name in self._field_names
+        )
+
+    def __repr__(self) -> str:
+        return (
+            type(self).__name__
+            + "("
+            + ", ".join(
+                field_name + "=" + repr(getattr(self, field_name))
+                for field_name in self._field_names
+            )
+            + ")"
+        )
+
+    def dict(self) -> Dict[str, Any]:
+        """Return the fields of the issue.
+
+        Returns:
+            Dict[str, Any]: The fields by name.
+        """
+        return {
+            field_name: getattr(self, field_name) for field_name in self._field_names
+        }
+
+    def to_result(self) -> Dict[str, Any]:
+        """Return the classification result of the issue as sent to clients.
 
-import ujson
-from pydantic import BaseModel
+        Returns:
+            Dict[str, Any]: The index and the labels of the issue.
+        """
+        return {"index": self.index, "labels": self.labels}
 
 
-class IndexedIssue(BaseModel):
+class IndexedIssue(_Issue):
     """Class for indexed issues.
 
     An indexed issue consists of an index, an issue body, and the list of
     labels.
 
-    The index can either be an int or string, and pydantic will attempt
-    to cast the input to an int. If this fails, it resorts to casting the index
+    The index can either be an int or string. When parsing input, the index is
+    cast to an int if possible. If this fails, it resorts to casting the index
     into a string for compatibility.
 
     The issue body should be a JSON string, which will be parsed into a native
@@ -28,55 +142,104 @@ class IndexedIssue(BaseModel):
     Labels do not need to be provided, but can be filled if desired. With that
     being said, this has no effect on the vectoriser and classifiers or their output.
 
-    Args:
-        BaseModel (BaseModel): The pydantic base model.
+    The request ID is set by the microservice itself to the correlation ID of
+    the request the issue belongs to, so that results can be aggregated per
+    request. Likewise, the body hash is set by the microservice if the result
+    cache is enabled, so that the final labels can be cached.
     """
 
-    index: Union[int, str]
-    body: str
-    labels: List[str] = []
+    __slots__ = ()
 
-    class Config:
-        """Configuration of the IndexedIssue class.
+    @classmethod
+    def parse_obj(cls, value: Any) -> "IndexedIssue":
+        """Validate a decoded JSON object and create an IndexedIssue from it.
 
-        The current configuration sets the json_loads function to the
-        ujson.loads function from ujson, which is faster when it comes to
-        de-/serialisation of data.
-        """
+        Numbers are accepted for string fields and converted to strings, while
+        unknown fields are ignored. So are the request ID and the body hash,
+        which are only ever set by the microservice itself.
 
-        json_loads = ujson.loads
+        Args:
+            value (Any): The decoded JSON object, usually a dict.
 
+        Raises:
+            ValueError: If the object is not a valid issue.
 
-class VectorisedIssue(BaseModel):
+        Returns:
+            IndexedIssue: The validated issue.
+        """
+        if not isinstance(value, dict):
+            try:
+                value = dict(value)
+            except (TypeError, ValueError):
+                raise ValueError("issue: dict type expected") from None
+        try:
+            index = value["index"]
+            body = value["body"]
+        except KeyError as missing_field:
+            raise ValueError(str(missing_field) + ": field required") from None
+
+        return cls(
+            index=_validate_index(index),
+            body=_validate_str(body, "body"),
+            labels=_validate_labels(value["labels"]) if "labels" in value else [],
+        )
+
+
+class VectorisedIssue(_Issue):
     """Class for transformed issues.
 
     Transformed issues are very similar to IndexedIssue instances. The
     difference lies in the data type of the body, which is a numpy array
     representing the feature vectors produced by the vectoriser.
 
-    The index can either be an int or string, and pydantic will attempt
-    to cast the input to an int. If this fails, it resorts to casting the index
-    into a string for compatibility.
+    The labels of a transformed issue start with the labels the client sent
+    along with the issue, followed by the labels attached by the classifier
+    tree. Only the latter depend on the issue body, so only they are cached
+    (see predicted_labels).
 
-    Args:
-        BaseModel (BaseModel): The pydantic base model.
+    Attributes:
+        input_label_count (int): The number of labels sent by the client.
     """
 
-    index: Union[int, str]
-    body: Any
-    labels: List[str] = []
+    __slots__ = ("input_label_count",)
+    _field_names: Tuple[str, ...] = _FIELD_NAMES + ("input_label_count",)
+
+    def __init__(
+        self,
+        index: Union[int, str],
+        body: Any,
+        labels: Optional[List[str]] = None,
+        request_id: Optional[str] = None,
+        body_hash: Optional[str] = None,
+        input_label_count: int = 0,
+    ) -> None:
+        super().__init__(index, body, labels, request_id, body_hash)
+        self.input_label_count: int = input_label_count
+
+    def predicted_labels(self) -> List[str]:
+        """Return the labels attached by the classifier tree.
+
+        Returns:
+            List[str]: The labels without those sent by the client.
+        """
+        return self.labels[self.input_label_count :]
 
-    class Config:
-        """Configuration of the VectorisedIssue class.
 
-        The current configuration sets the json_loads function to the
-        ujson.loads function from ujson, which is faster when it comes to
-        de-/serialisation of data.
+def parse_indexed_issues(message_body: bytes) -> List[IndexedIssue]:
+    """Parse a classification request, i.e. a JSON array of issues.
 
-        In addition, since numpy.ndarray does not provide validators
-        out-of-the-box, pydantic is set to accept arbitrary data types to
-        circumvent this issue.
-        """
+    Args:
+        message_body (bytes): The JSON array encoded in either UTF-8, UTF-16 or
+        UTF-32.
+
+    Raises:
+        ValueError: If the message body is not a valid JSON array of issues.
+
+    Returns:
+        List[IndexedIssue]: The validated issues.
+    """
+    issues = json.loads(message_body)
+    if not isinstance(issues, list):
+        raise ValueError("request: list type expected")
 
-        json_loads = ujson.loads
-        arbitrary_types_allowed = True
+    return [IndexedIssue.parse_obj(issue) for issue in issues]
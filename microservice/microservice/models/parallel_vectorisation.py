@@ -0,0 +1,163 @@
+"""Transformation of large batches of issue bodies across several processes.
+
+The vectoriser worker runs with the solo pool, i.e. a single process, so a large
+request is tokenised on a single core. Tokenisation holds the GIL, so threads
+do not help. Instead, a pool of VECTORISATION_PROCESSES processes is forked
+once the vectoriser has been loaded when the worker starts (see
+start_vectorisation_pool). Every process of the pool inherits the vectoriser of
+the worker, i.e. it is neither pickled nor loaded again, and its memory pages
+are shared with the worker.
+
+The pool is never forked later on, since by then the worker may run threads,
+e.g. those of Celery, and a process forked from a threaded process may
+deadlock on a lock held by another thread. Processes
+without a pool of their own, e.g. the child processes of a prefork worker, and
+vectorisers other than the one the pool was forked with are thus served by
+transforming every batch in-process.
+
+Batches of at least VECTORISATION_PARALLEL_MIN_ISSUES issue bodies are split
+into one contiguous slice per process, which are transformed concurrently and
+stacked back together in their original order. Smaller batches are transformed
+by the worker itself, since sending the bodies to the pool and the feature
+vectors back costs more than it saves for them.
+"""
+import logging
+import multiprocessing
+import signal
+from math import ceil
+from multiprocessing.pool import Pool
+from os import getenv, getpid
+from typing import Any, List, Optional
+
+from scipy import sparse
+
+VECTORISATION_PROCESSES: int = int(getenv("VECTORISATION_PROCESSES") or "1")
+VECTORISATION_PARALLEL_MIN_ISSUES: int = int(
+    getenv("VECTORISATION_PARALLEL_MIN_ISSUES", "500")
+)
+
+_vectorisation_pool: Optional[Pool] = None
+_vectorisation_pool_pid: Optional[int] = None
+# The vectoriser the processes of the pool were forked with.
+_pool_vectoriser: Any = None
+
+
+def _reset_signal_handlers() -> None:
+    # Processes replacing exited ones are forked from the running worker, so
+    # the signal handlers of Celery are reset. Interrupts are left to the
+    # worker, which terminates the pool on shutdown.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _transform_in_pool(issue_bodies: List[str]) -> sparse.csr_matrix:
+    return _pool_vectoriser.transform(issue_bodies).tocsr()
+
+
+def start_vectorisation_pool(vectoriser: Any) -> Optional[Pool]:
+    """Fork the processes transforming large batches with the given vectoriser.
+
+    The pool is forked at most once per process and vectoriser, and must only
+    be started right after the vectoriser has been loaded, before the worker
+    starts any threads, i.e. in the worker_init signal (see preload_models).
+
+    Uses the following environment variable:
+        - VECTORISATION_PROCESSES: The number of processes of the pool. 1 (the
+        default) disables the pool.
+
+    Args:
+        vectoriser (Any): The fitted vectoriser of the worker.
+
+    Returns:
+        Optional[Pool]: The pool, or None if it is disabled.
+    """
+    global _vectorisation_pool, _vectorisation_pool_pid, _pool_vectoriser
+
+    if VECTORISATION_PROCESSES <= 1:
+        return None
+    if (
+        _vectorisation_pool is not None
+        and _vectorisation_pool_pid == getpid()
+        and _pool_vectoriser is vectoriser
+    ):
+        return _vectorisation_pool
+
+    stop_vectorisation_pool()
+    _pool_vectoriser = vectoriser
+    _vectorisation_pool = multiprocessing.get_context("fork").Pool(
+        VECTORISATION_PROCESSES, initializer=_reset_signal_handlers
+    )
+    _vectorisation_pool_pid = getpid()
+    logging.info(
+        "Forked "
+        + str(VECTORISATION_PROCESSES)
+        + " vectorisation processes for batches of at least "
+        + str(VECTORISATION_PARALLEL_MIN_ISSUES)
+        + " issues."
+    )
+
+    return _vectorisation_pool
+
+
+def stop_vectorisation_pool() -> None:
+    """Terminate the vectorisation pool of the current process, if any."""
+    global _vectorisation_pool, _vectorisation_pool_pid
+
+    # A pool inherited from the parent process belongs to the parent.
+    if _vectorisation_pool is not None and _vectorisation_pool_pid == getpid():
+        _vectorisation_pool.terminate()
+    _vectorisation_pool, _vectorisation_pool_pid = None, None
+
+
+def _get_vectorisation_pool(vectoriser: Any) -> Optional[Pool]:
+    """Return the pool of the current process if it serves the given vectoriser."""
+    if (
+        _vectorisation_pool is None
+        or _vectorisation_pool_pid != getpid()
+        or _pool_vectoriser is not vectoriser
+    ):
+        return None
+
+    return _vectorisation_pool
+
+
+def transform_issue_bodies(
+    vectoriser: Any, issue_bodies: List[str]
+) -> sparse.csr_matrix:
+    """Transform the given issue bodies, splitting large batches across processes.
+
+    Large batches are only split if the pool of the current process has been
+    started with the given vectoriser (see start_vectorisation_pool), and are
+    transformed in-process otherwise.
+
+    Uses the following environment variable:
+        - VECTORISATION_PARALLEL_MIN_ISSUES: The number of issue bodies from
+        which on a batch is split across the processes of the pool (500 by
+        default).
+
+    Args:
+        vectoriser (Any): The fitted vectoriser of the worker.
+        issue_bodies (List[str]): The issue bodies to be transformed.
+
+    Returns:
+        sparse.csr_matrix: The feature vectors, one row per issue body in the
+        same order as the issue bodies.
+    """
+    if len(issue_bodies) < max(VECTORISATION_PARALLEL_MIN_ISSUES, 2):
+        return vectoriser.transform(issue_bodies).tocsr()
+
+    vectorisation_pool = _get_vectorisation_pool(vectoriser)
+    if vectorisation_pool is None:
+        return vectoriser.transform(issue_bodies).tocsr()
+
+    slice_size: int = ceil(len(issue_bodies) / VECTORISATION_PROCESSES)
+    feature_vector_slices: List[sparse.csr_matrix] = vectorisation_pool.map(
+        _transform_in_pool,
+        [
+            issue_bodies[start : start + slice_size]
+            for start in range(0, len(issue_bodies), slice_size)
+        ],
+        chunksize=1,
+    )
+
+    return sparse.vstack(feature_vector_slices, format="csr")
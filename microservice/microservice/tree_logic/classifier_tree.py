@@ -6,13 +6,44 @@ tree and the classifier tree's nodes and their accompanying logic.
 from __future__ import annotations
 import logging
 
-import queue
-from queue import Queue
-from typing import Generator, List, Optional, Tuple, Union
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv, getpid
+from time import perf_counter
+from typing import Any, Deque, Generator, List, NamedTuple, Optional, Tuple, Union
 
 from microservice.config.load_classifier import get_classifier
+from microservice.metrics.tracing import span
+from microservice.models.feature_vectors import stack_feature_vectors
 from microservice.models.models import VectorisedIssue
-from numpy import ndarray
+from microservice.tree_logic.early_exit_voting import wrap_voting_classifier
+from numpy import flatnonzero, ndarray
+
+PARALLEL_LABEL_NODES: bool = getenv("PARALLEL_LABEL_NODES", "True").lower() == "true"
+LABEL_NODE_THREADS: int = int(getenv("LABEL_NODE_THREADS", "4"))
+
+_label_node_executor: Optional[ThreadPoolExecutor] = None
+_label_node_executor_pid: Optional[int] = None
+
+
+def _get_label_node_executor() -> ThreadPoolExecutor:
+    """Return the thread pool evaluating label nodes of the current process.
+
+    Threads do not survive forking, so a new thread pool is created whenever
+    the process ID has changed.
+
+    Returns:
+        ThreadPoolExecutor: The thread pool.
+    """
+    global _label_node_executor, _label_node_executor_pid
+
+    if _label_node_executor is None or _label_node_executor_pid != getpid():
+        _label_node_executor = ThreadPoolExecutor(
+            max_workers=LABEL_NODE_THREADS, thread_name_prefix="label_node"
+        )
+        _label_node_executor_pid = getpid()
+
+    return _label_node_executor
 
 
 class ClassifyTreeNode:
@@ -90,19 +121,24 @@ class ClassifyTreeNode:
         example a given issue represents a bug but not related to API) is used
         to retrieve the classifier.
 
+        Hard-voting ensembles are wrapped with EarlyExitVotingClassifier (see
+        wrap_voting_classifier), which skips the evaluation of ensemble members
+        for issues whose outcome has already been decided.
+
         Args:
             label_classes (List[str]): The input complete label classes from
             which the classifier is to be retrieved.
         """
         if self._is_root_node:
-            self._classifier = get_classifier(labels=self._label_classes)  # type: ignore
+            classifier = get_classifier(labels=self._label_classes)  # type: ignore
         else:
-            self._classifier = get_classifier(
+            classifier = get_classifier(
                 labels=[
                     "{}_{}".format(self._label_classes, self._knowledge),
                     self._knowledge,
                 ]
             )
+        self._classifier = wrap_voting_classifier(classifier)
 
     def _init_children(self, label_classes: List[str]) -> None:
         """Initialise the children of the current node.
@@ -150,6 +186,15 @@ class ClassifyTreeNode:
             self._child is not None
         )
 
+    @property
+    def classifier(self) -> Any:
+        """Getter for the classifier of the node.
+
+        Returns:
+            Any: The classifier, usually wrapped with EarlyExitVotingClassifier.
+        """
+        return self._classifier
+
     def is_root_node(self) -> bool:
         """Return whether the current node is a root node or not.
 
@@ -229,8 +274,98 @@ class ClassifyTreeNode:
 
         return to_left_child, to_right_child
 
+    def _get_labels_for_children(self) -> Tuple[Optional[str], Optional[str]]:
+        """Return the labels attached to issues forwarded to the left and right child.
+
+        The labels are the same as the ones attached by
+        _determine_input_for_children: The root node attaches its first label
+        class to issues for the left child and its second label class to issues
+        for the right child. Any other node attaches its label class to issues
+        for the left child only.
+
+        Returns:
+            Tuple[Optional[str], Optional[str]]: The labels for issues destined
+            for the left and right child, respectively. None if no label is to
+            be attached.
+        """
+        if self._is_root_node:
+            return self._label_classes[0], self._label_classes[1]  # type: ignore
+        else:
+            return str(self._label_classes), None
+
+    def _split_issues_by_predictions(
+        self, predictions: ndarray, issues: List[VectorisedIssue]
+    ) -> Tuple[List[VectorisedIssue], List[VectorisedIssue]]:
+        """Split the issues into those for the left and right child by their predictions.
+
+        This is the batched equivalent of calling _determine_input_for_children
+        for every issue: Issues predicted as 0 are forwarded to the left child
+        node, all others to the right child node, and the same labels are
+        attached. The order of the issues is preserved within each list.
+
+        Args:
+            predictions (ndarray): The predictions of all issues, where the
+            i-th prediction belongs to the i-th issue.
+            issues (List[VectorisedIssue]): The classified issues.
+
+        Returns:
+            Tuple[List[VectorisedIssue], List[VectorisedIssue]]: Tuple
+            consisting of the list of issues destined for the left child and
+            right child nodes, respectively.
+        """
+        is_for_left_child: ndarray = predictions == 0
+        left_label, right_label = self._get_labels_for_children()
+
+        to_left_child: List[VectorisedIssue] = [
+            issues[issue_index] for issue_index in flatnonzero(is_for_left_child)
+        ]
+        to_right_child: List[VectorisedIssue] = [
+            issues[issue_index] for issue_index in flatnonzero(~is_for_left_child)
+        ]
+
+        if left_label is not None:
+            for current_issue in to_left_child:
+                current_issue.labels.append(left_label)
+        if right_label is not None:
+            for current_issue in to_right_child:
+                current_issue.labels.append(right_label)
+
+        return to_left_child, to_right_child
+
+    def predict(self, feature_vectors: Any) -> ndarray:
+        """Predict the classes of the given feature vectors without labelling.
+
+        Args:
+            feature_vectors (Any): The stacked feature vectors, one row per issue.
+
+        Returns:
+            ndarray: The predictions, where the i-th prediction belongs to the
+            i-th row.
+        """
+        return self._classifier.predict(feature_vectors)
+
+    def apply_predictions(
+        self, predictions: ndarray, issues: List[VectorisedIssue]
+    ) -> Tuple[List[VectorisedIssue], List[VectorisedIssue]]:
+        """Attach the labels of this node according to the given predictions.
+
+        This is the second half of classify, for callers which obtained the
+        predictions themselves (see predict).
+
+        Args:
+            predictions (ndarray): The predictions of all issues, where the
+            i-th prediction belongs to the i-th issue.
+            issues (List[VectorisedIssue]): The classified issues.
+
+        Returns:
+            Tuple[List[VectorisedIssue], List[VectorisedIssue]]: Tuple
+            consisting of the list of issues destined for the left child and
+            right child nodes, respectively.
+        """
+        return self._split_issues_by_predictions(predictions, issues)
+
     def classify(
-        self, issues: List[VectorisedIssue]
+        self, issues: List[VectorisedIssue], batched: bool = True
     ) -> Tuple[List[VectorisedIssue], List[VectorisedIssue]]:
         """Produce the prediction of the label for the input transformed issues.
 
@@ -239,9 +374,18 @@ class ClassifyTreeNode:
         to the left child node and the right child node are determined and
         returned.
 
+        By default, the feature vectors of all issues are stacked into a single
+        matrix and classified with one call to predict. This way, each member
+        of an ensemble classifier is only called once per chunk instead of once
+        per issue. The issues are then split into those for the left and right
+        child using a boolean mask over the predictions. If batched is False,
+        each issue is classified on its own.
+
         Args:
             issues (List[VectorisedIssue]): The list of transformed issues to be
             classified.
+            batched (bool, optional): Whether all issues should be classified
+            with a single call to predict. Defaults to True.
 
         Raises:
             ValueError: If no issues have been passed.
@@ -256,25 +400,55 @@ class ClassifyTreeNode:
 
         to_left_child: List[VectorisedIssue] = []
         to_right_child: List[VectorisedIssue] = []
-        for current_issue in issues:
-            current_issue_body: ndarray = current_issue.body
-            prediction: ndarray = self._classifier.predict(current_issue_body)
-            to_left_child, to_right_child = self._determine_input_for_children(
-                prediction,
-                current_issue,
-                to_left_child,
-                to_right_child,
-            )
+
+        if batched:
+            if issues:
+                predictions: ndarray = self.predict(
+                    stack_feature_vectors([issue.body for issue in issues])
+                )
+                to_left_child, to_right_child = self.apply_predictions(
+                    predictions, issues
+                )
+        else:
+            for current_issue in issues:
+                current_issue_body: ndarray = current_issue.body
+                prediction: ndarray = self._classifier.predict(current_issue_body)
+                to_left_child, to_right_child = self._determine_input_for_children(
+                    prediction,
+                    current_issue,
+                    to_left_child,
+                    to_right_child,
+                )
 
         return to_left_child, to_right_child
 
 
+class ClassifyTreeNodeEntry(NamedTuple):
+    """An entry of the flattened node table of a classifier tree.
+
+    Attributes:
+        index (int): The level-order index of the node, starting with 1 for the
+        root node.
+        node (ClassifyTreeNode): The node itself.
+        is_leaf_node (bool): Whether the node is a leaf node.
+        child_indices (Tuple[int, ...]): The indices of the child nodes from
+        left to right. Empty for leaf nodes.
+    """
+
+    index: int
+    node: ClassifyTreeNode
+    is_leaf_node: bool
+    child_indices: Tuple[int, ...]
+
+
 class ClassifyTree:
     """The classifier tree class.
 
     This class encapsulates the logic behind a single classifier tree. The
     classifier tree consists of a single node that is the root node of the
-    classifier tree instance.
+    classifier tree instance. In addition, a flattened node table is built once
+    the tree is generated, so that nodes, their leaf status and their children
+    can be looked up by index in constant time.
     """
 
     def __init__(self, label_classes: List[str]) -> None:
@@ -294,10 +468,113 @@ class ClassifyTree:
         self._root_node = ClassifyTreeNode(
             label_classes=label_classes, is_root_node=True
         )
+        self._node_table: List[ClassifyTreeNodeEntry] = self._build_node_table()
+
+    @staticmethod
+    def _get_child_nodes(node: ClassifyTreeNode) -> Tuple[ClassifyTreeNode, ...]:
+        """Return the child nodes of the given node as a tuple.
+
+        Args:
+            node (ClassifyTreeNode): The node whose children are returned.
+
+        Returns:
+            Tuple[ClassifyTreeNode, ...]: The child nodes from left to right.
+            Empty if the given node is a leaf node.
+        """
+        if not node.has_children():
+            return ()
+
+        children = node.get_children()
+        if isinstance(children, ClassifyTreeNode):
+            return (children,)
+        else:
+            return tuple(children)
+
+    def _build_node_table(self) -> List[ClassifyTreeNodeEntry]:
+        """Build the flattened, level-order node table of the classifier tree.
+
+        The tree is traversed exactly once. Each node is assigned its index in
+        level-order, starting with 1 for the root node, along with whether it is
+        a leaf node and the indices of its child nodes. The i-th entry of the
+        table belongs to the node with index i + 1.
+
+        Returns:
+            List[ClassifyTreeNodeEntry]: The node table.
+        """
+        node_table: List[ClassifyTreeNodeEntry] = []
+        pending_nodes: Deque[ClassifyTreeNode] = deque([self._root_node])
+        next_node_index: int = 2
+
+        while pending_nodes:
+            current_node: ClassifyTreeNode = pending_nodes.popleft()
+            child_nodes = self._get_child_nodes(current_node)
+            child_indices: Tuple[int, ...] = tuple(
+                range(next_node_index, next_node_index + len(child_nodes))
+            )
+            next_node_index += len(child_nodes)
+            pending_nodes.extend(child_nodes)
+
+            node_table.append(
+                ClassifyTreeNodeEntry(
+                    index=len(node_table) + 1,
+                    node=current_node,
+                    is_leaf_node=not child_nodes,
+                    child_indices=child_indices,
+                )
+            )
+
+        return node_table
+
+    def get_feature_count(self) -> Optional[int]:
+        """Return the number of features the classifiers of the tree expect.
+
+        Returns:
+            Optional[int]: The number of features (n_features_in_) of the
+            classifier of the root node, or None if the classifier does not
+            record it, e.g. since it was trained with scikit-learn before 0.24.
+        """
+        return getattr(self._root_node.classifier, "n_features_in_", None)
+
+    def warm_up(self, feature_vector: Any) -> List[float]:
+        """Run a dummy prediction through every node of the tree.
+
+        The first prediction of a freshly loaded classifier is considerably
+        slower than the following ones, e.g. since scikit-learn and numpy
+        initialise internal state and caches and the pages of the model have
+        to be faulted in. Running a single prediction per node at boot moves
+        this cost out of the first real request.
+
+        Afterwards, the statistics of classifiers wrapped for early exit voting
+        are reset, so that neither their cost estimates nor the logged
+        statistics include the warm-up.
+
+        Args:
+            feature_vector (Any): A feature vector (a 1xN matrix) produced by
+            the vectoriser, e.g. of a dummy issue body, or an empty one of the
+            same width (see get_feature_count).
+
+        Returns:
+            List[float]: The warm-up time in seconds of each node, in the order
+            of the node table.
+        """
+        durations: List[float] = []
+        for node_entry in self._node_table:
+            start = perf_counter()
+            node_entry.node.classify([VectorisedIssue(index=0, body=feature_vector)])
+            durations.append(perf_counter() - start)
+
+        for node_entry in self._node_table:
+            reset_statistics = getattr(
+                node_entry.node.classifier, "reset_statistics", None
+            )
+            if reset_statistics is not None:
+                reset_statistics()
+
+        return durations
 
     def tree_node_generator(
         self,
-    ) -> Generator[ClassifyTreeNode]:
+    ) -> Generator[ClassifyTreeNode, None, None]:
         """Return a level-order generator for the classifier tree.
 
         The generator iterates over the nodes in the classifier tree starting
@@ -307,21 +584,8 @@ class ClassifyTree:
             Iterator[ClassifyTreeNode]: The level-order generator of the
             classifier tree.
         """
-        self._node_queue: "Queue[ClassifyTreeNode]" = queue.Queue()
-        self._node_queue.put(self._root_node)
-
-        while not self._node_queue.empty():
-            current_node: ClassifyTreeNode = self._node_queue.get()
-            if current_node.has_children():
-                if current_node._is_root_node:
-                    left_child, right_child = current_node.get_children()  # type: ignore
-                    self._node_queue.put(left_child)
-                    self._node_queue.put(right_child)
-                else:
-                    child = current_node.get_children()
-                    self._node_queue.put(child)  # type: ignore
-
-            yield current_node
+        for node_entry in self._node_table:
+            yield node_entry.node
 
     def get_node_count(self) -> int:
         """Get the number of nodes in the tree.
@@ -329,13 +593,26 @@ class ClassifyTree:
         Returns:
             int: The number of nodes in the classifier tree.
         """
-        count = 0
-        for _ in self.tree_node_generator():
-            count += 1
+        return len(self._node_table)
+
+    def get_node_entry(self, index: int) -> ClassifyTreeNodeEntry:
+        """Return the node table entry based on the input index.
+
+        Args:
+            index (int): The index of the node in the classifier tree.
+
+        Raises:
+            IndexError: If no node with the given index exists.
+
+        Returns:
+            ClassifyTreeNodeEntry: The entry of the node with the given index.
+        """
+        if not 1 <= index <= len(self._node_table):
+            raise IndexError("No node with index " + str(index) + " in the tree")
 
-        return count
+        return self._node_table[index - 1]
 
-    def get_node(self, index: int) -> ClassifyTreeNode:  # type: ignore
+    def get_node(self, index: int) -> ClassifyTreeNode:
         """Return the node based on the input index.
 
         Args:
@@ -344,10 +621,165 @@ class ClassifyTree:
         Returns:
             ClassifyTreeNode: The node corresponding to the input index
         """
-        tree_node_generator = self.tree_node_generator()
+        return self.get_node_entry(index).node
+
+    def get_child_routes(
+        self,
+        index: int,
+        to_left_child: List[VectorisedIssue],
+        to_right_child: List[VectorisedIssue],
+    ) -> List[Tuple[int, List[VectorisedIssue]]]:
+        """Determine which issues are to be forwarded to which child node.
+
+        If the node with the given index has two children (such as the root
+        node), the issues destined for the left and right child are forwarded to
+        the respective child. If it has a single child, all of its issues are
+        forwarded to that child. Leaf nodes have no child routes.
+
+        Args:
+            index (int): The index of the forwarding node.
+            to_left_child (List[VectorisedIssue]): The issues destined for the
+            left child node.
+            to_right_child (List[VectorisedIssue]): The issues destined for the
+            right child node.
+
+        Returns:
+            List[Tuple[int, List[VectorisedIssue]]]: Pairs of child node index
+            and the issues to be forwarded to it. Children which would not
+            receive any issues are left out.
+        """
+        child_indices: Tuple[int, ...] = self.get_node_entry(index).child_indices
+
+        if len(child_indices) == 2:
+            routes = [
+                (child_indices[0], to_left_child),
+                (child_indices[1], to_right_child),
+            ]
+        elif len(child_indices) == 1:
+            routes = [(child_indices[0], to_left_child + to_right_child)]
+        else:
+            routes = []
+
+        return [(child_index, issues) for child_index, issues in routes if issues]
+
+    def get_label_group(self, index: int) -> List[int]:
+        """Return the indices of the independent label nodes starting at a node.
+
+        A node with a single child forwards all of its issues to that child,
+        whatever it predicted (see get_child_routes). The prediction of the
+        child thus does not depend on the prediction of its parent, only the
+        labels they attach are collected one after the other. This is the case
+        for the chains of label nodes below the root node, e.g. api and docu
+        for the knowledge bug. Following the single child links from the given
+        node yields such a group of nodes, which classify the same issues and
+        can thus be evaluated at the same time. The group ends with the first
+        node which is a leaf node or has two children.
+
+        Args:
+            index (int): The index of the first node of the group.
+
+        Returns:
+            List[int]: The indices of the nodes of the group from top to bottom.
+        """
+        group: List[int] = [index]
+        child_indices: Tuple[int, ...] = self.get_node_entry(index).child_indices
+        while len(child_indices) == 1:
+            group.append(child_indices[0])
+            child_indices = self.get_node_entry(child_indices[0]).child_indices
+
+        return group
+
+    def classify_label_group(
+        self, issues: List[VectorisedIssue], start_node_index: int
+    ) -> Tuple[int, List[VectorisedIssue], List[VectorisedIssue]]:
+        """Classify the issues with the whole label group of the given node.
+
+        The feature vectors are stacked once, and the classifiers of all nodes
+        of the group (see get_label_group) predict them concurrently in a
+        thread pool. The labels are then attached in the order of the group,
+        so they are the same as if the issues had passed through the nodes one
+        after the other. If PARALLEL_LABEL_NODES is disabled, only the given
+        node classifies the issues.
+
+        Args:
+            issues (List[VectorisedIssue]): The issues to be classified.
+            start_node_index (int): The index of the first node of the group.
+
+        Returns:
+            Tuple[int, List[VectorisedIssue], List[VectorisedIssue]]: The index
+            of the last node of the group, along with the issues destined for
+            its left and right child, respectively.
+        """
+        group: List[int] = (
+            self.get_label_group(start_node_index)
+            if PARALLEL_LABEL_NODES
+            else [start_node_index]
+        )
+        nodes: List[ClassifyTreeNode] = [
+            self.get_node_entry(node_index).node for node_index in group
+        ]
+        if len(nodes) == 1 or not issues:
+            return (group[0], *nodes[0].classify(issues))
+
+        feature_vectors = stack_feature_vectors([issue.body for issue in issues])
+        all_predictions: List[ndarray] = list(
+            _get_label_node_executor().map(
+                lambda node: node.predict(feature_vectors), nodes
+            )
+        )
+        for node, predictions in zip(nodes[:-1], all_predictions[:-1]):
+            node.apply_predictions(predictions, issues)
+        to_left_child, to_right_child = nodes[-1].apply_predictions(
+            all_predictions[-1], issues
+        )
+
+        return group[-1], to_left_child, to_right_child
+
+    def classify(
+        self,
+        issues: List[VectorisedIssue],
+        start_node_index: int = 1,
+    ) -> List[VectorisedIssue]:
+        """Classify the issues by walking the tree in-process down to the leaves.
+
+        Starting from the given node (the root node by default), each node
+        classifies the issues it receives and passes them on to its child
+        node(s) exactly like the per-node Celery tasks would do (see
+        get_child_routes). Once a leaf node has classified its issues, they are
+        collected as final results. Groups of independent label nodes are
+        evaluated at once (see classify_label_group). For traced requests, each
+        group is logged as a span of the trace.
+
+        This allows a single task to produce the final labels of its issues
+        without sending the issues through the broker once per tree level.
+
+        Args:
+            issues (List[VectorisedIssue]): The issues to be classified.
+            start_node_index (int, optional): The index of the node to start
+            classifying from. Defaults to 1, i.e. the root node.
+
+        Returns:
+            List[VectorisedIssue]: The classified issues with all labels
+            attached, grouped by the leaf node which classified them last.
+        """
+        results: List[VectorisedIssue] = []
+        pending_nodes: Deque[Tuple[int, List[VectorisedIssue]]] = deque(
+            [(start_node_index, issues)]
+        )
+
+        while pending_nodes:
+            node_index, node_issues = pending_nodes.popleft()
+            with span("classify_node", node_index=node_index, issues=len(node_issues)):
+                node_index, to_left_child, to_right_child = self.classify_label_group(
+                    node_issues, node_index
+                )
+            node_entry: ClassifyTreeNodeEntry = self.get_node_entry(node_index)
+
+            if node_entry.is_leaf_node:
+                results.extend(to_left_child + to_right_child)
+            else:
+                pending_nodes.extend(
+                    self.get_child_routes(node_index, to_left_child, to_right_child)
+                )
 
-        if index <= self.get_node_count():
-            for current_node in tree_node_generator:
-                index -= 1
-                if index == 0:
-                    return current_node
+        return results
@@ -0,0 +1,276 @@
+"""Early-exit inference for hard-voting ensemble classifiers.
+
+The classifier of each tree node is a hard-voting ensemble (naive Bayes, SGD,
+sigmoid SVC, random forest and logistic regression). VotingClassifier.predict
+always evaluates every member on every issue, even though the outcome of most
+issues is already decided once a majority of the members agree, no matter what
+the remaining members predict. The expensive members, in particular the random
+forest and the SVC, are thus often evaluated in vain.
+
+EarlyExitVotingClassifier wraps a fitted hard-voting VotingClassifier and
+evaluates its members cheapest first. After each member, the issues whose
+outcome can no longer change, i.e. whose leading class is ahead of every other
+class by more than the weight of all remaining members, are removed from the
+batch, and the remaining members are only evaluated on the undecided issues.
+The cost of each member is measured on the fly, so the evaluation order adapts
+to the actual models. The predictions are identical to those of the wrapped
+VotingClassifier, including its tie-breaking in favour of the lowest class.
+"""
+import logging
+from os import getenv
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+import numpy
+
+EARLY_EXIT_VOTING: bool = getenv("EARLY_EXIT_VOTING", "True").lower() == "true"
+
+# Smoothing factor of the moving average of the cost of each member.
+_COST_SMOOTHING: float = 0.2
+
+
+class MemberStatistics:
+    """Counters of a single member of an EarlyExitVotingClassifier.
+
+    Attributes:
+        evaluated_rows (int): The number of issues the member was evaluated on.
+        skipped_rows (int): The number of issues the member was not evaluated
+        on, since their outcome had already been decided.
+        total_seconds (float): The total time spent evaluating the member.
+    """
+
+    def __init__(self) -> None:
+        """Initialise all counters with zero."""
+        self.evaluated_rows: int = 0
+        self.skipped_rows: int = 0
+        self.total_seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the counters along with the share of skipped evaluations.
+
+        Returns:
+            Dict[str, Any]: The counters by name.
+        """
+        statistics: Dict[str, Any] = dict(vars(self))
+        total_rows: int = self.evaluated_rows + self.skipped_rows
+        statistics["skipped_ratio"] = (
+            self.skipped_rows / total_rows if total_rows else 0.0
+        )
+
+        return statistics
+
+
+class EarlyExitVotingClassifier:
+    """Wrapper evaluating the members of a hard-voting ensemble cheapest first."""
+
+    def __init__(self, voting_classifier: Any) -> None:
+        """Wrap a fitted hard-voting VotingClassifier.
+
+        Args:
+            voting_classifier (Any): The fitted VotingClassifier with hard
+            voting.
+
+        Raises:
+            ValueError: If the classifier does not use hard voting.
+        """
+        if getattr(voting_classifier, "voting", None) != "hard":
+            raise ValueError("Only hard-voting classifiers can be wrapped")
+
+        self._voting_classifier = voting_classifier
+        self._members: List[Any] = list(voting_classifier.estimators_)
+        # estimators_ only holds the members which have not been dropped, so
+        # the names and weights of dropped members are left out as well.
+        is_member: List[bool] = [
+            estimator != "drop" for _, estimator in voting_classifier.estimators
+        ]
+        self._member_names: List[str] = [
+            name
+            for (name, _), kept in zip(voting_classifier.estimators, is_member)
+            if kept
+        ]
+        weights: Optional[List[float]] = (
+            [
+                weight
+                for weight, kept in zip(voting_classifier.weights, is_member)
+                if kept
+            ]
+            if voting_classifier.weights is not None
+            else None
+        )
+        self._weights: Optional[numpy.ndarray] = (
+            numpy.asarray(weights, dtype=numpy.float64) if weights is not None else None
+        )
+        self._member_weights: numpy.ndarray = (
+            self._weights
+            if self._weights is not None
+            else numpy.ones(len(self._members), dtype=numpy.float64)
+        )
+        self._class_count: int = len(voting_classifier.le_.classes_)
+        # Estimated seconds per issue of each member. Members without an
+        # estimate yet are evaluated first, so that they are measured.
+        self._member_costs: List[Optional[float]] = [None] * len(self._members)
+
+        self.statistics: Dict[str, MemberStatistics] = {
+            name: MemberStatistics() for name in self._member_names
+        }
+
+    def __getattr__(self, name: str) -> Any:
+        # Everything but predict, e.g. classes_, is taken from the wrapped
+        # classifier.
+        if name == "_voting_classifier":
+            raise AttributeError(name)
+        return getattr(self._voting_classifier, name)
+
+    def _get_member_order(self) -> List[int]:
+        return sorted(
+            range(len(self._members)),
+            key=lambda member_index: (
+                self._member_costs[member_index] is not None,
+                self._member_costs[member_index] or 0.0,
+            ),
+        )
+
+    def _record_member_cost(
+        self, member_index: int, row_count: int, duration: float
+    ) -> None:
+        cost: float = duration / row_count
+        previous_cost: Optional[float] = self._member_costs[member_index]
+        self._member_costs[member_index] = (
+            cost
+            if previous_cost is None
+            else (1 - _COST_SMOOTHING) * previous_cost + _COST_SMOOTHING * cost
+        )
+
+    def _get_decided_rows(
+        self, votes: numpy.ndarray, remaining_weight: float
+    ) -> numpy.ndarray:
+        """Determine which rows cannot change their outcome anymore.
+
+        A row is decided if its leading class stays ahead of every other class
+        even if all remaining members vote for that other class. A tie is
+        decided as well if the leading class is the lower one, since ties are
+        broken in favour of the lowest class. With non-integer weights, ties
+        are left undecided, since the sums of the weights may differ in the
+        last bit from those computed by the wrapped classifier.
+
+        Args:
+            votes (numpy.ndarray): The votes per row and class so far.
+            remaining_weight (float): The total weight of the members which
+            have not been evaluated yet.
+
+        Returns:
+            numpy.ndarray: A boolean mask of the decided rows.
+        """
+        row_indices = numpy.arange(votes.shape[0])
+        leaders = votes.argmax(axis=1)
+        margins = votes[row_indices, leaders][:, None] - votes
+        if self._weights is None:
+            is_safe = (margins > remaining_weight) | (
+                (margins == remaining_weight)
+                & (leaders[:, None] < numpy.arange(self._class_count))
+            )
+        else:
+            is_safe = margins > remaining_weight + 1e-9 * self._member_weights.sum()
+        is_safe[row_indices, leaders] = True
+
+        return is_safe.all(axis=1)
+
+    def predict(self, X: Any) -> numpy.ndarray:
+        """Predict the classes of the given samples.
+
+        Args:
+            X (Any): The samples, e.g. a CSR matrix of feature vectors.
+
+        Returns:
+            numpy.ndarray: The predicted classes, identical to those of the
+            wrapped classifier.
+        """
+        row_count: int = X.shape[0]
+        member_predictions = numpy.zeros((row_count, len(self._members)), dtype=int)
+        votes = numpy.zeros((row_count, self._class_count), dtype=numpy.float64)
+        remaining_weight: float = float(self._member_weights.sum())
+        undecided_rows = numpy.arange(row_count)
+        decided_leaders = numpy.zeros(row_count, dtype=numpy.intp)
+
+        for member_index in self._get_member_order():
+            member_statistics = self.statistics[self._member_names[member_index]]
+            if undecided_rows.size == 0:
+                member_statistics.skipped_rows += row_count
+                continue
+
+            member_input = X if undecided_rows.size == row_count else X[undecided_rows]
+            start = perf_counter()
+            predictions = numpy.asarray(
+                self._members[member_index].predict(member_input), dtype=numpy.intp
+            )
+            duration: float = perf_counter() - start
+            self._record_member_cost(member_index, undecided_rows.size, duration)
+            member_statistics.evaluated_rows += undecided_rows.size
+            member_statistics.skipped_rows += row_count - undecided_rows.size
+            member_statistics.total_seconds += duration
+
+            member_predictions[undecided_rows, member_index] = predictions
+            votes[undecided_rows, predictions] += self._member_weights[member_index]
+            remaining_weight -= self._member_weights[member_index]
+
+            decided = self._get_decided_rows(votes[undecided_rows], remaining_weight)
+            decided_rows = undecided_rows[decided]
+            decided_leaders[decided_rows] = votes[decided_rows].argmax(axis=1)
+            undecided_rows = undecided_rows[~decided]
+
+        # Rows which were evaluated by every member without being decided early
+        # are decided exactly as by the wrapped classifier.
+        for row_index in undecided_rows:
+            decided_leaders[row_index] = numpy.argmax(
+                numpy.bincount(member_predictions[row_index], weights=self._weights)
+            )
+
+        return self._voting_classifier.le_.inverse_transform(decided_leaders)
+
+    def reset_statistics(self) -> None:
+        """Forget the measured member costs and reset the statistics.
+
+        Used after warming up, since the first predictions of a freshly
+        loaded member are considerably slower than the following ones and
+        would otherwise distort its cost estimate and the statistics.
+        """
+        self._member_costs = [None] * len(self._members)
+        self.statistics = {name: MemberStatistics() for name in self._member_names}
+
+    def get_report(self) -> Dict[str, Dict[str, Any]]:
+        """Return the statistics of all members.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The statistics by member name.
+        """
+        return {
+            name: member_statistics.as_dict()
+            for name, member_statistics in self.statistics.items()
+        }
+
+
+def wrap_voting_classifier(classifier: Any) -> Any:
+    """Wrap the classifier with EarlyExitVotingClassifier if possible.
+
+    Uses the following environment variable:
+        - EARLY_EXIT_VOTING: Whether hard-voting ensembles are wrapped.
+
+    Args:
+        classifier (Any): The loaded classifier.
+
+    Returns:
+        Any: The wrapped classifier if it is a hard-voting ensemble and early
+        exit voting is enabled, otherwise the classifier itself.
+    """
+    if not EARLY_EXIT_VOTING or getattr(classifier, "voting", None) != "hard":
+        return classifier
+
+    try:
+        return EarlyExitVotingClassifier(classifier)
+    except AttributeError:
+        logging.warning(
+            "Classifier "
+            + type(classifier).__name__
+            + " cannot be wrapped for early exit voting."
+        )
+        return classifier
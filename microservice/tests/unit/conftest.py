@@ -0,0 +1,18 @@
+from typing import Iterator
+
+import fakeredis
+import pytest
+import redis
+
+
+@pytest.fixture
+def fake_redis(monkeypatch: pytest.MonkeyPatch) -> Iterator[fakeredis.FakeRedis]:
+    """Let every Redis client created during the test talk to the same fake server."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis.Redis,
+        "from_url",
+        classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server)),
+    )
+
+    yield fakeredis.FakeRedis(server=server)
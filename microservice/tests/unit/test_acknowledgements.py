@@ -0,0 +1,105 @@
+from typing import Any, List, Optional
+
+import pytest
+import ujson
+from pika import BasicProperties
+from pika.spec import Basic
+
+from microservice.batching.fair_scheduler import FairScheduler
+from microservice.batching.request_batcher import RequestBatcher
+from microservice.main import ICMPikaClient
+from microservice.models.models import IndexedIssue
+
+
+class _Channel:
+    is_open: bool = True
+
+    def __init__(self) -> None:
+        self.acknowledged_tags: List[int] = []
+
+    def basic_ack(self, delivery_tag: int) -> None:
+        self.acknowledged_tags.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag: int, requeue: bool) -> None:
+        raise AssertionError("Request rejected")
+
+
+@pytest.fixture
+def dispatched_issues() -> List[IndexedIssue]:
+    return []
+
+
+@pytest.fixture
+def gateway(dispatched_issues: List[IndexedIssue]) -> ICMPikaClient:
+    def dispatch(issues: List[IndexedIssue], priority: Optional[int]) -> None:
+        dispatched_issues.extend(issues)
+
+    gateway = ICMPikaClient.__new__(ICMPikaClient)
+    gateway.auto_ack = True
+    gateway.result_aggregator = None
+    gateway.result_cache = None
+    gateway.fair_scheduler = None
+    gateway.request_batcher = RequestBatcher(dispatch, max_issues=10)
+    gateway._init_acknowledgements()
+
+    return gateway
+
+
+def deliver_request(gateway: ICMPikaClient, channel: Any, delivery_tag: int) -> None:
+    gateway._handle_issue_request(
+        channel,
+        Basic.Deliver(delivery_tag=delivery_tag),
+        BasicProperties(correlation_id="request" + str(delivery_tag)),
+        ujson.dumps([{"index": delivery_tag, "body": "The app crashes"}]).encode(),
+    )
+
+
+def test_batched_requests_are_acknowledged_once_dispatched(
+    gateway: ICMPikaClient, dispatched_issues: List[IndexedIssue]
+) -> None:
+    channel = _Channel()
+
+    deliver_request(gateway, channel, delivery_tag=1)
+    deliver_request(gateway, channel, delivery_tag=2)
+
+    assert not gateway.auto_ack
+    assert dispatched_issues == [] and channel.acknowledged_tags == []
+
+    gateway.request_batcher.flush_expired(force=True)  # type: ignore
+
+    assert [issue.index for issue in dispatched_issues] == [1, 2]
+    assert channel.acknowledged_tags == [1, 2]
+
+
+def test_requests_of_a_full_batch_are_acknowledged_without_waiting(
+    gateway: ICMPikaClient, dispatched_issues: List[IndexedIssue]
+) -> None:
+    channel = _Channel()
+
+    for delivery_tag in range(1, 10):
+        deliver_request(gateway, channel, delivery_tag=delivery_tag)
+    assert channel.acknowledged_tags == []
+
+    deliver_request(gateway, channel, delivery_tag=10)
+
+    assert len(dispatched_issues) == 10
+    assert channel.acknowledged_tags == list(range(1, 11))
+
+
+@pytest.mark.parametrize(
+    "request_batching, fair_scheduling, auto_ack",
+    [(False, False, True), (True, False, False), (False, True, False)],
+)
+def test_auto_ack_is_overridden_if_requests_wait_in_gateway(
+    request_batching: bool, fair_scheduling: bool, auto_ack: bool
+) -> None:
+    gateway = ICMPikaClient.__new__(ICMPikaClient)
+    gateway.auto_ack = True
+    gateway.request_batcher = (
+        RequestBatcher(lambda issues, priority: None) if request_batching else None
+    )
+    gateway.fair_scheduler = FairScheduler(lambda: 0) if fair_scheduling else None
+
+    gateway._init_acknowledgements()
+
+    assert gateway.auto_ack == auto_ack
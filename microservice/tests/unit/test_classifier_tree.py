@@ -0,0 +1,146 @@
+from typing import Any, List, Tuple
+
+import numpy
+import pytest
+from scipy import sparse
+
+import microservice.tree_logic.classifier_tree as classifier_tree
+from microservice.models.models import VectorisedIssue
+from microservice.tree_logic.classifier_tree import ClassifyTree, ClassifyTreeNode
+
+LABEL_CLASSES: List[str] = ["bug", "enhancement", "api", "docu"]
+FEATURE_VECTORS: sparse.csr_matrix = sparse.csr_matrix(
+    numpy.random.RandomState(2020).randint(0, 2, size=(12, 3)).astype(numpy.float64)
+)
+
+
+class _ColumnClassifier:
+    """Classifier predicting 1 for feature vectors with a one in its column."""
+
+    def __init__(self, labels: List[Any]) -> None:
+        self.column: int = sum(map(len, map(str, labels))) % FEATURE_VECTORS.shape[1]
+
+    def predict(self, X: Any) -> numpy.ndarray:
+        return (X[:, self.column].toarray().ravel() > 0.5).astype(int)
+
+
+@pytest.fixture
+def classify_tree(monkeypatch: pytest.MonkeyPatch) -> ClassifyTree:
+    monkeypatch.setattr(classifier_tree, "get_classifier", _ColumnClassifier)
+
+    return ClassifyTree(LABEL_CLASSES)
+
+
+def make_issues(row_indices: List[int]) -> List[VectorisedIssue]:
+    return [
+        VectorisedIssue(
+            index=row_index,
+            body=FEATURE_VECTORS[row_index],
+            labels=["input"],
+            input_label_count=1,
+        )
+        for row_index in row_indices
+    ]
+
+
+def get_results(
+    issues: Tuple[List[VectorisedIssue], List[VectorisedIssue]]
+) -> Tuple[List[Tuple[Any, List[str]]], ...]:
+    return tuple(
+        [(issue.index, issue.labels) for issue in child_issues]
+        for child_issues in issues
+    )
+
+
+def get_chunks(node: ClassifyTreeNode) -> List[List[int]]:
+    """Return a mixed chunk, one chunk per child only and a chunk of one issue."""
+    predictions = node.predict(FEATURE_VECTORS)
+    for_left_child = numpy.flatnonzero(predictions == 0).tolist()
+    for_right_child = numpy.flatnonzero(predictions != 0).tolist()
+    assert for_left_child and for_right_child
+
+    return [
+        list(range(FEATURE_VECTORS.shape[0])),
+        for_left_child,
+        for_right_child,
+        [for_right_child[0]],
+        [],
+    ]
+
+
+def test_batched_classification_equals_classification_per_issue(
+    classify_tree: ClassifyTree,
+) -> None:
+    for node in classify_tree.tree_node_generator():
+        for chunk in get_chunks(node):
+            batched_results = get_results(node.classify(make_issues(chunk)))
+            assert batched_results == get_results(
+                node.classify(make_issues(chunk), batched=False)
+            )
+            assert sorted(
+                index for child_results in batched_results for index, _ in child_results
+            ) == sorted(chunk)
+
+
+def get_level_order_nodes(root_node: ClassifyTreeNode) -> List[ClassifyTreeNode]:
+    """Traverse the recursive tree itself, without the node table."""
+    nodes: List[ClassifyTreeNode] = [root_node]
+    for node in nodes:
+        if node.has_children():
+            children = node.get_children()
+            nodes.extend(
+                [children] if isinstance(children, ClassifyTreeNode) else children
+            )
+
+    return nodes
+
+
+def test_node_table_follows_recursive_tree_in_level_order(
+    classify_tree: ClassifyTree,
+) -> None:
+    nodes = get_level_order_nodes(classify_tree._root_node)
+
+    assert classify_tree.get_node_count() == len(nodes) == 5
+    for index, node in enumerate(nodes, start=1):
+        node_entry = classify_tree.get_node_entry(index)
+        assert node_entry.index == index
+        assert node_entry.node is node is classify_tree.get_node(index)
+        assert node_entry.is_leaf_node == (not node.has_children())
+        child_nodes = [
+            classify_tree.get_node(child_index)
+            for child_index in node_entry.child_indices
+        ]
+        if node.has_children():
+            children = node.get_children()
+            assert child_nodes == (
+                [children] if isinstance(children, ClassifyTreeNode) else list(children)
+            )
+        else:
+            assert child_nodes == []
+
+
+def test_child_routes_follow_children_of_node(classify_tree: ClassifyTree) -> None:
+    to_left_child, to_right_child = make_issues([0, 1]), make_issues([2])
+
+    # The root node sends each side to its own child.
+    assert classify_tree.get_child_routes(1, to_left_child, to_right_child) == [
+        (2, to_left_child),
+        (3, to_right_child),
+    ]
+    assert classify_tree.get_child_routes(1, [], to_right_child) == [
+        (3, to_right_child)
+    ]
+    # A label node sends all of its issues to its single child.
+    assert classify_tree.get_child_routes(2, to_left_child, to_right_child) == [
+        (4, to_left_child + to_right_child)
+    ]
+    # Leaf nodes have no routes.
+    assert classify_tree.get_child_routes(5, to_left_child, to_right_child) == []
+
+
+@pytest.mark.parametrize("index", [0, -1, 6])
+def test_node_entry_of_unknown_index_raises(
+    classify_tree: ClassifyTree, index: int
+) -> None:
+    with pytest.raises(IndexError):
+        classify_tree.get_node_entry(index)
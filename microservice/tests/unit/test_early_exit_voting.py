@@ -0,0 +1,213 @@
+from itertools import permutations, product
+from typing import Any, List, Optional
+
+import numpy
+import pytest
+from scipy import sparse
+from sklearn.dummy import DummyClassifier
+from sklearn.ensemble import VotingClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.tree import DecisionTreeClassifier
+
+import microservice.tree_logic.classifier_tree as classifier_tree
+from microservice.tree_logic.early_exit_voting import EarlyExitVotingClassifier
+
+FEATURE_VECTORS: sparse.csr_matrix = sparse.random(
+    60, 20, density=0.3, format="csr", random_state=2020
+)
+
+
+def fit_voting_classifier(classes: List[Any], **kwargs: Any) -> VotingClassifier:
+    random_state = numpy.random.RandomState(2020)
+    return VotingClassifier(
+        [
+            ("nb", MultinomialNB()),
+            ("sgd", SGDClassifier(random_state=2020)),
+            ("tree", DecisionTreeClassifier(max_depth=3, random_state=2020)),
+            ("lr", LogisticRegression()),
+        ],
+        voting="hard",
+        **kwargs,
+    ).fit(FEATURE_VECTORS, random_state.choice(classes, FEATURE_VECTORS.shape[0]))
+
+
+class _FixedPredictions:
+    """Member predicting fixed classes, indexed by the row IDs it is given."""
+
+    def __init__(self, predictions: numpy.ndarray) -> None:
+        self.predictions = predictions
+
+    def predict(self, X: numpy.ndarray) -> numpy.ndarray:
+        return self.predictions[X[:, 0]]
+
+
+def make_fixed_voting_classifier(
+    member_predictions: numpy.ndarray, weights: Optional[List[float]]
+) -> VotingClassifier:
+    """Create a VotingClassifier whose members predict the given classes.
+
+    The samples are the row IDs of member_predictions, whose columns hold the
+    encoded class predicted by each member.
+    """
+    class_count: int = member_predictions.max() + 1
+    voting_classifier = VotingClassifier(
+        [
+            (str(member_index), DummyClassifier())
+            for member_index in range(member_predictions.shape[1])
+        ],
+        voting="hard",
+        weights=weights,
+    ).fit(numpy.zeros((class_count, 1)), numpy.arange(class_count) * 10)
+    voting_classifier.estimators_ = [
+        _FixedPredictions(member_predictions[:, member_index])
+        for member_index in range(member_predictions.shape[1])
+    ]
+
+    return voting_classifier
+
+
+@pytest.mark.parametrize(
+    "class_count, weights",
+    [
+        (2, None),
+        (3, None),
+        (2, [1, 1, 1, 1, 1]),
+        (3, [2, 1, 1, 1]),
+        # Ties only decided in the last bit, e.g. 0.1 + 0.2 against 0.3.
+        (3, [0.1, 0.2, 0.3, 0.4]),
+        (3, [0.5, 1.5, 1.0, 2.0]),
+    ],
+)
+def test_predictions_equal_those_of_hard_voting(
+    class_count: int, weights: Optional[List[float]]
+) -> None:
+    member_count: int = len(weights) if weights is not None else 4
+    # Every combination of member predictions, including all ties.
+    member_predictions = numpy.array(
+        list(product(range(class_count), repeat=member_count))
+    )
+    voting_classifier = make_fixed_voting_classifier(member_predictions, weights)
+    row_ids = numpy.arange(member_predictions.shape[0])[:, None]
+    expected_predictions = voting_classifier.predict(row_ids)
+
+    for member_order in permutations(range(member_count)):
+        classifier = EarlyExitVotingClassifier(voting_classifier)
+        classifier._member_costs = [float(rank) for rank in member_order]
+
+        numpy.testing.assert_array_equal(
+            classifier.predict(row_ids), expected_predictions
+        )
+
+
+def test_dropped_members_and_their_weights_are_left_out() -> None:
+    member_predictions = numpy.array(list(product(range(2), repeat=3)))
+    voting_classifier = VotingClassifier(
+        [
+            ("first", DummyClassifier()),
+            ("dropped", "drop"),
+            ("second", DummyClassifier()),
+            ("third", DummyClassifier()),
+        ],
+        voting="hard",
+        weights=[1, 100, 2, 1.5],
+    ).fit(numpy.zeros((2, 1)), [0, 10])
+    voting_classifier.estimators_ = [
+        _FixedPredictions(member_predictions[:, member_index])
+        for member_index in range(3)
+    ]
+    row_ids = numpy.arange(member_predictions.shape[0])[:, None]
+
+    classifier = EarlyExitVotingClassifier(voting_classifier)
+
+    assert list(classifier.statistics) == ["first", "second", "third"]
+    numpy.testing.assert_array_equal(classifier._weights, [1, 2, 1.5])
+    numpy.testing.assert_array_equal(
+        classifier.predict(row_ids), voting_classifier.predict(row_ids)
+    )
+
+
+@pytest.mark.parametrize(
+    "votes, remaining_weight, decided",
+    [
+        # The leader cannot be caught up anymore.
+        ([3.0, 1.0], 1.0, True),
+        ([1.0, 1.0], 1.0, False),
+        # A tie is broken in favour of the lowest class.
+        ([2.0, 1.0], 1.0, True),
+        ([1.0, 2.0], 1.0, False),
+        ([1.0, 1.0], 0.0, True),
+        ([0.0, 2.0, 1.0], 1.0, True),
+        ([0.0, 1.0, 2.0], 1.0, False),
+        ([0.0, 1.0, 2.0], 0.5, True),
+    ],
+)
+def test_decided_rows_without_weights(
+    votes: List[float], remaining_weight: float, decided: bool
+) -> None:
+    classifier = EarlyExitVotingClassifier(
+        make_fixed_voting_classifier(numpy.array([[0, 1, 2]]), weights=None)
+    )
+    classifier._class_count = len(votes)
+
+    assert classifier._get_decided_rows(
+        numpy.array([votes]), remaining_weight
+    ).tolist() == [decided]
+
+
+@pytest.mark.parametrize(
+    "votes, remaining_weight, decided",
+    [
+        ([0.6, 0.3], 0.2, True),
+        # Ties are left to the wrapped classifier with non-integer weights.
+        ([0.3, 0.3], 0.0, False),
+        ([0.5, 0.3], 0.2, False),
+        # A margin within the tolerance is not trusted either.
+        ([0.1 + 0.2, 0.3], 0.0, False),
+        ([0.3 + 1e-12, 0.3], 0.0, False),
+    ],
+)
+def test_decided_rows_with_weights(
+    votes: List[float], remaining_weight: float, decided: bool
+) -> None:
+    classifier = EarlyExitVotingClassifier(
+        make_fixed_voting_classifier(numpy.array([[0, 1, 1]]), [0.1, 0.2, 0.3])
+    )
+
+    assert classifier._get_decided_rows(
+        numpy.array([votes]), remaining_weight
+    ).tolist() == [decided]
+
+
+def test_reset_statistics_forgets_costs_and_counters() -> None:
+    classifier = EarlyExitVotingClassifier(fit_voting_classifier([0, 1]))
+    classifier.predict(FEATURE_VECTORS)
+
+    classifier.reset_statistics()
+
+    assert classifier._member_costs == [None] * 4
+    assert all(
+        report["evaluated_rows"] == report["skipped_rows"] == 0
+        for report in classifier.get_report().values()
+    )
+
+
+def test_warm_up_resets_statistics_of_every_node(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        classifier_tree,
+        "get_classifier",
+        lambda labels: fit_voting_classifier([str(label) for label in labels]),
+    )
+    classify_tree = classifier_tree.ClassifyTree(["bug", "enhancement", "api", "docu"])
+
+    classify_tree.warm_up(FEATURE_VECTORS[0])
+
+    for node in classify_tree.tree_node_generator():
+        assert isinstance(node.classifier, EarlyExitVotingClassifier)
+        assert node.classifier._member_costs == [None] * 4
+        assert all(
+            report["evaluated_rows"] == 0
+            for report in node.classifier.get_report().values()
+        )
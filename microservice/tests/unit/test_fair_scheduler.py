@@ -0,0 +1,100 @@
+from typing import Iterator, List, Tuple
+
+import pytest
+
+from microservice.batching.fair_scheduler import FairScheduler
+
+
+class _Queue:
+    """Stand-in for the queue of the workers recording the dispatched chunks."""
+
+    def __init__(self) -> None:
+        self.queued_tasks: int = 0
+        self.chunks: List[Tuple[str, int]] = []
+
+    def __call__(self) -> int:
+        return self.queued_tasks
+
+    def make_steps(self, request_name: str, chunk_count: int) -> Iterator[None]:
+        """Return the dispatch steps of a request of chunk_count chunks."""
+        for chunk_index in range(chunk_count):
+            self.chunks.append((request_name, chunk_index))
+            if chunk_index < chunk_count - 1:
+                yield
+
+
+@pytest.fixture
+def queue() -> _Queue:
+    return _Queue()
+
+
+def test_requests_of_higher_priority_are_served_first(queue: _Queue) -> None:
+    scheduler = FairScheduler(queue, max_queued_tasks=10)
+    queue.queued_tasks = 10
+
+    scheduler.submit("client", 1, queue.make_steps("low", 2))
+    scheduler.submit("other client", 5, queue.make_steps("high", 2))
+    scheduler.submit("client", 3, queue.make_steps("medium", 1))
+    assert queue.chunks == []
+
+    queue.queued_tasks = 0
+    assert scheduler.pump() == 5
+    assert queue.chunks == [
+        ("high", 0),
+        ("high", 1),
+        ("medium", 0),
+        ("low", 0),
+        ("low", 1),
+    ]
+
+
+def test_clients_of_a_lane_are_served_in_turns(queue: _Queue) -> None:
+    scheduler = FairScheduler(queue, max_queued_tasks=10)
+    queue.queued_tasks = 10
+
+    scheduler.submit("backfill", 0, queue.make_steps("backfill 1", 2))
+    scheduler.submit("backfill", 0, queue.make_steps("backfill 2", 2))
+    scheduler.submit("interactive", 0, queue.make_steps("interactive", 3))
+
+    queue.queued_tasks = 0
+    assert scheduler.pump() == 7
+    assert queue.chunks == [
+        ("backfill 1", 0),
+        ("interactive", 0),
+        ("backfill 1", 1),
+        ("interactive", 1),
+        ("backfill 2", 0),
+        ("interactive", 2),
+        ("backfill 2", 1),
+    ]
+
+
+def test_steps_are_only_taken_while_the_queue_is_short(queue: _Queue) -> None:
+    scheduler = FairScheduler(queue, max_queued_tasks=3)
+    queue.queued_tasks = 1
+
+    # Submitting a request takes as many steps as there are free slots.
+    scheduler.submit("client", 0, queue.make_steps("request", 5))
+    assert queue.chunks == [("request", 0), ("request", 1)]
+
+    queue.queued_tasks = 3
+    assert scheduler.pump() == 0
+
+    queue.queued_tasks = 2
+    assert scheduler.pump() == 1
+    assert queue.chunks[-1] == ("request", 2)
+
+    queue.queued_tasks = 0
+    assert scheduler.pump() == 2
+    assert queue.chunks[-2:] == [("request", 3), ("request", 4)]
+    assert scheduler.pump() == 0
+
+
+def test_pump_survives_failing_queue_inspection() -> None:
+    def get_queued_tasks() -> int:
+        raise ConnectionError("Broker unreachable")
+
+    scheduler = FairScheduler(get_queued_tasks, max_queued_tasks=3)
+    scheduler.submit("client", 0, iter([None]))
+
+    assert scheduler.pump() == 0
@@ -0,0 +1,39 @@
+from typing import Type
+
+import numpy
+import pytest
+from scipy import sparse
+
+from microservice.models.feature_vectors import split_csr_rows, stack_feature_vectors
+
+
+@pytest.mark.parametrize("matrix_type", [sparse.csr_matrix, sparse.csr_array])
+@pytest.mark.parametrize("index_dtype", [numpy.int32, numpy.int64])
+def test_split_csr_rows_equals_row_indexing(
+    matrix_type: Type[sparse.csr_matrix], index_dtype: Type[numpy.integer]
+) -> None:
+    dense_feature_vectors = numpy.random.RandomState(2020).rand(6, 20)
+    dense_feature_vectors[dense_feature_vectors < 0.8] = 0
+    dense_feature_vectors[3] = 0
+    feature_vectors = matrix_type(dense_feature_vectors)
+    feature_vectors.indices = feature_vectors.indices.astype(index_dtype)
+    feature_vectors.indptr = feature_vectors.indptr.astype(index_dtype)
+
+    rows = split_csr_rows(feature_vectors)
+
+    assert len(rows) == 6
+    assert rows[3].nnz == 0
+    for row_index, row in enumerate(rows):
+        assert type(row) is matrix_type
+        assert row.shape == (1, 20)
+        assert numpy.shares_memory(row.data, feature_vectors.data) == (row.nnz > 0)
+        numpy.testing.assert_array_equal(
+            row.toarray(), feature_vectors[[row_index]].toarray()
+        )
+    numpy.testing.assert_array_equal(
+        stack_feature_vectors(rows).toarray(), feature_vectors.toarray()
+    )
+
+
+def test_split_csr_rows_of_empty_matrix() -> None:
+    assert split_csr_rows(sparse.csr_matrix((0, 20))) == []
@@ -0,0 +1,100 @@
+import copy
+import importlib
+from pathlib import Path
+from typing import Callable, Iterator, List
+
+import joblib
+import pytest
+
+import microservice.config.load_classifier as load_classifier
+from microservice.config.classifier_config import Configuration
+from microservice.models.hashing_vectoriser import HashingTfidfVectoriser
+
+from tools.train_hashing_models import (
+    VECTORISER_FILE,
+    LabelledIssue,
+    create_default_ensemble,
+    get_node_dataset,
+)
+
+ROOT_LABELS: List[str] = ["bug", "enhancement"]
+FEATURE_COUNT: int = 2**10
+LABELLED_ISSUES: List[LabelledIssue] = [
+    ("The app crashes with an exception " + str(index), ["bug"]) for index in range(10)
+] + [
+    ("Please add a new option for exports " + str(index), ["enhancement"])
+    for index in range(10)
+]
+
+
+@pytest.fixture
+def reload_load_classifier(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> Iterator[Callable[[str], None]]:
+    """Reload the loader in a vectoriser mode, with the hashing models in tmp_path.
+
+    The loader is reloaded with its original configuration after the test.
+    """
+    config_values = copy.deepcopy(Configuration._config_values)
+    config_values["classifier"]["path"]["hashingLoadFolder"] = str(tmp_path)
+    config_values["vectorizer"]["path"]["hashingLoadPath"] = str(
+        tmp_path / VECTORISER_FILE
+    )
+    monkeypatch.setattr(Configuration, "_config_values", config_values)
+
+    def reload(vectoriser_mode: str) -> None:
+        monkeypatch.setenv("VECTORISER_MODE", vectoriser_mode)
+        importlib.reload(load_classifier)
+
+    yield reload
+    monkeypatch.undo()
+    importlib.reload(load_classifier)
+
+
+@pytest.fixture
+def retrained_models(tmp_path: Path) -> None:
+    """Store a hashing vectoriser and a root node retrained against it."""
+    vectoriser = HashingTfidfVectoriser(n_features=FEATURE_COUNT).fit(
+        body for body, _ in LABELLED_ISSUES
+    )
+    issue_bodies, classes = get_node_dataset(ROOT_LABELS, LABELLED_ISSUES)
+    joblib.dump(vectoriser, tmp_path / VECTORISER_FILE)
+    joblib.dump(
+        create_default_ensemble().fit(vectoriser.transform(issue_bodies), classes),
+        tmp_path
+        / next(
+            classifier_location["path"]
+            for classifier_location in load_classifier.classifier_locations
+            if classifier_location["labels"] == ROOT_LABELS
+        ),
+    )
+
+
+def test_tfidf_models_are_loaded_by_default(
+    reload_load_classifier: Callable[[str], None], tmp_path: Path
+) -> None:
+    reload_load_classifier("tfidf")
+
+    assert load_classifier.get_vectoriser_path() == (
+        Configuration().get_value_from_config("vectorizer path loadPath")
+    )
+    assert load_classifier.root_folder != str(tmp_path)
+
+
+@pytest.mark.usefixtures("retrained_models")
+def test_hashing_mode_loads_vectoriser_matching_the_retrained_models(
+    reload_load_classifier: Callable[[str], None], tmp_path: Path
+) -> None:
+    reload_load_classifier("hashing")
+
+    assert load_classifier.get_vectoriser_path() == str(tmp_path / VECTORISER_FILE)
+    assert load_classifier.root_folder == str(tmp_path)
+
+    vectoriser = load_classifier.get_vectoriser()
+    classifier = load_classifier.get_classifier(ROOT_LABELS)
+    feature_vectors = vectoriser.transform(["The app crashes", "Add an option"])
+
+    assert isinstance(vectoriser, HashingTfidfVectoriser)
+    assert feature_vectors.shape == (2, FEATURE_COUNT)
+    assert classifier.n_features_in_ == FEATURE_COUNT
+    assert list(classifier.predict(feature_vectors)) == [0, 1]
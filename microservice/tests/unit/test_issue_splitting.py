@@ -0,0 +1,60 @@
+import logging
+from typing import List
+
+import pytest
+
+import microservice.classifier_celery.helper_functions as helper_functions
+from microservice.classifier_celery.helper_functions import determine_issues_per_worker
+
+
+@pytest.fixture(autouse=True)
+def classifier_concurrency(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Let the classifier workers report 4 processes without inspecting them."""
+    monkeypatch.setattr(helper_functions, "inspect_classifier_concurrency", lambda: 4)
+    monkeypatch.setattr(helper_functions, "CLASSIFY_CHUNK_MIN_ISSUES", 2)
+    monkeypatch.setattr(helper_functions, "CLASSIFY_CHUNK_MAX_ISSUES", 10)
+    monkeypatch.setattr(helper_functions, "_classifier_concurrency", None)
+    monkeypatch.setattr(helper_functions, "_classifier_concurrency_expiry", 0.0)
+    monkeypatch.setattr(helper_functions, "_is_split_plan_logged", False)
+    # Refresh the concurrency right away instead of in a background thread.
+    helper_functions._refresh_classifier_concurrency()
+
+
+def get_split_plan_levels(caplog: pytest.LogCaptureFixture) -> List[int]:
+    return [
+        record.levelno
+        for record in caplog.records
+        if record.getMessage().startswith("Splitting")
+    ]
+
+
+@pytest.mark.parametrize(
+    "issue_count, expected_issues_per_task",
+    [(1, 2), (8, 2), (20, 5), (100, 10)],
+)
+def test_issues_are_split_evenly_within_the_chunk_limits(
+    issue_count: int, expected_issues_per_task: int
+) -> None:
+    assert determine_issues_per_worker([None] * issue_count) == (
+        expected_issues_per_task
+    )
+
+
+def test_split_plan_is_logged_at_info_level_once_per_refresh(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    with caplog.at_level(logging.DEBUG):
+        determine_issues_per_worker([None] * 20)
+        determine_issues_per_worker([None] * 20)
+        helper_functions._refresh_classifier_concurrency()
+        determine_issues_per_worker([None] * 20)
+
+    assert get_split_plan_levels(caplog) == [
+        logging.INFO,
+        logging.DEBUG,
+        logging.INFO,
+    ]
+    assert caplog.messages[-1] == (
+        "Splitting 20 issues into 4 tasks of up to 5 issues for 4 classifier "
+        "processes (from inspect)."
+    )
@@ -0,0 +1,106 @@
+import json
+from typing import Any, List
+
+import pytest
+import ujson
+
+import microservice.models.issue_stream as issue_stream
+from microservice.models.issue_stream import (
+    count_json_array_elements,
+    iterate_indexed_issue_chunks,
+    iterate_json_array,
+)
+
+JSON_ARRAYS: List[str] = [
+    "[]",
+    " \n[ \t]\r\n",
+    "[1,2,3]",
+    "[ 1 ,\n2\t, 3 ]",
+    '[1.5e3, -0.25E-3, 1234567, true, false, null, "ä€😀 \\"quoted\\""]',
+    '[{"index": "1", "body": "a", "labels": ["x"]}, [[], {}], {"a": {"b": [1]}}]',
+]
+MALFORMED_JSON_ARRAYS: List[str] = [
+    "",
+    "{}",
+    "1",
+    "[",
+    "[1",
+    "[1,",
+    "[1,]",
+    "[,1]",
+    "[1 2]",
+    "[1]]",
+    "[1] x",
+    "[01]",
+    "[1.]",
+    "[tru]",
+    '["unterminated]',
+]
+
+
+@pytest.fixture(params=[1, 3, 7, 64 * 1024])
+def window_bytes(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> int:
+    """Decode the message bodies in windows of the given number of bytes."""
+    monkeypatch.setattr(issue_stream, "_WINDOW_BYTES", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("json_array", JSON_ARRAYS)
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-8-sig", "utf-16-le", "utf-32"])
+def test_elements_equal_those_parsed_at_once(
+    window_bytes: int, json_array: str, encoding: str
+) -> None:
+    message_body: bytes = json_array.encode(encoding)
+
+    assert list(iterate_json_array(message_body)) == json.loads(json_array)
+    assert count_json_array_elements(message_body) == len(json.loads(json_array))
+
+
+@pytest.mark.parametrize("json_array", MALFORMED_JSON_ARRAYS)
+def test_malformed_arrays_are_rejected(window_bytes: int, json_array: str) -> None:
+    with pytest.raises(ValueError):
+        list(iterate_json_array(json_array.encode("utf-8")))
+
+
+def test_elements_before_the_malformed_part_are_handed_out(window_bytes: int) -> None:
+    elements: List[Any] = []
+
+    with pytest.raises(ValueError, match="position 8"):
+        for element in iterate_json_array(b'[1, "2" 3]'):
+            elements.append(element)
+
+    assert elements == [1, "2"]
+
+
+@pytest.mark.parametrize("issue_count, chunk_size", [(0, 2), (1, 2), (4, 2), (5, 2)])
+def test_issues_are_handed_out_in_chunks_of_bounded_size(
+    window_bytes: int, issue_count: int, chunk_size: int
+) -> None:
+    message_body: bytes = ujson.dumps(
+        [
+            {"index": index, "body": "Body " + str(index), "labels": ["bug"]}
+            for index in range(issue_count)
+        ]
+    ).encode("utf-8")
+
+    chunks = list(iterate_indexed_issue_chunks(message_body, chunk_size))
+
+    assert [len(chunk) for chunk in chunks] == [
+        min(chunk_size, issue_count - chunk_start)
+        for chunk_start in range(0, issue_count, chunk_size)
+    ]
+    assert [(issue.index, issue.body) for chunk in chunks for issue in chunk] == [
+        (index, "Body " + str(index)) for index in range(issue_count)
+    ]
+
+
+def test_internal_fields_are_not_taken_from_the_stream(window_bytes: int) -> None:
+    message_body: bytes = ujson.dumps(
+        [{"index": 1, "body": "Body", "request_id": "spoofed", "body_hash": "spoofed"}]
+    ).encode("utf-8")
+
+    ((issue,),) = iterate_indexed_issue_chunks(message_body, 2)
+
+    assert (issue.request_id, issue.body_hash) == (None, None)
@@ -0,0 +1,98 @@
+import threading
+from http.server import ThreadingHTTPServer
+from typing import Iterator
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from microservice.metrics.registry import (
+    REGISTRY,
+    MetricsRegistry,
+    _MetricsRequestHandler,
+)
+
+
+@pytest.fixture
+def metrics_server() -> Iterator[str]:
+    """Serve the metrics of the process on a free port, returning its URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:" + str(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_counter_is_rendered_per_label_values() -> None:
+    registry = MetricsRegistry()
+    counter = registry.counter("icm_issues_total", "Issues.", ["queue", "outcome"])
+
+    counter.inc(2, "classify", "success")
+    counter.inc(1.5, "classify", "success")
+    counter.inc(1, 'vector"ise\\', "failure")
+
+    assert registry.render() == (
+        "# HELP icm_issues_total Issues.\n"
+        "# TYPE icm_issues_total counter\n"
+        'icm_issues_total{queue="classify",outcome="success"} 3.5\n'
+        'icm_issues_total{queue="vector\\"ise\\\\",outcome="failure"} 1\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative_and_include_their_upper_bound() -> None:
+    registry = MetricsRegistry()
+    histogram = registry.histogram(
+        "icm_duration_seconds", "Durations.", ["queue"], buckets=(0.1, 1, 10)
+    )
+
+    for value in (0.05, 0.1, 0.5, 1, 100):
+        histogram.observe(value, "classify")
+
+    assert registry.render() == (
+        "# HELP icm_duration_seconds Durations.\n"
+        "# TYPE icm_duration_seconds histogram\n"
+        'icm_duration_seconds_bucket{queue="classify",le="0.1"} 2\n'
+        'icm_duration_seconds_bucket{queue="classify",le="1"} 4\n'
+        'icm_duration_seconds_bucket{queue="classify",le="10"} 4\n'
+        'icm_duration_seconds_bucket{queue="classify",le="+Inf"} 5\n'
+        'icm_duration_seconds_sum{queue="classify"} 101.65\n'
+        'icm_duration_seconds_count{queue="classify"} 5\n'
+    )
+
+
+def test_histogram_without_labels_renders_only_the_bucket_label() -> None:
+    registry = MetricsRegistry()
+    histogram = registry.histogram("icm_issues", "Issues.", buckets=(1, 2))
+
+    histogram.observe(2)
+
+    assert registry.render().splitlines()[2:] == [
+        'icm_issues_bucket{le="1"} 0',
+        'icm_issues_bucket{le="2"} 1',
+        'icm_issues_bucket{le="+Inf"} 1',
+        "icm_issues_sum 2.0",
+        "icm_issues_count 1",
+    ]
+
+
+def test_registry_renders_metrics_sorted_by_name() -> None:
+    registry = MetricsRegistry()
+    registry.histogram("icm_b", "B.")
+    registry.counter("icm_c", "C.").inc()
+    registry.counter("icm_a", "A.")
+
+    assert [
+        line for line in registry.render().splitlines() if line.startswith("# TYPE")
+    ] == ["# TYPE icm_a counter", "# TYPE icm_b histogram", "# TYPE icm_c counter"]
+
+
+def test_metrics_are_served_in_the_text_format(metrics_server: str) -> None:
+    with urlopen(metrics_server + "/metrics") as response:
+        assert response.headers["Content-Type"] == (
+            "text/plain; version=0.0.4; charset=utf-8"
+        )
+        assert response.read().decode("utf-8") == REGISTRY.render()
+
+    with pytest.raises(HTTPError) as error:
+        urlopen(metrics_server + "/other")
+    assert error.value.code == 404
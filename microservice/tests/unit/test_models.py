@@ -0,0 +1,86 @@
+from typing import Any, Callable, List, Tuple
+
+import pytest
+
+from microservice.models.models import IndexedIssue, parse_indexed_issues
+
+from benchmarks.models_benchmark import PydanticIndexedIssue
+
+# Issues covering the conversions and rejections of the input schema.
+VALIDATION_CASES: List[Any] = (
+    [
+        {"index": value, "body": "body"}
+        for value in [1, True, 1.5, -2.0, "42", " 42 ", "abc", "", "1e3", "0x10", "+5"]
+        + [None, [1], {}, 10**30]
+    ]
+    + [
+        {"index": 1, "body": value}
+        for value in ["body", "", 1, True, 1.5, None, [], {}]
+    ]
+    + [
+        {"index": 1, "body": "body", "labels": value}
+        for value in [[], ["bug", 1, 1.5, True], None, "bug", [None], [[1]], {"a": 1}]
+    ]
+    + [
+        {"body": "body"},
+        {"index": 1},
+        {"index": 1, "body": "body", "unknown": 1},
+        [["index", 1], ["body", "body"]],
+        "issue",
+        1,
+        None,
+    ]
+)
+
+
+def decode(decoder: Callable[[Any], Any], value: Any) -> Tuple[bool, Any]:
+    try:
+        issue = decoder(value)
+    except ValueError:
+        return False, None
+
+    return True, (
+        issue.index,
+        type(issue.index),
+        issue.body,
+        issue.labels,
+    )
+
+
+@pytest.mark.parametrize("case", VALIDATION_CASES)
+def test_parse_obj_accepts_and_converts_like_pydantic(case: Any) -> None:
+    assert decode(IndexedIssue.parse_obj, case) == decode(
+        PydanticIndexedIssue.parse_obj, case
+    )
+
+
+def test_parse_indexed_issues_converts_and_rejects_like_parse_obj() -> None:
+    assert [
+        issue.dict() for issue in parse_indexed_issues(b'[{"index": "1", "body": 2}]')
+    ] == [
+        {
+            "index": 1,
+            "body": "2",
+            "labels": [],
+            "request_id": None,
+            "body_hash": None,
+        }
+    ]
+    with pytest.raises(ValueError):
+        parse_indexed_issues(b'[{"index": 1, "body": "body"}, {"index": 2}]')
+
+
+@pytest.mark.parametrize("value", [None, "spoofed", 1, [], True])
+def test_internal_fields_are_not_taken_from_clients(value: Any) -> None:
+    issue = IndexedIssue.parse_obj(
+        {"index": 1, "body": "body", "request_id": value, "body_hash": value}
+    )
+
+    assert (issue.request_id, issue.body_hash) == (None, None)
+    assert [
+        (issue.request_id, issue.body_hash)
+        for issue in parse_indexed_issues(
+            b'[{"index": 1, "body": "body", "request_id": "spoofed",'
+            b' "body_hash": "spoofed"}]'
+        )
+    ] == [(None, None)]
@@ -0,0 +1,62 @@
+from typing import Iterator, List
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import microservice.models.parallel_vectorisation as parallel_vectorisation
+
+ISSUE_BODIES: List[str] = [
+    "The application crashes when the API is called " + str(index)
+    for index in range(20)
+] + ["Please add documentation " + str(index) for index in range(17)]
+
+
+@pytest.fixture
+def vectoriser(monkeypatch: pytest.MonkeyPatch) -> Iterator[TfidfVectorizer]:
+    monkeypatch.setattr(parallel_vectorisation, "VECTORISATION_PROCESSES", 2)
+    monkeypatch.setattr(parallel_vectorisation, "VECTORISATION_PARALLEL_MIN_ISSUES", 2)
+    yield TfidfVectorizer().fit(ISSUE_BODIES)
+    parallel_vectorisation.stop_vectorisation_pool()
+
+
+def test_large_batches_are_split_across_started_pool(
+    vectoriser: TfidfVectorizer,
+) -> None:
+    vectorisation_pool = parallel_vectorisation.start_vectorisation_pool(vectoriser)
+
+    feature_vectors = parallel_vectorisation.transform_issue_bodies(
+        vectoriser, ISSUE_BODIES
+    )
+
+    assert vectorisation_pool is not None
+    assert parallel_vectorisation.start_vectorisation_pool(vectoriser) is (
+        vectorisation_pool
+    )
+    assert (feature_vectors != vectoriser.transform(ISSUE_BODIES)).nnz == 0
+
+
+def test_pool_is_not_forked_on_demand(
+    vectoriser: TfidfVectorizer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def fail(*args: object) -> None:
+        raise AssertionError("Vectorisation pool forked on demand")
+
+    monkeypatch.setattr(parallel_vectorisation.multiprocessing, "get_context", fail)
+
+    feature_vectors = parallel_vectorisation.transform_issue_bodies(
+        vectoriser, ISSUE_BODIES
+    )
+
+    assert (feature_vectors != vectoriser.transform(ISSUE_BODIES)).nnz == 0
+
+
+def test_pool_of_other_vectoriser_is_not_used(vectoriser: TfidfVectorizer) -> None:
+    parallel_vectorisation.start_vectorisation_pool(vectoriser)
+    other_vectoriser = TfidfVectorizer().fit(ISSUE_BODIES[:20])
+
+    feature_vectors = parallel_vectorisation.transform_issue_bodies(
+        other_vectoriser, ISSUE_BODIES
+    )
+
+    assert feature_vectors.shape[1] == len(other_vectoriser.vocabulary_)
+    assert (feature_vectors != other_vectoriser.transform(ISSUE_BODIES)).nnz == 0
@@ -0,0 +1,61 @@
+from typing import Any, Callable, List, Tuple
+
+import pytest
+
+import microservice.main as main
+from microservice.main import ICMPikaClient
+
+
+class _Failing:
+    """Stand-in for the aggregator, cache, batcher or scheduler of the gateway."""
+
+    interval_s: float = 1.0
+    max_wait_s: float = 1.0
+    model_version: str = "version"
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        def fail(*args: Any, **kwargs: Any) -> Any:
+            raise RuntimeError(name + " failed")
+
+        return fail
+
+
+@pytest.fixture
+def gateway(monkeypatch: pytest.MonkeyPatch) -> ICMPikaClient:
+    gateway = ICMPikaClient.__new__(ICMPikaClient)
+    gateway.result_aggregator = _Failing()  # type: ignore
+    gateway.result_cache = _Failing()  # type: ignore
+    gateway.request_batcher = _Failing()  # type: ignore
+    gateway.fair_scheduler = _Failing()  # type: ignore
+    gateway.scheduled_callbacks: List[Tuple[float, Callable[[], None]]] = []
+    monkeypatch.setattr(
+        gateway,
+        "_call_later",
+        lambda delay, callback: gateway.scheduled_callbacks.append((delay, callback)),
+    )
+    monkeypatch.setattr(main, "get_model_version", _Failing().get_model_version)
+
+    return gateway
+
+
+@pytest.mark.parametrize(
+    "callback_name",
+    [
+        "_flush_expired_results",
+        "_check_model_version",
+        "_flush_expired_batch",
+        "_pump_fair_scheduler",
+    ],
+)
+def test_failing_periodic_callback_is_logged_and_rescheduled(
+    gateway: ICMPikaClient, callback_name: str, caplog: pytest.LogCaptureFixture
+) -> None:
+    callback = getattr(gateway, callback_name)
+
+    callback()
+
+    assert [
+        scheduled_callback for delay, scheduled_callback in gateway.scheduled_callbacks
+    ] == [callback]
+    assert "failed" in caplog.records[-1].getMessage()
+    assert caplog.records[-1].exc_info is not None
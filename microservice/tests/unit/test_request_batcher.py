@@ -0,0 +1,191 @@
+from typing import List, Optional, Tuple
+
+import pytest
+
+import microservice.batching.request_batcher as request_batcher_module
+from microservice.batching.request_batcher import DispatchGroup, RequestBatcher
+from microservice.models.models import IndexedIssue
+
+
+class _Dispatcher:
+    """Records the dispatched batches, optionally failing to dispatch them."""
+
+    def __init__(self) -> None:
+        self.batches: List[Tuple[List[str], Optional[int]]] = []
+        self.exception: Optional[Exception] = None
+
+    def __call__(self, issues: List[IndexedIssue], priority: Optional[int]) -> None:
+        if self.exception is not None:
+            raise self.exception
+        self.batches.append(([issue.index for issue in issues], priority))
+
+
+class _Request:
+    """Records the outcomes the batcher reports for a request."""
+
+    def __init__(self) -> None:
+        self.outcomes: List[Optional[BaseException]] = []
+
+    def __call__(self, exception: Optional[BaseException]) -> None:
+        self.outcomes.append(exception)
+
+
+def make_issues(*indices: str, body_length: int = 10) -> List[IndexedIssue]:
+    return [IndexedIssue(index=index, body="x" * body_length) for index in indices]
+
+
+@pytest.fixture
+def now(monkeypatch: pytest.MonkeyPatch) -> List[float]:
+    """Let the batcher use a clock which only advances when told so."""
+    now: List[float] = [100.0]
+    monkeypatch.setattr(request_batcher_module, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def dispatcher() -> _Dispatcher:
+    return _Dispatcher()
+
+
+def test_batch_is_dispatched_once_it_reaches_max_issues(
+    dispatcher: _Dispatcher,
+) -> None:
+    batcher = RequestBatcher(dispatcher, max_issues=3, max_bytes=1000)
+    first_request, second_request = _Request(), _Request()
+
+    batcher.add(make_issues("1", "2"), first_request)
+    assert dispatcher.batches == [] and first_request.outcomes == []
+
+    batcher.add(make_issues("3"), second_request)
+    assert dispatcher.batches == [(["1", "2", "3"], None)]
+    assert first_request.outcomes == [None] and second_request.outcomes == [None]
+
+
+def test_pending_batch_is_dispatched_before_exceeding_max_issues(
+    dispatcher: _Dispatcher,
+) -> None:
+    batcher = RequestBatcher(dispatcher, max_issues=3, max_bytes=1000)
+    first_request, second_request = _Request(), _Request()
+
+    batcher.add(make_issues("1", "2"), first_request)
+    batcher.add(make_issues("3", "4"), second_request)
+
+    assert dispatcher.batches == [(["1", "2"], None)]
+    assert first_request.outcomes == [None] and second_request.outcomes == []
+
+
+def test_batch_is_dispatched_once_it_reaches_max_bytes(
+    dispatcher: _Dispatcher,
+) -> None:
+    batcher = RequestBatcher(dispatcher, max_issues=100, max_bytes=25)
+
+    batcher.add(make_issues("1", body_length=10), _Request())
+    batcher.add(make_issues("2", body_length=10), _Request())
+    assert dispatcher.batches == []
+
+    # The third body would exceed the limit, so the pending batch goes first.
+    batcher.add(make_issues("3", body_length=10), _Request())
+    assert dispatcher.batches == [(["1", "2"], None)]
+
+    batcher.add(make_issues("4", body_length=15), _Request())
+    assert dispatcher.batches == [(["1", "2"], None), (["3", "4"], None)]
+
+
+def test_request_exceeding_the_limits_forms_a_batch_of_its_own(
+    dispatcher: _Dispatcher,
+) -> None:
+    batcher = RequestBatcher(dispatcher, max_issues=2, max_bytes=1000)
+
+    batcher.add(make_issues("1"), _Request())
+    batcher.add(make_issues("2", "3", "4"), _Request())
+
+    assert dispatcher.batches == [(["1"], None), (["2", "3", "4"], None)]
+
+
+def test_batch_is_dispatched_once_its_oldest_request_has_waited_too_long(
+    dispatcher: _Dispatcher, now: List[float]
+) -> None:
+    batcher = RequestBatcher(dispatcher, max_issues=10, max_wait_ms=50)
+    first_request, second_request = _Request(), _Request()
+
+    batcher.add(make_issues("1"), first_request)
+    now[0] += 0.03
+    batcher.add(make_issues("2"), second_request)
+    now[0] += 0.01
+    assert batcher.flush_expired() == 0
+    assert dispatcher.batches == [] and first_request.outcomes == []
+
+    now[0] += 0.02
+    assert batcher.flush_expired() == 2
+    assert dispatcher.batches == [(["1", "2"], None)]
+    assert first_request.outcomes == [None] and second_request.outcomes == [None]
+    assert batcher.flush_expired(force=True) == 0
+
+
+def test_forced_flush_dispatches_pending_batch_regardless_of_its_age(
+    dispatcher: _Dispatcher, now: List[float]
+) -> None:
+    batcher = RequestBatcher(dispatcher, max_issues=10, max_wait_ms=50)
+
+    batcher.add(make_issues("1"), _Request())
+
+    assert batcher.flush_expired(force=True) == 1
+    assert dispatcher.batches == [(["1"], None)]
+
+
+def test_batch_is_dispatched_with_highest_priority_of_its_requests(
+    dispatcher: _Dispatcher,
+) -> None:
+    batcher = RequestBatcher(dispatcher, max_issues=3)
+
+    batcher.add(make_issues("1"), _Request(), priority=2)
+    batcher.add(make_issues("2"), _Request(), priority=None)
+    batcher.add(make_issues("3"), _Request(), priority=5)
+    batcher.add(make_issues("4"), _Request())
+    batcher.flush_expired(force=True)
+
+    assert dispatcher.batches == [(["1", "2", "3"], 5), (["4"], None)]
+
+
+def test_failed_dispatch_is_reported_to_every_request_of_the_batch(
+    dispatcher: _Dispatcher,
+) -> None:
+    batcher = RequestBatcher(dispatcher, max_issues=10)
+    requests = [_Request(), _Request()]
+    dispatcher.exception = ConnectionError("Broker unreachable")
+
+    for request_index, request in enumerate(requests):
+        batcher.add(make_issues(str(request_index)), request)
+    batcher.flush_expired(force=True)
+
+    assert [request.outcomes for request in requests] == [
+        [dispatcher.exception],
+        [dispatcher.exception],
+    ]
+
+
+def test_dispatch_group_settles_once_all_parts_are_dispatched() -> None:
+    request = _Request()
+    dispatch_group = DispatchGroup(request)
+    first_part, second_part = dispatch_group.add_part(), dispatch_group.add_part()
+
+    first_part(None)
+    dispatch_group.close()
+    assert request.outcomes == []
+
+    second_part(None)
+    assert request.outcomes == [None]
+
+
+def test_dispatch_group_settles_once_on_first_failure() -> None:
+    request = _Request()
+    dispatch_group = DispatchGroup(request)
+    first_part, second_part = dispatch_group.add_part(), dispatch_group.add_part()
+    exception = ConnectionError("Broker unreachable")
+
+    first_part(exception)
+    assert request.outcomes == [exception]
+
+    second_part(None)
+    dispatch_group.close()
+    assert request.outcomes == [exception]
@@ -0,0 +1,167 @@
+from typing import Any, Dict, List
+
+import fakeredis
+import pytest
+
+import microservice.aggregation.result_aggregator as result_aggregator_module
+from microservice.aggregation.result_aggregator import (
+    AggregatedResults,
+    AggregationStore,
+    InMemoryAggregationStore,
+    RedisAggregationStore,
+    ResultAggregator,
+    create_aggregation_store,
+)
+
+
+def make_results(*indices: str) -> List[Dict[str, Any]]:
+    return [{"index": index, "labels": ["bug"]} for index in indices]
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request: pytest.FixtureRequest) -> AggregationStore:
+    if request.param == "memory":
+        return InMemoryAggregationStore()
+
+    request.getfixturevalue("fake_redis")
+    return RedisAggregationStore("redis://localhost")
+
+
+def test_add_completes_request_once_all_results_arrived(
+    store: AggregationStore,
+) -> None:
+    assert store.expect("request", 3, deadline=100.0)
+
+    assert store.add("request", make_results("1", "2")) is None
+    aggregated_results = store.add("request", make_results("3"))
+
+    assert aggregated_results == AggregatedResults(
+        "request", make_results("1", "2", "3"), complete=True
+    )
+    assert store.pop_expired(now=200.0) == []
+
+
+def test_add_passes_through_results_of_unknown_request(
+    store: AggregationStore,
+) -> None:
+    assert store.add("unknown", make_results("1")) == AggregatedResults(
+        "unknown", make_results("1"), complete=False
+    )
+
+
+def test_pop_expired_flushes_results_received_so_far(
+    store: AggregationStore,
+) -> None:
+    store.expect("expired", 3, deadline=10.0)
+    store.expect("pending", 1, deadline=50.0)
+    store.add("expired", make_results("1"))
+
+    assert store.pop_expired(now=20.0) == [
+        AggregatedResults("expired", make_results("1"), complete=False)
+    ]
+    assert store.pop_expired(now=20.0) == []
+    # Results arriving after the flush are passed through right away.
+    assert store.add("expired", make_results("2")) == AggregatedResults(
+        "expired", make_results("2"), complete=False
+    )
+    assert store.add("pending", make_results("3")) == AggregatedResults(
+        "pending", make_results("3"), complete=True
+    )
+
+
+def test_expect_rejects_pending_request_id(store: AggregationStore) -> None:
+    assert store.expect("request", 2, deadline=100.0)
+    assert not store.expect("request", 5, deadline=200.0)
+
+    # The pending request keeps its issue count.
+    store.add("request", make_results("1"))
+    assert store.add("request", make_results("2")) == AggregatedResults(
+        "request", make_results("1", "2"), complete=True
+    )
+    # Once the request has completed, its correlation ID can be reused.
+    assert store.expect("request", 1, deadline=100.0)
+
+
+def test_redis_store_removes_keys_of_completed_requests(
+    fake_redis: fakeredis.FakeRedis,
+) -> None:
+    store = RedisAggregationStore("redis://localhost")
+    store.expect("request", 1, deadline=100.0)
+    assert fake_redis.zscore(RedisAggregationStore._DEADLINES_KEY, "request") == 100.0
+
+    store.add("request", make_results("1"))
+
+    assert fake_redis.keys("result_aggregation:*") == []
+
+
+def test_redis_store_publishes_request_completed_and_expired_once(
+    fake_redis: fakeredis.FakeRedis,
+) -> None:
+    gateway_store = RedisAggregationStore("redis://localhost")
+    worker_store = RedisAggregationStore("redis://localhost")
+    gateway_store.expect("request", 1, deadline=10.0)
+
+    # The gateway flushes the request before the worker adds the last result,
+    # so only the flush owns the request.
+    assert gateway_store.pop_expired(now=20.0) == [
+        AggregatedResults("request", [], complete=False)
+    ]
+    assert worker_store.add("request", make_results("1")) == AggregatedResults(
+        "request", make_results("1"), complete=False
+    )
+    assert gateway_store.pop_expired(now=20.0) == []
+
+
+def test_result_aggregator_publishes_complete_and_expired_requests() -> None:
+    published_results: List[AggregatedResults] = []
+    result_aggregator = ResultAggregator(
+        InMemoryAggregationStore(), publish=published_results.append, flush_timeout_s=0
+    )
+
+    result_aggregator.register_request("complete", 2)
+    result_aggregator.add_results("complete", make_results("1"))
+    assert published_results == []
+    result_aggregator.add_results("complete", make_results("2"))
+    assert published_results == [
+        AggregatedResults("complete", make_results("1", "2"), complete=True)
+    ]
+
+    result_aggregator.register_request("expired", 2)
+    result_aggregator.add_results("expired", make_results("3"))
+    assert result_aggregator.flush_expired() == 1
+    assert published_results[-1] == AggregatedResults(
+        "expired", make_results("3"), complete=False
+    )
+
+
+def test_result_aggregator_rejects_duplicate_pending_request() -> None:
+    result_aggregator = ResultAggregator(
+        InMemoryAggregationStore(), publish=lambda aggregated_results: None
+    )
+    result_aggregator.register_request("request", 1)
+
+    with pytest.raises(ValueError):
+        result_aggregator.register_request("request", 1)
+
+
+def test_result_aggregator_completes_request_without_issues_on_registration() -> None:
+    published_results: List[AggregatedResults] = []
+    store = InMemoryAggregationStore()
+    result_aggregator = ResultAggregator(store, publish=published_results.append)
+
+    result_aggregator.register_request("empty", 0)
+
+    assert published_results == [AggregatedResults("empty", [], complete=True)]
+    assert store.pop_expired(now=float("inf")) == []
+
+
+def test_create_aggregation_store_requires_eager_tasks_for_memory(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(result_aggregator_module, "RESULT_AGGREGATION", "memory")
+
+    assert isinstance(
+        create_aggregation_store(tasks_run_eagerly=True), InMemoryAggregationStore
+    )
+    with pytest.raises(ValueError):
+        create_aggregation_store(tasks_run_eagerly=False)
@@ -0,0 +1,149 @@
+from typing import Any, Dict, List, Optional
+
+import pytest
+import ujson
+from pika import BasicProperties
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import microservice.caching.result_cache as result_cache_module
+import microservice.classifier_celery.helper_functions as helper_functions
+from microservice.caching.result_cache import (
+    InMemoryResultCacheStore,
+    ResultCache,
+    create_result_cache,
+    get_body_hash,
+)
+from microservice.main import ICMPikaClient
+from microservice.models.models import IndexedIssue, VectorisedIssue
+
+ISSUE_BODY: str = "The application crashes when the API is called"
+PREDICTED_LABELS: List[str] = ["bug", "['api', 'bug']"]
+
+
+class _ResultPublisher:
+    def __init__(self) -> None:
+        self.results: List[Dict[str, Any]] = []
+
+    def publish(
+        self, results: List[Dict[str, Any]], properties: Optional[Any] = None
+    ) -> None:
+        self.results.extend(results)
+
+
+class _Channel:
+    def __init__(self) -> None:
+        self.results: List[Dict[str, Any]] = []
+
+    def basic_publish(self, body: bytes, **kwargs: Any) -> None:
+        self.results.extend(ujson.loads(body))
+
+
+@pytest.fixture
+def result_cache() -> ResultCache:
+    return ResultCache(InMemoryResultCacheStore(), model_version="version")
+
+
+@pytest.fixture
+def gateway(result_cache: ResultCache) -> ICMPikaClient:
+    gateway = ICMPikaClient.__new__(ICMPikaClient)
+    gateway.result_cache = result_cache
+    gateway.result_aggregator = None
+    gateway.channel = _Channel()  # type: ignore
+
+    return gateway
+
+
+def classify_in_workers(
+    indexed_issues: List[IndexedIssue], result_cache: ResultCache
+) -> List[Dict[str, Any]]:
+    """Vectorise the issues, attach the labels of the tree and send the results."""
+    vectoriser = TfidfVectorizer().fit([ISSUE_BODY, "Please add documentation"])
+    vectorised_issues = helper_functions.vectorise_issue_bodies(
+        vectoriser, indexed_issues
+    )
+    for vectorised_issue in vectorised_issues:
+        vectorised_issue.labels.extend(PREDICTED_LABELS)
+
+    result_publisher = _ResultPublisher()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(
+            helper_functions, "get_result_publisher", lambda: result_publisher
+        )
+        helper_functions.send_results_to_output(vectorised_issues, result_cache)
+
+    return result_publisher.results
+
+
+def make_request(index: int, labels: List[str]) -> List[IndexedIssue]:
+    return [
+        IndexedIssue(
+            index=index,
+            body=ISSUE_BODY,
+            labels=labels,
+            body_hash=get_body_hash(ISSUE_BODY),
+        )
+    ]
+
+
+def test_vectorised_issues_know_their_input_labels() -> None:
+    vectorised_issue = VectorisedIssue(
+        index=1, body=None, labels=["client", "bug"], input_label_count=1
+    )
+
+    assert vectorised_issue.predicted_labels() == ["bug"]
+
+
+def test_only_predicted_labels_are_cached(result_cache: ResultCache) -> None:
+    results = classify_in_workers(make_request(1, ["client"]), result_cache)
+
+    assert results == [{"index": 1, "labels": ["client"] + PREDICTED_LABELS}]
+    assert result_cache.get_many([get_body_hash(ISSUE_BODY)]) == {
+        get_body_hash(ISSUE_BODY): PREDICTED_LABELS
+    }
+
+
+def test_cached_answer_keeps_input_labels_of_each_request(
+    gateway: ICMPikaClient, result_cache: ResultCache
+) -> None:
+    first_results = classify_in_workers(
+        gateway._answer_cached_issues(
+            BasicProperties(), make_request(1, ["from-first-client"])
+        ),
+        result_cache,
+    )
+
+    remaining_issues = gateway._answer_cached_issues(
+        BasicProperties(), make_request(2, ["from-second-client", "triage"])
+    )
+
+    assert remaining_issues == []
+    assert first_results == [
+        {"index": 1, "labels": ["from-first-client"] + PREDICTED_LABELS}
+    ]
+    # The cached answer equals what classifying the request would have sent.
+    assert (
+        gateway.channel.results  # type: ignore
+        == classify_in_workers(
+            make_request(2, ["from-second-client", "triage"]), result_cache
+        )
+        == [{"index": 2, "labels": ["from-second-client", "triage"] + PREDICTED_LABELS}]
+    )
+
+
+def test_model_version_is_only_computed_for_enabled_cache(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    model_version_calls: List[str] = []
+
+    def get_model_version() -> str:
+        model_version_calls.append("version")
+        return "version"
+
+    monkeypatch.setattr(result_cache_module, "RESULT_CACHE", "none")
+    assert create_result_cache(get_model_version) is None
+    assert model_version_calls == []
+
+    monkeypatch.setattr(result_cache_module, "RESULT_CACHE", "memory")
+    result_cache = create_result_cache(get_model_version)
+    assert result_cache is not None and result_cache.model_version == "version"
+    assert model_version_calls == ["version"]
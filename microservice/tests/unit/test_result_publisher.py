@@ -0,0 +1,116 @@
+import threading
+from os import getpid
+from typing import Any, List, Optional
+
+import pytest
+import ujson
+from pika import BasicProperties
+
+import microservice.classifier_celery.helper_functions as helper_functions
+from microservice.classifier_celery.result_publisher import ResultPublisher
+from microservice.metrics.registry import REGISTRY
+
+
+class _RecordingResultPublisher(ResultPublisher):
+    """Result publisher recording its messages instead of sending them."""
+
+    def __init__(self, coalesce_max_bytes: int = 0) -> None:
+        super().__init__(
+            host="localhost",
+            exchange_name="exchange",
+            exchange_type="direct",
+            routing_key="results",
+            coalesce_max_bytes=coalesce_max_bytes,
+        )
+        self.messages: List[Any] = []
+
+    def _publish_message(
+        self, message_body: bytes, properties: Optional[BasicProperties] = None
+    ) -> None:
+        self.messages.append(ujson.loads(message_body))
+        self.statistics.record_publish(len(message_body), 0.0)
+
+
+def make_results(*indices: int) -> List[Any]:
+    return [{"index": index, "labels": ["bug"]} for index in indices]
+
+
+def get_metric_value(name: str) -> float:
+    for line in REGISTRY.render().splitlines():
+        if line.startswith(name + " "):
+            return float(line.split(" ")[1])
+
+    return 0.0
+
+
+def test_small_batches_are_coalesced_until_flushed() -> None:
+    result_publisher = _RecordingResultPublisher(coalesce_max_bytes=1000)
+    thread_count: int = threading.active_count()
+
+    result_publisher.publish(make_results(1))
+    result_publisher.publish(make_results(2, 3))
+
+    assert result_publisher.messages == []
+    # Buffered results are never flushed from another thread.
+    assert threading.active_count() == thread_count
+
+    result_publisher.flush()
+
+    assert result_publisher.messages == [make_results(1, 2, 3)]
+    assert result_publisher.statistics.coalesced_batches == 2
+
+
+def test_full_buffer_and_results_with_properties_are_sent_right_away() -> None:
+    result_publisher = _RecordingResultPublisher(
+        coalesce_max_bytes=len(ujson.dumps(make_results(1))) * 2
+    )
+
+    result_publisher.publish(make_results(1))
+    result_publisher.publish(
+        make_results(2), properties=BasicProperties(correlation_id="request")
+    )
+    result_publisher.publish(make_results(3))
+    result_publisher.publish(make_results(4))
+
+    # Buffered results are sent before those with properties, to keep the order.
+    assert result_publisher.messages == [
+        make_results(1),
+        make_results(2),
+        make_results(3, 4),
+    ]
+
+
+def test_coalesced_results_are_flushed_at_end_of_task(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    result_publisher = _RecordingResultPublisher(coalesce_max_bytes=1000)
+    monkeypatch.setattr(helper_functions, "_result_publisher", result_publisher)
+    monkeypatch.setattr(helper_functions, "_result_publisher_pid", getpid())
+    result_publisher.publish(make_results(1))
+
+    helper_functions.task_postrun.send(sender=None, task_id="task", task=None)
+
+    assert result_publisher.messages == [make_results(1)]
+
+
+def test_counters_are_exposed_as_metrics() -> None:
+    published_messages: float = get_metric_value("icm_result_publisher_messages_total")
+    reconnects: float = get_metric_value("icm_result_publisher_reconnects_total")
+    failed_publishes: float = get_metric_value(
+        "icm_result_publisher_failed_publishes_total"
+    )
+    result_publisher = _RecordingResultPublisher()
+
+    result_publisher.publish(make_results(1))
+    result_publisher.statistics.record_reconnect()
+    result_publisher.statistics.record_failed_publish()
+
+    assert (
+        get_metric_value("icm_result_publisher_messages_total")
+        == published_messages + 1
+    )
+    assert get_metric_value("icm_result_publisher_reconnects_total") == reconnects + 1
+    assert (
+        get_metric_value("icm_result_publisher_failed_publishes_total")
+        == failed_publishes + 1
+    )
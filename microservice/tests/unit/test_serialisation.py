@@ -0,0 +1,197 @@
+from typing import Any, List
+
+import numpy
+import pytest
+from kombu.serialization import dumps as kombu_dumps
+from kombu.serialization import loads as kombu_loads
+from scipy import sparse
+
+from microservice.classifier_celery.serialisation import (
+    ISSUE_BATCH_SERIALISER_NAME,
+    dumps,
+    loads,
+    register_issue_batch_serialiser,
+)
+from microservice.models.models import IndexedIssue, VectorisedIssue
+
+
+def make_vectorised_issues(dense: bool = False) -> List[VectorisedIssue]:
+    # An issue without any known n-gram has an empty row.
+    feature_vectors = sparse.csr_matrix(
+        sparse.diags([1.0, 1.0, 0.0, 1.0])
+        @ sparse.random(4, 50, density=0.2, dtype=numpy.float64, random_state=2020)
+    )
+    feature_vectors.eliminate_zeros()
+
+    return [
+        VectorisedIssue(
+            index=str(row_index),
+            body=(
+                feature_vectors[row_index].toarray()
+                if dense
+                else feature_vectors[row_index]
+            ),
+            labels=["bug"] if row_index % 2 else [],
+            request_id="request" if row_index < 2 else None,
+            body_hash="hash" + str(row_index),
+            input_label_count=row_index % 2,
+        )
+        for row_index in range(feature_vectors.shape[0])
+    ]
+
+
+def make_indexed_issues() -> List[IndexedIssue]:
+    return [
+        IndexedIssue(index="1", body="The app crashes"),
+        IndexedIssue(
+            index="2",
+            body="Please add docs ☃",
+            labels=["enhancement"],
+            request_id="request",
+            body_hash="hash",
+        ),
+    ]
+
+
+def assert_same_vectorised_issues(
+    decoded_issues: List[VectorisedIssue], issues: List[VectorisedIssue]
+) -> None:
+    assert len(decoded_issues) == len(issues)
+    for decoded_issue, issue in zip(decoded_issues, issues):
+        assert isinstance(decoded_issue, VectorisedIssue)
+        assert decoded_issue.index == issue.index
+        assert decoded_issue.labels == issue.labels
+        assert decoded_issue.request_id == issue.request_id
+        assert decoded_issue.body_hash == issue.body_hash
+        assert decoded_issue.input_label_count == issue.input_label_count
+        assert decoded_issue.body.shape == issue.body.shape
+        assert sparse.issparse(decoded_issue.body) == sparse.issparse(issue.body)
+        if sparse.issparse(issue.body):
+            assert (decoded_issue.body != issue.body).nnz == 0
+        else:
+            numpy.testing.assert_array_equal(decoded_issue.body, issue.body)
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_vectorised_issues_round_trip(dense: bool) -> None:
+    issues = make_vectorised_issues(dense)
+
+    decoded_message = loads(dumps([[issues], {"node_index": 3}, None]))
+
+    assert decoded_message[1:] == [{"node_index": 3}, None]
+    assert_same_vectorised_issues(decoded_message[0][0], issues)
+
+
+def test_csr_feature_vectors_are_views_of_the_message() -> None:
+    issues = make_vectorised_issues()
+    message = dumps([issues])
+
+    decoded_issues = loads(message)[0]
+
+    row = decoded_issues[0].body
+    assert row.format == "csr"
+    assert numpy.shares_memory(row.data, numpy.frombuffer(message, dtype=numpy.uint8))
+    assert not row.data.flags.writeable
+
+
+def test_indexed_issues_round_trip() -> None:
+    issues = make_indexed_issues()
+
+    decoded_issues = loads(dumps([issues]))[0]
+
+    assert [type(issue) for issue in decoded_issues] == [IndexedIssue] * 2
+    assert [
+        (issue.index, issue.body, issue.labels, issue.request_id, issue.body_hash)
+        for issue in decoded_issues
+    ] == [
+        (issue.index, issue.body, issue.labels, issue.request_id, issue.body_hash)
+        for issue in issues
+    ]
+
+
+@pytest.mark.parametrize(
+    "message, decoded_message",
+    [
+        ([], []),
+        ([[], {}, None], [[], {}, None]),
+        (((1, "two"), {"key": (3.5, True)}), [[1, "two"], {"key": [3.5, True]}]),
+    ],
+)
+def test_plain_values_round_trip_with_tuples_as_lists(
+    message: Any, decoded_message: Any
+) -> None:
+    assert loads(dumps(message)) == decoded_message
+
+
+def test_round_trip_through_kombu() -> None:
+    register_issue_batch_serialiser()
+    issues = make_vectorised_issues()
+
+    content_type, content_encoding, body = kombu_dumps(
+        ((issues,), {}, None), serializer=ISSUE_BATCH_SERIALISER_NAME
+    )
+    decoded_message = kombu_loads(body, content_type, content_encoding)
+
+    assert_same_vectorised_issues(decoded_message[0][0], issues)
+
+
+@pytest.mark.parametrize("dense", [False, True])
+def test_truncated_messages_are_rejected(dense: bool) -> None:
+    message = dumps([make_vectorised_issues(dense)])
+
+    for length in range(len(message)):
+        with pytest.raises(ValueError):
+            loads(message[:length])
+
+
+def replace_header(message: bytes, old: bytes, new: bytes) -> bytes:
+    # Replacements of the same length keep the offsets of all buffers valid.
+    assert len(old) == len(new) and message.count(old) == 1
+    return message.replace(old, new)
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        # Feature vectors of a type which cannot be created from a buffer.
+        (b'"dtype":"<f8"', b'"dtype":"|O8"'),
+        # Fewer columns than the indices require.
+        (b'"shape":[4,50]', b'"shape":[4, 5]'),
+        # Fewer rows than the index pointers describe.
+        (b'"shape":[4,50]', b'"shape":[3,50]'),
+        # Fewer issues than rows of the feature vectors.
+        (b'[[],["bug"],[],["bug"]]', b'[[],["bug"],[" ","bg"]]'),
+        # Missing body hashes.
+        (b'"body_hash"', b'"body_hazh"'),
+        # Not JSON.
+        (b'"labels"', b'"labels '),
+    ],
+)
+def test_malformed_messages_are_rejected(old: bytes, new: bytes) -> None:
+    message = replace_header(dumps([make_vectorised_issues()]), old, new)
+
+    with pytest.raises(ValueError):
+        loads(message)
+
+
+def test_out_of_range_indices_are_rejected() -> None:
+    issues = make_vectorised_issues()
+    message = bytearray(dumps([issues]))
+    indices = issues[0].body.indices
+    # Point the first column index of the first row beyond the matrix.
+    offset = bytes(message).index(indices.tobytes())
+    message[offset : offset + indices.itemsize] = numpy.array(
+        [1000], dtype=indices.dtype
+    ).tobytes()
+
+    with pytest.raises(ValueError):
+        loads(bytes(message))
+
+
+def test_malformed_indexed_issues_are_rejected() -> None:
+    message = replace_header(
+        dumps([make_indexed_issues()]), b",null,null]", b",null]     "
+    )
+
+    with pytest.raises(ValueError):
+        loads(message)
@@ -0,0 +1,188 @@
+import gc
+import logging
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+import pytest
+from scipy import sparse
+
+import microservice.classifier_celery.task_classes as task_classes
+
+# Registers the tasks, which only workers import on their own (see imports in
+# celery_config.py).
+import microservice.classifier_celery.tasks  # noqa: F401
+from microservice.classifier_celery.celery import app as celery_app
+from microservice.classifier_celery.task_classes import (
+    ClassifyTask,
+    VectoriseClassifyTask,
+    VectoriseTask,
+    get_preloaded_task_classes,
+    preload_models,
+)
+
+
+def make_worker(*queue_names: str) -> Any:
+    """Return a stand-in for a worker consuming from the given queues."""
+    return SimpleNamespace(
+        app=SimpleNamespace(
+            amqp=SimpleNamespace(
+                queues=SimpleNamespace(
+                    consume_from={queue_name: None for queue_name in queue_names}
+                )
+            ),
+            tasks=celery_app.tasks,
+            conf=celery_app.conf,
+        )
+    )
+
+
+@pytest.fixture
+def loaded_models(monkeypatch: pytest.MonkeyPatch) -> Iterator[Dict[str, List[Any]]]:
+    """Record the models loaded and the pools started instead of doing so."""
+    loaded_models: Dict[str, List[Any]] = {"models": [], "pools": []}
+    monkeypatch.setattr(task_classes, "MODEL_WARM_UP", False)
+    monkeypatch.setattr(
+        ClassifyTask,
+        "load_classify_tree",
+        staticmethod(lambda: loaded_models["models"].append("classify_tree")),
+    )
+    monkeypatch.setattr(
+        VectoriseTask,
+        "load_vectoriser",
+        staticmethod(lambda: loaded_models["models"].append("vectoriser")),
+    )
+    monkeypatch.setattr(
+        task_classes, "start_vectorisation_pool", loaded_models["pools"].append
+    )
+    yield loaded_models
+    gc.unfreeze()
+
+
+def test_task_classes_do_not_load_models_on_instantiation() -> None:
+    assert ClassifyTask._classify_tree is None
+    assert VectoriseTask._vectoriser is None
+
+    celery_app.tasks["microservice.classifier_celery.tasks.classify_issues"]
+
+    assert ClassifyTask._classify_tree is None
+    assert VectoriseTask._vectoriser is None
+
+
+@pytest.mark.parametrize(
+    "queue_names, expected_task_classes",
+    [
+        (["classify_queue"], [ClassifyTask]),
+        (["vectorise_queue"], [VectoriseTask]),
+        (["pipeline_queue"], [VectoriseClassifyTask]),
+        (["celery"], [ClassifyTask, VectoriseTask]),
+    ],
+)
+def test_workers_preload_task_classes_of_their_queues(
+    queue_names: List[str], expected_task_classes: List[type]
+) -> None:
+    assert get_preloaded_task_classes(make_worker(*queue_names)) == (
+        expected_task_classes
+    )
+
+
+@pytest.mark.parametrize(
+    "task_classes_of_worker, expected_models",
+    [
+        ([ClassifyTask], ["classify_tree"]),
+        ([VectoriseTask], ["vectoriser"]),
+        ([VectoriseClassifyTask], ["classify_tree", "vectoriser"]),
+    ],
+)
+def test_preload_models_loads_models_of_task_classes_only(
+    loaded_models: Dict[str, List[Any]],
+    task_classes_of_worker: List[type],
+    expected_models: List[str],
+) -> None:
+    preload_models(task_classes_of_worker)
+
+    assert loaded_models["models"] == expected_models
+    assert len(loaded_models["pools"]) == ("vectoriser" in expected_models)
+
+
+class _WarmUpRecorder:
+    """Stand-in for the classifier tree and the vectoriser during the warm-up."""
+
+    def __init__(self, feature_count: Optional[int] = 7) -> None:
+        self.feature_count: Optional[int] = feature_count
+        self.transformed_bodies: List[List[str]] = []
+        self.warm_up_feature_vectors: List[Any] = []
+
+    def transform(self, issue_bodies: List[str]) -> sparse.csr_matrix:
+        self.transformed_bodies.append(issue_bodies)
+        return sparse.csr_matrix([[0.0, 1.0, 0.0]])
+
+    def get_feature_count(self) -> Optional[int]:
+        return self.feature_count
+
+    def warm_up(self, feature_vector: Any) -> List[float]:
+        self.warm_up_feature_vectors.append(feature_vector)
+        return [0.0, 0.0]
+
+
+@pytest.fixture
+def warm_up_models(
+    monkeypatch: pytest.MonkeyPatch, loaded_models: Dict[str, List[Any]]
+) -> Dict[str, _WarmUpRecorder]:
+    models = {"classify_tree": _WarmUpRecorder(), "vectoriser": _WarmUpRecorder()}
+    monkeypatch.setattr(task_classes, "MODEL_WARM_UP", True)
+    monkeypatch.setattr(ClassifyTask, "_classify_tree", models["classify_tree"])
+    monkeypatch.setattr(VectoriseTask, "_vectoriser", models["vectoriser"])
+    return models
+
+
+@pytest.mark.parametrize(
+    "task_classes_of_worker, worker_role",
+    [
+        ([ClassifyTask], "classifier"),
+        ([VectoriseTask], "vectoriser"),
+        ([VectoriseClassifyTask], "pipeline"),
+    ],
+)
+def test_preload_models_warms_up_loaded_models_only(
+    warm_up_models: Dict[str, _WarmUpRecorder],
+    caplog: pytest.LogCaptureFixture,
+    task_classes_of_worker: List[type],
+    worker_role: str,
+) -> None:
+    classify_tree, vectoriser = (
+        warm_up_models["classify_tree"],
+        warm_up_models["vectoriser"],
+    )
+
+    with caplog.at_level(logging.INFO):
+        preload_models(task_classes_of_worker)
+
+    assert len(vectoriser.transformed_bodies) == (worker_role != "classifier")
+    if worker_role == "vectoriser":
+        assert classify_tree.warm_up_feature_vectors == []
+    elif worker_role == "classifier":
+        # Without the vectoriser, the tree is warmed up with an empty vector.
+        (feature_vector,) = classify_tree.warm_up_feature_vectors
+        assert feature_vector.shape == (1, 7) and feature_vector.nnz == 0
+    else:
+        (feature_vector,) = classify_tree.warm_up_feature_vectors
+        assert feature_vector.shape == (1, 3) and feature_vector.nnz == 1
+
+    (boot_log,) = [
+        record.getMessage()
+        for record in caplog.records
+        if record.getMessage().startswith("Models preloaded")
+    ]
+    assert boot_log.startswith("Models preloaded for the " + worker_role + " worker:")
+    assert ("node 2 warm-up" in boot_log) == (worker_role != "vectoriser")
+    assert ("vectoriser warm-up" in boot_log) == (worker_role != "classifier")
+
+
+def test_classifier_tree_warm_up_is_skipped_without_feature_count(
+    warm_up_models: Dict[str, _WarmUpRecorder],
+) -> None:
+    warm_up_models["classify_tree"].feature_count = None
+
+    preload_models([ClassifyTask])
+
+    assert warm_up_models["classify_tree"].warm_up_feature_vectors == []
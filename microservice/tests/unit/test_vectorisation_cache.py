@@ -0,0 +1,150 @@
+from typing import Dict, List
+
+import fakeredis
+import numpy
+import pytest
+from scipy import sparse
+
+from microservice.caching.vectorisation_cache import (
+    _ENTRY_OVERHEAD_BYTES,
+    VectorisationCache,
+)
+
+COLUMN_COUNT: int = 50
+
+
+def make_feature_vector(*columns: int) -> sparse.csr_matrix:
+    """Return a 1xCOLUMN_COUNT feature vector with the given non-zero columns."""
+    return sparse.csr_matrix(
+        (
+            numpy.arange(1, len(columns) + 1, dtype=numpy.float64) / 10,
+            numpy.array(columns, dtype=numpy.int32),
+            numpy.array([0, len(columns)], dtype=numpy.int32),
+        ),
+        shape=(1, COLUMN_COUNT),
+    )
+
+
+def get_entry_size(nnz: int) -> int:
+    """Return the size of a cached feature vector with nnz non-zero values."""
+    return 8 * nnz + 4 * nnz + 2 * 4 + _ENTRY_OVERHEAD_BYTES
+
+
+def assert_same_feature_vector(
+    feature_vector: sparse.csr_matrix, expected_feature_vector: sparse.csr_matrix
+) -> None:
+    assert feature_vector.shape == expected_feature_vector.shape
+    numpy.testing.assert_array_equal(
+        feature_vector.toarray(), expected_feature_vector.toarray()
+    )
+
+
+def put_bodies(cache: VectorisationCache, bodies: Dict[str, List[int]]) -> None:
+    cache.put_many(
+        {
+            cache.get_key(body): make_feature_vector(*columns)
+            for body, columns in bodies.items()
+        }
+    )
+
+
+def test_in_process_cache_evicts_least_recently_used_entries() -> None:
+    cache = VectorisationCache("v1", max_bytes=3 * get_entry_size(2), redis_url="")
+    put_bodies(cache, {"first": [1, 2], "second": [3, 4], "third": [5, 6]})
+    assert cache.statistics.size_bytes == 3 * get_entry_size(2)
+
+    # Looking up the first body makes the second one the least recently used.
+    assert list(cache.get_many([cache.get_key("first")])) == [cache.get_key("first")]
+    put_bodies(cache, {"fourth": [7, 8]})
+
+    found_feature_vectors = cache.get_many(
+        [cache.get_key(body) for body in ("first", "second", "third", "fourth")]
+    )
+    assert set(found_feature_vectors) == {
+        cache.get_key(body) for body in ("first", "third", "fourth")
+    }
+    assert cache.statistics.evictions == 1
+    assert cache.statistics.entries == 3
+    assert cache.statistics.size_bytes == 3 * get_entry_size(2)
+    assert (cache.statistics.hits, cache.statistics.misses) == (4, 1)
+
+
+def test_in_process_cache_stays_within_byte_limit() -> None:
+    cache = VectorisationCache("v1", max_bytes=get_entry_size(10), redis_url="")
+
+    put_bodies(cache, {"too large": list(range(11))})
+    assert cache.statistics.entries == 0
+
+    put_bodies(cache, {"small": [1], "large": list(range(10))})
+    assert cache.get_many([cache.get_key("small")]) == {}
+    assert cache.statistics.entries == 1
+    assert cache.statistics.size_bytes == get_entry_size(10)
+
+
+def test_cached_feature_vectors_own_their_buffers() -> None:
+    cache = VectorisationCache("v1", redis_url="")
+    feature_vectors = sparse.vstack(
+        [make_feature_vector(1, 2), make_feature_vector(3)], format="csr"
+    )
+
+    cache.put_many({cache.get_key("body"): feature_vectors[[1]]})
+    feature_vectors.data[:] = 0
+
+    assert_same_feature_vector(
+        cache.get_many([cache.get_key("body")])[cache.get_key("body")],
+        make_feature_vector(3),
+    )
+
+
+def test_keys_depend_on_vectoriser_version() -> None:
+    assert VectorisationCache("v1", redis_url="").get_key("body") != (
+        VectorisationCache("v2", redis_url="").get_key("body")
+    )
+
+
+@pytest.mark.parametrize(
+    "feature_vector",
+    [
+        make_feature_vector(),
+        make_feature_vector(0),
+        make_feature_vector(3, 17, COLUMN_COUNT - 1),
+        make_feature_vector(3, 17).astype(numpy.float32),
+    ],
+)
+def test_encode_and_decode_round_trip(feature_vector: sparse.csr_matrix) -> None:
+    decoded_feature_vector = VectorisationCache._decode(
+        VectorisationCache._encode(feature_vector)
+    )
+
+    assert decoded_feature_vector.format == "csr"
+    assert_same_feature_vector(decoded_feature_vector, feature_vector)
+
+
+def test_redis_tier_serves_misses_of_other_processes(
+    fake_redis: fakeredis.FakeRedis,
+) -> None:
+    storing_cache = VectorisationCache("v1", redis_url="redis://localhost")
+    looking_up_cache = VectorisationCache("v1", redis_url="redis://localhost")
+    put_bodies(storing_cache, {"body": [2, 4]})
+
+    key: bytes = looking_up_cache.get_key("body")
+    assert_same_feature_vector(
+        looking_up_cache.get_many([key])[key], make_feature_vector(2, 4)
+    )
+    assert looking_up_cache.statistics.redis_hits == 1
+
+    # The feature vector is now served by the in-process cache.
+    looking_up_cache.get_many([key])
+    assert looking_up_cache.statistics.redis_hits == 1
+    assert looking_up_cache.statistics.hits == 1
+
+
+def test_redis_errors_fall_back_to_misses(fake_redis: fakeredis.FakeRedis) -> None:
+    cache = VectorisationCache("v1", max_bytes=0, redis_url="redis://localhost")
+    fake_redis.connection_pool.connection_kwargs["server"].connected = False
+
+    put_bodies(cache, {"body": [1]})
+    assert cache.get_many([cache.get_key("body")]) == {}
+
+    assert cache.statistics.redis_errors == 2
+    assert cache.statistics.misses == 1
@@ -0,0 +1,5 @@
+"""Operational tools for the Issue Classifier Microservice.
+
+The tools are run from the folder containing docker-compose.yaml, e.g. via
+python -m tools.memory_report, either on the host or within a container.
+"""
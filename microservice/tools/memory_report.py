@@ -0,0 +1,174 @@
+"""Report the unique and shared memory of running Celery worker processes.
+
+For every worker process, the report shows its resident set size (RSS), how
+much of it is shared with other processes, how much is unique to the process
+and its proportional set size (PSS), i.e. its unique memory plus its share of
+the shared memory. The sum of the PSS of all processes is the memory actually
+used by the workers, and the unique memory of a child process is roughly what
+each additional child of a prefork worker costs. The values are read from
+/proc/<pid>/smaps_rollup (or /proc/<pid>/smaps on older kernels), so the report
+has to run on the same host (or in the same container) as the workers.
+
+Usage:
+    python -m tools.memory_report [--pattern celery] [--pid PID ...]
+"""
+import argparse
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+_PROC: Path = Path("/proc")
+
+
+class ProcessMemory(NamedTuple):
+    """The memory usage of a single process in kB.
+
+    Attributes:
+        pid (int): The process ID.
+        parent_pid (int): The ID of the parent process.
+        rss (int): The resident set size.
+        pss (int): The proportional set size.
+        shared (int): The resident memory shared with other processes.
+        unique (int): The resident memory used by this process only.
+    """
+
+    pid: int
+    parent_pid: int
+    rss: int
+    pss: int
+    shared: int
+    unique: int
+
+
+def _read_smaps_totals(pid: int) -> Dict[str, int]:
+    """Sum up the fields of the memory mappings of a process.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        Dict[str, int]: The totals in kB by field name, e.g. "Rss".
+    """
+    smaps_file: Path = _PROC / str(pid) / "smaps_rollup"
+    if not smaps_file.exists():
+        smaps_file = _PROC / str(pid) / "smaps"
+
+    totals: Dict[str, int] = {}
+    for line in smaps_file.read_text().splitlines():
+        fields: List[str] = line.split()
+        if len(fields) == 3 and fields[0].endswith(":") and fields[2] == "kB":
+            name: str = fields[0][:-1]
+            totals[name] = totals.get(name, 0) + int(fields[1])
+
+    return totals
+
+
+def read_process_memory(pid: int) -> Optional[ProcessMemory]:
+    """Read the memory usage of a process.
+
+    Args:
+        pid (int): The process ID.
+
+    Returns:
+        Optional[ProcessMemory]: The memory usage, or None if the process has
+        exited or cannot be inspected.
+    """
+    try:
+        totals = _read_smaps_totals(pid)
+        status: str = (_PROC / str(pid) / "stat").read_text()
+    except OSError:
+        return None
+
+    # The command name in parentheses may contain spaces, the parent PID is
+    # the second field after it.
+    parent_pid: int = int(status[status.rindex(")") + 2 :].split()[1])
+
+    return ProcessMemory(
+        pid=pid,
+        parent_pid=parent_pid,
+        rss=totals.get("Rss", 0),
+        pss=totals.get("Pss", 0),
+        shared=totals.get("Shared_Clean", 0) + totals.get("Shared_Dirty", 0),
+        unique=totals.get("Private_Clean", 0) + totals.get("Private_Dirty", 0),
+    )
+
+
+def find_processes(pattern: str) -> List[int]:
+    """Find all processes whose command line contains the given pattern.
+
+    Args:
+        pattern (str): The pattern, e.g. "celery" (without quotes).
+
+    Returns:
+        List[int]: The IDs of the matching processes.
+    """
+    pids: List[int] = []
+    for process_folder in _PROC.iterdir():
+        if not process_folder.name.isdigit():
+            continue
+        try:
+            command_line: str = (
+                (process_folder / "cmdline").read_bytes().replace(b"\0", b" ").decode()
+            )
+        except OSError:
+            continue
+        if pattern in command_line and "tools.memory_report" not in command_line:
+            pids.append(int(process_folder.name))
+
+    return sorted(pids)
+
+
+def print_report(processes: List[ProcessMemory]) -> None:
+    """Print the memory usage of the given processes along with totals.
+
+    Args:
+        processes (List[ProcessMemory]): The memory usage of the processes.
+    """
+    pids = {process.pid for process in processes}
+    print("     pid |   parent | role   |   rss MB |   pss MB | shared MB | unique MB")
+    for process in processes:
+        role: str = "child" if process.parent_pid in pids else "parent"
+        print(
+            "{:>8} | {:>8} | {:<6} | {:>8.1f} | {:>8.1f} | {:>9.1f} | {:>9.1f}".format(
+                process.pid,
+                process.parent_pid,
+                role,
+                process.rss / 1024,
+                process.pss / 1024,
+                process.shared / 1024,
+                process.unique / 1024,
+            )
+        )
+
+    children = [process for process in processes if process.parent_pid in pids]
+    print("Total PSS: {:.1f} MB".format(sum(p.pss for p in processes) / 1024))
+    print("Total RSS: {:.1f} MB".format(sum(p.rss for p in processes) / 1024))
+    if children:
+        print(
+            "Mean unique memory per child: {:.1f} MB".format(
+                sum(child.unique for child in children) / len(children) / 1024
+            )
+        )
+
+
+def main() -> None:
+    """Find the worker processes and print their memory report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pattern", default="celery")
+    parser.add_argument("--pid", type=int, nargs="+", default=None)
+    arguments = parser.parse_args()
+
+    pids: List[int] = arguments.pid or find_processes(arguments.pattern)
+    processes: List[ProcessMemory] = [
+        process
+        for process in (read_process_memory(pid) for pid in pids)
+        if process is not None
+    ]
+    if not processes:
+        print("No matching processes found.")
+        return
+
+    print_report(processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""Retrain the classifier tree against the hashing vectoriser.
+
+The classifiers under microservice/trained_classifiers were trained against the
+feature vectors of the fitted TfidfVectorizer, whose columns do not match those
+of HashingTfidfVectoriser (see microservice/models/hashing_vectoriser.py).
+This tool fits a HashingTfidfVectoriser on a labelled corpus and retrains the
+ensemble of every node of the tree against its feature vectors. The results
+are written to the folder loaded with VECTORISER_MODE=hashing, i.e. the
+vectoriser as vectorizer.vz and each ensemble under the file name of its
+trained counterpart (see load_config.json), along with a copy of the voting
+classifier. The files are not compressed by default, so their numpy arrays,
+e.g. the IDF weights of the vectoriser, can be memory-mapped.
+
+The members and hyperparameters of each ensemble are taken from the trained
+ensemble if it can be loaded, which requires the scikit-learn version it was
+trained with. Otherwise, an ensemble of the same kinds of members with default
+hyperparameters is trained instead.
+
+The corpus consists of JSON files holding lists of issues with a text and a
+list of labels each, by default the issues bundled under issues/todo-add. The
+root node is trained on the issues labelled bug or enhancement, and every other
+node on all issues, with the issues carrying its label (e.g. api for api_bug)
+as class 0, i.e. those forwarded to the left child. A share of the corpus is
+held out (see trainingConstants in load_config.json), on which the accuracy of
+every node is printed.
+
+Usage:
+    python -m tools.train_hashing_models [--corpus-folder FOLDER]
+    [--output-folder FOLDER] [--n-features 262144] [--training-size N]
+"""
+import argparse
+import logging
+import random
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import ujson
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier, VotingClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.svm import SVC
+
+from microservice.config.classifier_config import Configuration
+from microservice.models.hashing_vectoriser import (
+    DEFAULT_FEATURE_COUNT,
+    HashingTfidfVectoriser,
+)
+
+PACKAGE_FOLDER: Path = Path(__file__).resolve().parent.parent
+CORPUS_FOLDER: Path = PACKAGE_FOLDER / "issues" / "todo-add"
+TRAINED_FOLDER: Path = PACKAGE_FOLDER / "microservice" / "trained_classifiers"
+HASHING_FOLDER: Path = PACKAGE_FOLDER / "microservice" / "trained_classifiers_hashing"
+VOTING_CLASSIFIER_FILE: str = "voting_classifier"
+VECTORISER_FILE: str = "vectorizer.vz"
+
+# Names of the labels of the classifier tree as used in the bundled corpus.
+CORPUS_LABEL_NAMES: Dict[str, str] = {"docu": "documentation"}
+
+LabelledIssue = Tuple[str, List[str]]
+
+
+def load_labelled_issues(corpus_folder: Path) -> List[LabelledIssue]:
+    """Load the bodies and labels of all issues of a corpus.
+
+    Files which cannot be parsed are skipped, since some of the bundled files
+    are not valid JSON.
+
+    Args:
+        corpus_folder (Path): The folder holding the JSON files of the corpus.
+
+    Returns:
+        List[LabelledIssue]: The issue bodies and their labels.
+    """
+    labelled_issues: List[LabelledIssue] = []
+    for issue_file in sorted(corpus_folder.glob("*.json")):
+        try:
+            entries = ujson.loads(issue_file.read_text(encoding="utf-8"))
+        except ValueError:
+            logging.warning("Skipping unparsable corpus file " + str(issue_file))
+            continue
+        labelled_issues.extend(
+            (entry["text"], [label for label in entry.get("labels") or [] if label])
+            for entry in entries
+            if isinstance(entry.get("text"), str)
+        )
+
+    return labelled_issues
+
+
+def split_labelled_issues(
+    labelled_issues: List[LabelledIssue],
+) -> Tuple[List[LabelledIssue], List[LabelledIssue]]:
+    """Shuffle the corpus and split it into training and test issues.
+
+    The share of training issues and the seed are those of trainingConstants
+    in load_config.json, so every run splits the corpus the same way.
+
+    Args:
+        labelled_issues (List[LabelledIssue]): The labelled corpus.
+
+    Returns:
+        Tuple[List[LabelledIssue], List[LabelledIssue]]: The training and the
+        test issues.
+    """
+    config = Configuration()
+    shuffled_issues = list(labelled_issues)
+    random.Random(config.get_value_from_config("trainingConstants randomSeed")).shuffle(
+        shuffled_issues
+    )
+    training_count: int = int(
+        len(shuffled_issues)
+        * config.get_value_from_config("trainingConstants trainingPercentage")
+    )
+
+    return shuffled_issues[:training_count], shuffled_issues[training_count:]
+
+
+def get_node_dataset(
+    labels: List[str], labelled_issues: List[LabelledIssue]
+) -> Tuple[List[str], List[int]]:
+    """Return the issue bodies and classes a tree node is trained on.
+
+    Args:
+        labels (List[str]): The labels of the node as in load_config.json,
+        e.g. ["bug", "enhancement"] for the root node or ["api_bug", "bug"].
+        labelled_issues (List[LabelledIssue]): The labelled corpus.
+
+    Returns:
+        Tuple[List[str], List[int]]: The issue bodies and their classes, where
+        0 means that the issue is forwarded to the left child.
+    """
+    if "_" not in labels[0]:
+        # The root node, which tells its two label classes apart.
+        root_issues: List[Tuple[str, int]] = [
+            (body, int(labels[0] not in issue_labels))
+            for body, issue_labels in labelled_issues
+            if labels[0] in issue_labels or labels[1] in issue_labels
+        ]
+        return [body for body, _ in root_issues], [cls for _, cls in root_issues]
+
+    label: str = labels[0].split("_")[0]
+    corpus_label: str = CORPUS_LABEL_NAMES.get(label, label)
+
+    return (
+        [body for body, _ in labelled_issues],
+        [int(corpus_label not in issue_labels) for _, issue_labels in labelled_issues],
+    )
+
+
+def create_default_ensemble() -> VotingClassifier:
+    """Create a hard-voting ensemble of the members of the trained ensembles.
+
+    Returns:
+        VotingClassifier: The unfitted ensemble with default hyperparameters.
+    """
+    return VotingClassifier(
+        [
+            ("naive_bayes", MultinomialNB()),
+            ("sgd", SGDClassifier(random_state=2020)),
+            ("svc", SVC(kernel="sigmoid")),
+            (
+                "random_forest",
+                RandomForestClassifier(n_estimators=200, random_state=2020),
+            ),
+            ("logistic_regression", LogisticRegression()),
+        ],
+        voting="hard",
+    )
+
+
+def create_ensemble(trained_classifier_file: Optional[Path]) -> Any:
+    """Create an unfitted copy of a trained ensemble.
+
+    Args:
+        trained_classifier_file (Optional[Path]): The file of the trained
+        ensemble, or None to use the default ensemble.
+
+    Returns:
+        Any: The unfitted ensemble, or the default one if the trained ensemble
+        cannot be loaded.
+    """
+    if trained_classifier_file is not None:
+        try:
+            return clone(joblib.load(trained_classifier_file))
+        except Exception as exception:
+            logging.warning(
+                "Trained classifier "
+                + trained_classifier_file.name
+                + " unavailable ("
+                + str(exception).splitlines()[0]
+                + "). Training the default ensemble instead."
+            )
+
+    return create_default_ensemble()
+
+
+def train_node_classifiers(
+    vectoriser: Any,
+    training_issues: List[LabelledIssue],
+    trained_folder: Optional[Path] = TRAINED_FOLDER,
+) -> Dict[str, Any]:
+    """Train the ensemble of every node of the tree against the given vectoriser.
+
+    Args:
+        vectoriser (Any): The fitted vectoriser.
+        training_issues (List[LabelledIssue]): The labelled training issues.
+        trained_folder (Optional[Path], optional): The folder of the trained
+        ensembles whose members are to be retrained, or None to train the
+        default ensemble for every node. Defaults to TRAINED_FOLDER.
+
+    Returns:
+        Dict[str, Any]: The fitted ensembles by the file name of their trained
+        counterparts.
+    """
+    classifiers: Dict[str, Any] = {}
+    for classifier_location in Configuration().get_value_from_config(
+        "classifier classifierLocations"
+    ):
+        issue_bodies, classes = get_node_dataset(
+            classifier_location["labels"], training_issues
+        )
+        classifiers[classifier_location["path"]] = create_ensemble(
+            trained_folder / classifier_location["path"]
+            if trained_folder is not None
+            else None
+        ).fit(vectoriser.transform(issue_bodies), classes)
+
+    return classifiers
+
+
+def get_node_accuracies(
+    vectoriser: Any, classifiers: Dict[str, Any], test_issues: List[LabelledIssue]
+) -> Dict[str, float]:
+    """Return the accuracy of the ensemble of every node on the test issues.
+
+    Args:
+        vectoriser (Any): The vectoriser the ensembles were trained against.
+        classifiers (Dict[str, Any]): The ensembles by file name (see
+        train_node_classifiers).
+        test_issues (List[LabelledIssue]): The labelled test issues.
+
+    Returns:
+        Dict[str, float]: The share of correctly classified test issues by
+        file name of the ensemble.
+    """
+    accuracies: Dict[str, float] = {}
+    for classifier_location in Configuration().get_value_from_config(
+        "classifier classifierLocations"
+    ):
+        issue_bodies, classes = get_node_dataset(
+            classifier_location["labels"], test_issues
+        )
+        accuracies[classifier_location["path"]] = float(
+            classifiers[classifier_location["path"]].score(
+                vectoriser.transform(issue_bodies), classes
+            )
+        )
+
+    return accuracies
+
+
+def main() -> None:
+    """Fit the hashing vectoriser, retrain all ensembles and store them."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus-folder", type=Path, default=CORPUS_FOLDER)
+    parser.add_argument("--trained-folder", type=Path, default=TRAINED_FOLDER)
+    parser.add_argument("--output-folder", type=Path, default=HASHING_FOLDER)
+    parser.add_argument("--n-features", type=int, default=DEFAULT_FEATURE_COUNT)
+    parser.add_argument(
+        "--training-size",
+        type=int,
+        default=None,
+        help="Defaults to all training issues of the corpus.",
+    )
+    parser.add_argument(
+        "--compress",
+        type=int,
+        default=0,
+        help="Defaults to 0, so the models can be memory-mapped (MODEL_MMAP_MODE).",
+    )
+    arguments = parser.parse_args()
+
+    training_issues, test_issues = split_labelled_issues(
+        load_labelled_issues(arguments.corpus_folder)
+    )
+    training_issues = training_issues[: arguments.training_size]
+    print(
+        "Training on {} issues, testing on {} issues".format(
+            len(training_issues), len(test_issues)
+        )
+    )
+    vectoriser = HashingTfidfVectoriser(n_features=arguments.n_features).fit(
+        body for body, _ in training_issues
+    )
+    classifiers = train_node_classifiers(
+        vectoriser, training_issues, arguments.trained_folder
+    )
+
+    arguments.output_folder.mkdir(parents=True, exist_ok=True)
+    joblib.dump(
+        vectoriser,
+        arguments.output_folder / VECTORISER_FILE,
+        compress=arguments.compress,
+    )
+    for file_name, classifier in classifiers.items():
+        joblib.dump(
+            classifier, arguments.output_folder / file_name, compress=arguments.compress
+        )
+    if (arguments.trained_folder / VOTING_CLASSIFIER_FILE).is_file():
+        shutil.copyfile(
+            arguments.trained_folder / VOTING_CLASSIFIER_FILE,
+            arguments.output_folder / VOTING_CLASSIFIER_FILE,
+        )
+
+    for file_name, accuracy in get_node_accuracies(
+        vectoriser, classifiers, test_issues
+    ).items():
+        print("{:<60} accuracy {:.3f}".format(file_name, accuracy))
+    print("Models written to " + str(arguments.output_folder))
+
+
+if __name__ == "__main__":
+    main()
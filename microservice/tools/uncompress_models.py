@@ -0,0 +1,51 @@
+"""Re-dump the trained models as uncompressed joblib files.
+
+The trained classifiers are stored as compressed joblib files, which have to be
+decompressed into the memory of every process loading them. joblib can only
+memory-map the numpy arrays of uncompressed files, so the models have to be
+re-dumped without compression before MODEL_MMAP_MODE can take effect. Loading
+the models requires the same scikit-learn version they were trained with.
+
+Usage:
+    python -m tools.uncompress_models [--folder FOLDER] [--output-folder FOLDER]
+"""
+import argparse
+from pathlib import Path
+
+import joblib
+
+MODEL_FOLDER: Path = (
+    Path(__file__).resolve().parent.parent / "microservice" / "trained_classifiers"
+)
+
+
+def main() -> None:
+    """Re-dump every model file of the given folder without compression."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", type=Path, default=MODEL_FOLDER)
+    parser.add_argument(
+        "--output-folder",
+        type=Path,
+        default=None,
+        help="Defaults to the input folder, i.e. the files are replaced.",
+    )
+    arguments = parser.parse_args()
+    output_folder: Path = arguments.output_folder or arguments.folder
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    for model_file in sorted(arguments.folder.iterdir()):
+        if not model_file.is_file():
+            continue
+        input_size: int = model_file.stat().st_size
+        model = joblib.load(model_file)
+        output_file: Path = output_folder / model_file.name
+        joblib.dump(model, output_file, compress=0)
+        print(
+            "{}: {:.1f} MB -> {:.1f} MB".format(
+                model_file.name, input_size / 1e6, output_file.stat().st_size / 1e6
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()